@@ -128,3 +128,52 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Roteamento (transporte.algorithms)
+
+# Memória máxima (MB) para as grades horárias mantidas em cache por processo
+RAIO_GRADE_CACHE_MB = 1024
+
+# Onde ficam as estruturas pré‑computadas (ex.: grafo de transferências a pé)
+RAIO_CACHE_DIR = BASE_DIR / "cache"
+
+# Tolerância (m) de simplificação dos polígonos de isócrona; 0 desliga
+RAIO_SIMPLIFICACAO_M = 5
+
+# Cache de resultados de isócrona (transporte.cache_raio). Local a cada
+# processo; para dividir entre processos, troque por RedisCache ou
+# DatabaseCache (``manage.py createcachetable``). A chave inclui a versão do
+# feed, então não é preciso limpar o cache ao importar.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "raio": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "raio-resultados",
+        "TIMEOUT": 6 * 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 2000, "CULL_FREQUENCY": 4},
+    },
+}
+
+# Lado (m) da célula em que a origem é encaixada para reaproveitar resultados
+RAIO_CACHE_CELULA_M = 100
+
+# Isócronas em lote (transporte.lote_raio): processos do comando raio_lote
+# (0 = núcleos) e limite de origens por requisição em /api/raio/lote/, que
+# roda nos processos de RAIO_POOL_TRABALHADORES
+RAIO_LOTE_TRABALHADORES = 0
+RAIO_LOTE_MAX_ORIGENS = 5000
+
+# /api/raio/async/ (transporte.pool_raio): processos com a grade carregada
+# (0 = núcleos) e quantas consultas além deles podem esperar antes do 503
+RAIO_POOL_TRABALHADORES = 0
+RAIO_POOL_FILA = 32
+# Quantas dessas vagas os lotes de /api/raio/lote/ podem ocupar juntos
+# (0 = metade dos processos); o resto fica para as consultas interativas
+RAIO_POOL_LOTE = 0
+
+# Malha de ruas para caminhada: os utilitários de transporte/utils gravam
+# aqui e compilar_malha/obter_malha leem daqui. Compilada uma vez em
+# RAIO_CACHE_DIR; sem o arquivo as caminhadas usam distância em linha reta.
+RAIO_GRAFO_CAMINHADA = BASE_DIR / "grafo_sp_caminhada.graphml"
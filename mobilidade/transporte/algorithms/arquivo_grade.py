@@ -0,0 +1,307 @@
+import hashlib
+import json
+import logging
+import os
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from transporte.algorithms.esfera import xyz
+from transporte.algorithms.grade_horaria import Frequencias, GradeHoraria, Paradas, diretorio_cache
+from transporte.algorithms.raptor import Padrao, PadraoFrequencia, Padroes
+from transporte.algorithms.transferencias import Transferencias
+
+"""
+arquivo_grade.py — Grade horária compilada num arquivo binário (memmap)
+--------------------------------------------------------------------------
+Formato (little‑endian):
+
+    "RGHF" | uint32 versão do formato | uint64 tamanho do cabeçalho
+    cabeçalho JSON (chave, assinatura das transferências, tabela de vetores)
+    [alinhamento de 64 bytes] vetores de largura fixa, um após o outro
+
+Cada vetor aparece no cabeçalho como {offset, dtype, shape}, com offset
+relativo ao início da área de dados. Textos (stop_id, nomes, trip_id,
+route_id) viram um blob UTF‑8 + vetor de offsets; a rota de cada viagem é
+um índice na tabela de ``route_id``. Viagens por headway vão
+comprimidas (``Frequencias`` e ``PadraoFrequencia``), como na memória.
+
+``carregar`` abre o arquivo com ``np.memmap`` somente leitura e monta a
+grade, os padrões do RAPTOR e as transferências como *views* — nada é
+copiado, todos os workers dividem as mesmas páginas pelo cache do SO e a
+carga leva milissegundos. O arquivo é gerado por
+``manage.py exportar_grade`` e tem no nome a versão do formato e o hash
+da chave (serviços + versão do feed), então uma importação nova ou um
+formato novo simplesmente deixam de achá‑lo — a grade volta a vir do banco.
+"""
+
+logger = logging.getLogger(__name__)
+
+MAGICO = b"RGHF"
+VERSAO_FORMATO = 4
+ALINHAMENTO = 64
+_PREFIXO = struct.Struct("<4sIQ")
+
+
+# ------------------------------------------------------------
+# Textos compactos
+# ------------------------------------------------------------
+class TextosCompactos(Sequence):
+    """Sequência de str sobre (offsets, blob UTF‑8) sem materializar a lista."""
+
+    __slots__ = ("offsets", "blob")
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode()
+
+    def __iter__(self) -> Iterator[str]:
+        texto = self.blob.tobytes()
+        o = self.offsets.tolist()
+        for a, b in zip(o, o[1:]):
+            yield texto[a:b].decode()
+
+
+def _compactar(textos: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    codificados = [t.encode() for t in textos]
+    offsets = np.zeros(len(codificados) + 1, dtype="<i8")
+    np.cumsum([len(c) for c in codificados], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(codificados), dtype=np.uint8)
+
+
+# ------------------------------------------------------------
+# Conteúdo
+# ------------------------------------------------------------
+@dataclass(slots=True)
+class GradeCompilada:
+    grade: GradeHoraria
+    padroes: Padroes
+    transferencias: Transferencias
+    pontos: np.ndarray               # float64 (n, 3), paradas na esfera unitária (KD‑tree)
+
+
+def arquivo_para(chave) -> Path:
+    servicos, versao = chave
+    h = hashlib.sha1(("\n".join(sorted(servicos)) + "|" + str(versao)).encode()).hexdigest()[:16]
+    return diretorio_cache() / f"grade_v{VERSAO_FORMATO}_{h}.rghf"
+
+
+def _alinhar(n: int) -> int:
+    return -(-n // ALINHAMENTO) * ALINHAMENTO
+
+
+# ------------------------------------------------------------
+# Escrita
+# ------------------------------------------------------------
+
+def escrever(destino: Path, grade: GradeHoraria, padroes: Padroes, transf: Transferencias):
+    p = grade.paradas
+    ids_o, ids_b = _compactar(p.ids)
+    nomes_o, nomes_b = _compactar(p.nomes)
+    trips_o, trips_b = _compactar(grade.trip_ids)
+
+    fq = grade.frequencias
+    rotas = sorted({pad.route_id for pad in padroes.lista}.union(grade.route_ids, fq.route_ids))
+    rota_idx = {r: i for i, r in enumerate(rotas)}
+    rotas_o, rotas_b = _compactar(rotas)
+    pads = [pad for pad in padroes.lista if isinstance(pad, Padrao)]
+    pads_f = padroes.lista[len(pads):]
+    if not all(isinstance(pad, PadraoFrequencia) for pad in pads_f):
+        raise ValueError("padrões por headway devem vir depois dos de horário fixo")
+    fq_o, fq_b = _compactar(fq.trip_ids)
+    tam_f = np.fromiter((len(pad.paradas) for pad in pads_f), dtype=np.int64, count=len(pads_f))
+    per_f = np.fromiter((len(pad.inicio) for pad in pads_f), dtype=np.int64, count=len(pads_f))
+    tam_paradas = np.fromiter((len(pad.paradas) for pad in pads), dtype=np.int64, count=len(pads))
+    tam_horarios = np.fromiter((pad.dep.size for pad in pads), dtype=np.int64, count=len(pads))
+
+    def _concat(partes, dtype):
+        return np.concatenate(partes).astype(dtype) if partes else np.zeros(0, dtype=dtype)
+
+    vetores: Dict[str, np.ndarray] = {
+        "paradas.ids.offsets": ids_o, "paradas.ids.blob": ids_b,
+        "paradas.nomes.offsets": nomes_o, "paradas.nomes.blob": nomes_b,
+        "paradas.lat": p.lat.astype("<f8"), "paradas.lon": p.lon.astype("<f8"),
+        "paradas.xyz": xyz(p.lat, p.lon).astype("<f8"),
+        "conexoes.dep_stop": grade.dep_stop.astype("<i4"),
+        "conexoes.arr_stop": grade.arr_stop.astype("<i4"),
+        "conexoes.dep_min": grade.dep_min.astype("<i4"),
+        "conexoes.arr_min": grade.arr_min.astype("<i4"),
+        "conexoes.trip": grade.trip.astype("<i4"),
+        "trips.offsets": trips_o, "trips.blob": trips_b,
+        "trips.rota": np.array([rota_idx[r] for r in grade.route_ids], dtype="<i4"),
+        "rotas.offsets": rotas_o, "rotas.blob": rotas_b,
+        "padroes.rota": np.array([rota_idx[pad.route_id] for pad in pads], dtype="<i4"),
+        "padroes.paradas_ini": np.concatenate(([0], np.cumsum(tam_paradas))).astype("<i8"),
+        "padroes.paradas": _concat([pad.paradas for pad in pads], "<i4"),
+        "padroes.horarios_ini": np.concatenate(([0], np.cumsum(tam_horarios))).astype("<i8"),
+        "padroes.dep": _concat([pad.dep.ravel() for pad in pads], "<i4"),
+        "padroes.arr": _concat([pad.arr.ravel() for pad in pads], "<i4"),
+        "padroes_freq.rota": np.array([rota_idx[pad.route_id] for pad in pads_f], dtype="<i4"),
+        "padroes_freq.paradas_ini": np.concatenate(([0], np.cumsum(tam_f))).astype("<i8"),
+        "padroes_freq.paradas": _concat([pad.paradas for pad in pads_f], "<i4"),
+        "padroes_freq.dep": _concat([pad.dep for pad in pads_f], "<i4"),
+        "padroes_freq.arr": _concat([pad.arr for pad in pads_f], "<i4"),
+        "padroes_freq.periodos_ini": np.concatenate(([0], np.cumsum(per_f))).astype("<i8"),
+        "padroes_freq.inicio": _concat([pad.inicio for pad in pads_f], "<i4"),
+        "padroes_freq.fim": _concat([pad.fim for pad in pads_f], "<i4"),
+        "padroes_freq.headway": _concat([pad.headway for pad in pads_f], "<i4"),
+        "padroes.inicio": padroes.inicio.astype("<i8"),
+        "padroes.por_parada": padroes.por_parada.astype("<i4"),
+        "freq.ini": fq.ini.astype("<i8"),
+        "freq.paradas": fq.paradas.astype("<i4"),
+        "freq.dep_off": fq.dep_off.astype("<i4"),
+        "freq.arr_off": fq.arr_off.astype("<i4"),
+        "freq.padrao": fq.padrao.astype("<i4"),
+        "freq.inicio": fq.inicio.astype("<i4"),
+        "freq.fim": fq.fim.astype("<i4"),
+        "freq.headway": fq.headway.astype("<i4"),
+        "freq.trips.offsets": fq_o, "freq.trips.blob": fq_b,
+        "freq.trips.rota": np.array([rota_idx[r] for r in fq.route_ids], dtype="<i4"),
+        "transferencias.inicio": transf.inicio.astype("<i8"),
+        "transferencias.destino": transf.destino.astype("<i4"),
+        "transferencias.minutos": transf.minutos.astype("<f4"),
+    }
+
+    tabela, pos = {}, 0
+    for nome, v in vetores.items():
+        tabela[nome] = {"offset": pos, "dtype": v.dtype.str, "shape": list(v.shape)}
+        pos = _alinhar(pos + v.nbytes)
+    cabecalho = json.dumps({
+        "servicos": sorted(grade.chave[0]),
+        "versao_feed": grade.chave[1],
+        "transferencias": transf.assinatura,
+        "vetores": tabela,
+    }).encode()
+
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    tmp = destino.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_PREFIXO.pack(MAGICO, VERSAO_FORMATO, len(cabecalho)))
+        f.write(cabecalho)
+        base = _alinhar(f.tell())
+        for nome, v in vetores.items():
+            f.seek(base + tabela[nome]["offset"])
+            f.write(np.ascontiguousarray(v).tobytes())
+    os.replace(tmp, destino)
+
+
+# ------------------------------------------------------------
+# Leitura
+# ------------------------------------------------------------
+
+def carregar(caminho: Path) -> GradeCompilada:
+    mm = np.memmap(caminho, dtype=np.uint8, mode="r")
+    magico, formato, n = _PREFIXO.unpack(bytes(mm[:_PREFIXO.size]))
+    if magico != MAGICO:
+        raise ValueError(f"{caminho}: não é uma grade compilada")
+    if formato != VERSAO_FORMATO:
+        raise ValueError(f"{caminho}: formato {formato}, esperado {VERSAO_FORMATO}")
+    cab = json.loads(bytes(mm[_PREFIXO.size:_PREFIXO.size + n]))
+    base = _alinhar(_PREFIXO.size + n)
+
+    def v(nome: str) -> np.ndarray:
+        info = cab["vetores"][nome]
+        dtype = np.dtype(info["dtype"])
+        tam = int(np.prod(info["shape"], dtype=np.int64)) * dtype.itemsize
+        ini = base + info["offset"]
+        return mm[ini:ini + tam].view(dtype).reshape(info["shape"])
+
+    def textos(prefixo: str) -> TextosCompactos:
+        return TextosCompactos(v(prefixo + ".offsets"), v(prefixo + ".blob"))
+
+    rotas = list(textos("rotas"))
+
+    def route_ids(nome: str):
+        return [rotas[i] for i in v(nome).tolist()]
+
+    ids = textos("paradas.ids")
+    paradas = Paradas(
+        ids=ids,
+        idx={sid: i for i, sid in enumerate(ids)},
+        nomes=textos("paradas.nomes"),
+        lat=v("paradas.lat"),
+        lon=v("paradas.lon"),
+    )
+    grade = GradeHoraria(
+        chave=(frozenset(cab["servicos"]), cab["versao_feed"]),
+        paradas=paradas,
+        dep_stop=v("conexoes.dep_stop"),
+        arr_stop=v("conexoes.arr_stop"),
+        dep_min=v("conexoes.dep_min"),
+        arr_min=v("conexoes.arr_min"),
+        trip=v("conexoes.trip"),
+        trip_ids=textos("trips"),
+        route_ids=route_ids("trips.rota"),
+        frequencias=Frequencias(
+            ini=v("freq.ini"),
+            paradas=v("freq.paradas"),
+            dep_off=v("freq.dep_off"),
+            arr_off=v("freq.arr_off"),
+            padrao=v("freq.padrao"),
+            inicio=v("freq.inicio"),
+            fim=v("freq.fim"),
+            headway=v("freq.headway"),
+            trip_ids=textos("freq.trips"),
+            route_ids=route_ids("freq.trips.rota"),
+        ),
+    )
+
+    rota = v("padroes.rota").tolist()
+    p_ini = v("padroes.paradas_ini").tolist()
+    h_ini = v("padroes.horarios_ini").tolist()
+    p_seq, dep, arr = v("padroes.paradas"), v("padroes.dep"), v("padroes.arr")
+    lista = []
+    for i in range(len(rota)):
+        paradas_i = p_seq[p_ini[i]:p_ini[i + 1]]
+        forma = (-1, len(paradas_i))
+        lista.append(Padrao(
+            rotas[rota[i]], paradas_i,
+            dep[h_ini[i]:h_ini[i + 1]].reshape(forma),
+            arr[h_ini[i]:h_ini[i + 1]].reshape(forma),
+        ))
+
+    rota = v("padroes_freq.rota").tolist()
+    p_ini = v("padroes_freq.paradas_ini").tolist()
+    e_ini = v("padroes_freq.periodos_ini").tolist()
+    p_seq, dep, arr = v("padroes_freq.paradas"), v("padroes_freq.dep"), v("padroes_freq.arr")
+    inicio, fim, headway = v("padroes_freq.inicio"), v("padroes_freq.fim"), v("padroes_freq.headway")
+    for i in range(len(rota)):
+        a, b = p_ini[i], p_ini[i + 1]
+        c, d = e_ini[i], e_ini[i + 1]
+        lista.append(PadraoFrequencia(
+            rotas[rota[i]], p_seq[a:b], dep[a:b], arr[a:b], inicio[c:d], fim[c:d], headway[c:d],
+        ))
+    padroes = Padroes(lista, v("padroes.inicio"), v("padroes.por_parada"))
+
+    transf = Transferencias(
+        cab["transferencias"],
+        v("transferencias.inicio"),
+        v("transferencias.destino"),
+        v("transferencias.minutos"),
+    )
+    return GradeCompilada(grade, padroes, transf, v("paradas.xyz"))
+
+
+def carregar_se_existir(chave) -> Optional[GradeCompilada]:
+    caminho = arquivo_para(chave)
+    if not caminho.exists():
+        return None
+    try:
+        return carregar(caminho)
+    except ValueError:
+        # arquivo de outro formato: quem chama monta a grade a partir do banco
+        logger.warning("grade compilada ignorada: %s", caminho, exc_info=True)
+        return None
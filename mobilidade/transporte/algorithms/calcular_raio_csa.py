@@ -1,223 +1,180 @@
-import heapq
-from collections import defaultdict
-from dataclasses import dataclass
-from math import atan2, cos, radians, sin, sqrt
-from typing import Dict, List, Tuple
-
-from scipy.spatial import KDTree
-from shapely.geometry import MultiPolygon, Point as ShpPoint, mapping
-from shapely.ops import unary_union, transform as shp_transform
-from pyproj import Transformer
-
-from transporte.models import Calendar, Stop, StopTime, Frequency
+import numpy as np
+
+from transporte.algorithms.csa import varrer_conexoes
+from transporte.algorithms.calendario import servicos_ativos
+from transporte.algorithms.grade_horaria import obter_grade
+from transporte.algorithms.indice_paradas import obter_indice
+from transporte.algorithms.isocrona import (
+    areas_por_faixa,
+    features_poligonos,
+    serializar_grade,
+    superficie_tempos,
+)
+from transporte.algorithms.malha_viaria import acesso_a_pe, obter_malha
+from transporte.algorithms.raptor import obter_padroes, perfil, rotear
+from transporte.algorithms.transferencias import obter_transferencias
 
 """
-• CSA para encontrar o earliest‑arrival em cada parada.
+• CSA (varredura linear das conexões) para o earliest‑arrival em cada parada,
+  ou RAPTOR (``motor="raptor"``) com limite opcional de transferências.
+• ``calcular_perfil``: janela de partidas numa só varredura (rRAPTOR),
+  com tempo mínimo/mediano/máximo por parada.
 • Para cada parada alcançada: cria um buffer de caminhada proporcional
   ao tempo *restante* até atingir o horizonte.
 • Une (unary_union) todos os buffers, obtendo MultiPolygon que descreve
   exatamente tudo que se consegue alcançar no tempo dado, incluindo
-  deslocamentos a pé depois de desembarcar.
+  deslocamentos a pé depois de desembarcar. Com ``limiares`` saem várias
+  faixas aninhadas da mesma busca (ver isocrona.py).
+• ``saida="grade"``: superfície de tempo de viagem por célula, sem polígonos.
 """
 
 # ---------------- Configurações ----------------
 CAMINHADA_MAX_METROS = 300
 VELOCIDADE_CAMINHADA_KMH = 5
 BUFFER_HORIZONTE_MIN = 5
+MOTORES = ("csa", "raptor")
+SAIDAS = ("geojson", "grade")
 
 # ------------- Funções auxiliares -------------
 
-def hhmm_para_min(t):
-    return t.hour * 60 + t.minute + round(t.second / 60)
-
-
-def haversine_m(lat1, lon1, lat2, lon2):
-    R = 6_371_000
-    φ1, φ2 = radians(lat1), radians(lat2)
-    dφ = radians(lat2 - lat1)
-    dλ = radians(lon2 - lon1)
-    a = sin(dφ / 2) ** 2 + cos(φ1) * cos(φ2) * sin(dλ / 2) ** 2
-    return 2 * R * atan2(sqrt(a), sqrt(1 - a))
-
-
 def tempo_caminhada(d_m):
     return (d_m / 1000) / VELOCIDADE_CAMINHADA_KMH * 60
 
 
-# ------------- Estrutura CSA Connection Scan Algorithm -------------
-@dataclass(slots=True)
-class Connection:
-    dep_stop: str
-    arr_stop: str
-    dep_min: int
-    arr_min: int
-
-
-# ------------- connections -------------
-
-def _add_trip(rows, conns, offs, stps):
-    tid = rows[0].trip_id
-    offs[tid] = [0]
-    stps[tid] = [rows[0].stop_id]
-    for s1, s2 in zip(rows, rows[1:]):
-        dep = hhmm_para_min(s1.departure_time)
-        arr = hhmm_para_min(s2.arrival_time)
-        conns.append(Connection(s1.stop_id, s2.stop_id, dep, arr))
-        offs[tid].append(offs[tid][-1] + (arr - dep))
-        stps[tid].append(s2.stop_id)
-
-
-def _gen_headway(freq, offs, stps, conns, horizon):
-    head = freq.headway_secs // 60
-    start = hhmm_para_min(freq.start_time)
-    end = hhmm_para_min(freq.end_time)
-    for k in range(0, (end - start) // head + 1):
-        base = start + k * head
-        if base > horizon:
-            break
-        for i in range(len(stps) - 1):
-            conns.append(
-                Connection(
-                    stps[i], stps[i + 1], base + offs[i], base + offs[i + 1]
-                )
-            )
-
-
-def carregar_conexoes(dia_sem, horizon):
-    servs = set(
-        Calendar.objects.filter(**{dia_sem: True}).values_list("service_id", flat=True)
-    )
-    conns, offs, stps = [], {}, {}
-    qs = (
-        StopTime.objects.filter(trip__service_id__in=servs)
-        .exclude(arrival_time__isnull=True, departure_time__isnull=True)
-        .select_related("trip")
-        .order_by("trip_id", "stop_sequence")
-    )
-    buf, cur = [], None
-    for st in qs:
-        if st.trip_id != cur and buf:
-            _add_trip(buf, conns, offs, stps)
-            buf.clear()
-        cur = st.trip_id
-        buf.append(st)
-    if buf:
-        _add_trip(buf, conns, offs, stps)
-    for f in Frequency.objects.filter(trip_id__in=offs):
-        _gen_headway(f, offs[f.trip_id], stps[f.trip_id], conns, horizon)
-    conns.sort(key=lambda c: c.dep_min)
-    idx_by_stop = defaultdict(list)
-    for i, c in enumerate(conns):
-        idx_by_stop[c.dep_stop].append(i)
-    return conns, idx_by_stop
+def caminhada_origem(paradas, lat, lon):
+    """Minutos a pé da origem até cada parada (inf fora do raio de caminhada).
+
+    Pelas ruas quando a malha de caminhada existe; senão, em linha reta.
+    """
+    malha = obter_malha()
+    if malha is not None:
+        return tempo_caminhada(acesso_a_pe(malha, paradas, lat, lon, CAMINHADA_MAX_METROS))
+
+    idx, dist = obter_indice(paradas).no_raio(lat, lon, CAMINHADA_MAX_METROS)
+    minutos = np.full(len(paradas), np.inf)
+    minutos[idx] = tempo_caminhada(dist)
+    return minutos
 
 
 # ------------- Algoritmo principal -------------
 
-def calcular_raio(lat, lon, max_min, dia_sem, hora_ini_min):
-    # Stops & spatial index
-    stops = {s.stop_id: s for s in Stop.objects.exclude(geom__isnull=True)}
-    coords = [(s.stop_lat, s.stop_lon) for s in stops.values()]
-    ids = list(stops)
-    tree = KDTree(coords)
-    deg_walk = CAMINHADA_MAX_METROS / 111_320
+def calcular_raio(
+    lat, lon, max_min, dia, hora_ini_min,
+    motor="csa", max_transferencias=None, limiares=None, simplificacao_m=None,
+    saida="geojson", resolucao_m=100,
+):
+    """FeatureCollection das isócronas (``saida="geojson"``) ou, com
+    ``saida="grade"``, a superfície de tempos serializada (bytes RGRD).
+
+    ``dia`` é uma ``date`` (calendar + calendar_dates) ou o nome do dia da
+    semana ("thursday")."""
+    if motor not in MOTORES:
+        raise ValueError(f"motor desconhecido: {motor!r} (use {', '.join(MOTORES)})")
+    if saida not in SAIDAS:
+        raise ValueError(f"saída desconhecida: {saida!r} (use {', '.join(SAIDAS)})")
+    # Várias faixas (ex.: 10/20/30/45/60) saem da mesma busca, até a maior
+    limiares = sorted(set(limiares)) if limiares else [max_min]
+    max_min = limiares[-1]
 
     # CSA connections
     horizon_abs = hora_ini_min + max_min + BUFFER_HORIZONTE_MIN
-    conns, idx_by_stop = carregar_conexoes(dia_sem, horizon_abs)
+    grade = obter_grade(servicos_ativos(dia))
+    paradas = grade.paradas
 
-    eat = defaultdict(lambda: float("inf"))
-    pq = []
+    transf = obter_transferencias(paradas, CAMINHADA_MAX_METROS, VELOCIDADE_CAMINHADA_KMH)
 
     # Origin → paradas iniciais indo de caminhada
-    for i in tree.query_ball_point((lat, lon), deg_walk):
-        sid = ids[i]
-        arr = hora_ini_min + tempo_caminhada(haversine_m(lat, lon, *coords[i]))
-        eat[sid] = arr
-        heapq.heappush(pq, (arr, sid))
-    #Pega a parada sid com menor tempo conhecido (t_cur) para expandir.
-    while pq:
-        t_cur, sid = heapq.heappop(pq)
-        if t_cur > eat[sid] or t_cur - hora_ini_min > max_min:
-            continue
-        # Caminhada local entre paradas próximas
-        base_idx = ids.index(sid)
-        for j in tree.query_ball_point(coords[base_idx], deg_walk):
-            nsid = ids[j]
-            if nsid == sid:
-                continue
-            tw = tempo_caminhada(haversine_m(*coords[base_idx], *coords[j]))
-            arr_nb = t_cur + tw
-            if arr_nb < eat[nsid]:
-                eat[nsid] = arr_nb
-                heapq.heappush(pq, (arr_nb, nsid))
-        # Usar conexões de transporte
-        for idx in idx_by_stop.get(sid, []):
-            c = conns[idx]
-            if c.dep_min < t_cur or c.dep_min > horizon_abs:
-                continue
-            if c.arr_min < eat[c.arr_stop]:
-                eat[c.arr_stop] = c.arr_min
-                heapq.heappush(pq, (c.arr_min, c.arr_stop))
+    eat = hora_ini_min + caminhada_origem(paradas, lat, lon)
+
+    t_max = hora_ini_min + max_min
+    if motor == "raptor":
+        # Rodadas por padrão de linha, com limite opcional de transferências
+        rotear(obter_padroes(grade), eat, t_max, horizon_abs, transf.vizinhos, max_transferencias)
+    else:
+        # Uma passada pelas conexões da janela [hora_ini_min, horizon_abs]
+        varrer_conexoes(grade, eat, hora_ini_min, t_max, horizon_abs, transf.vizinhos)
+
+    alcancadas = np.flatnonzero(eat - hora_ini_min <= max_min)
+
+    # ----------- Grade de tempos (sem polígonos) -----------
+    if saida == "grade":
+        minutos, cabecalho = superficie_tempos(
+            paradas.lon[alcancadas], paradas.lat[alcancadas], eat[alcancadas] - hora_ini_min,
+            (lon, lat), max_min, VELOCIDADE_CAMINHADA_KMH, resolucao_m,
+        )
+        return serializar_grade(minutos, cabecalho)
 
     # ----------- Build walking buffers -----------
-    if not eat:
+    if not len(alcancadas):
         return {"type": "FeatureCollection", "features": []}
 
-    transformer_to_m = Transformer.from_crs("epsg:4326", "epsg:3857", always_xy=True)
-    transformer_to_deg = Transformer.from_crs("epsg:3857", "epsg:4326", always_xy=True)
-
-    buffers = []
-    for sid, arr in eat.items():
-        delta = arr - hora_ini_min
-        if delta > max_min:
-            continue
-        # tempo restante para caminhar a partir desta parada
-        restante = max_min - delta
-        dist_m = restante * VELOCIDADE_CAMINHADA_KMH * 1000 / 60
-        if dist_m < 10:  # ignora buffers minúsculos
-            dist_m = 10
-        x, y = transformer_to_m.transform(stops[sid].stop_lon, stops[sid].stop_lat)
-        buffers.append(ShpPoint(x, y).buffer(dist_m))
-
-    area_union_m = unary_union(buffers)
-
-    # Transforma de volta para WGS‑84
-    def to_deg(x, y, z=None):
-        return transformer_to_deg.transform(x, y)
-
-    area_union_deg = shp_transform(to_deg, area_union_m)
-
-    # Decompõe MultiPolygons separados → features distintas
-    polys = []
-    if area_union_deg.geom_type == "Polygon":
-        polys = [area_union_deg]
-    elif area_union_deg.geom_type == "MultiPolygon":
-        polys = list(area_union_deg.geoms)
-
-    features = [
-        {
-            "type": "Feature",
-            "geometry": mapping(p),
-            "properties": {"tipo": "isocrona", "tempo_min": max_min},
-        }
-        for p in polys
-    ]
+    # Uma faixa por limiar, construídas da menor para a maior
+    faixas = areas_por_faixa(
+        paradas.lon[alcancadas], paradas.lat[alcancadas], eat[alcancadas] - hora_ini_min,
+        limiares, VELOCIDADE_CAMINHADA_KMH, tolerancia_m=simplificacao_m,
+    )
+    features = features_poligonos(faixas)
 
     # Pontos opcionais para debug/visualização
-    for sid, arr in eat.items():
-        if arr - hora_ini_min <= max_min:
-            s = stops[sid]
-            features.append(
-                {
-                    "type": "Feature",
-                    "geometry": {"type": "Point", "coordinates": [s.stop_lon, s.stop_lat]},
-                    "properties": {
-                        "stop_id": sid,
-                        "stop_name": s.stop_name,
-                        "tempo_min": round(arr - hora_ini_min, 1),
-                    },
-                }
-            )
+    for s in alcancadas.tolist():
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [float(paradas.lon[s]), float(paradas.lat[s])]},
+                "properties": {
+                    "stop_id": paradas.ids[s],
+                    "stop_name": paradas.nomes[s],
+                    "tempo_min": round(float(eat[s]) - hora_ini_min, 1),
+                },
+            }
+        )
 
     return {"type": "FeatureCollection", "features": features}
+
+
+# ------------- Perfil (janela de partidas) -------------
+
+def calcular_perfil(lat, lon, max_min, dia, hora_ini_min, hora_fim_min, passo_min=1, max_transferencias=None):
+    """Acessibilidade numa janela de partidas [hora_ini_min, hora_fim_min].
+
+    Uma única varredura rRAPTOR cobre todas as partidas (a cada
+    ``passo_min``); cada parada recebe o tempo de viagem mínimo, mediano e
+    máximo na janela (``None`` quando não é alcançada em parte das partidas).
+    """
+    if hora_fim_min < hora_ini_min:
+        raise ValueError("hora_fim deve ser posterior à hora de início")
+    grade = obter_grade(servicos_ativos(dia))
+    paradas = grade.paradas
+    transf = obter_transferencias(paradas, CAMINHADA_MAX_METROS, VELOCIDADE_CAMINHADA_KMH)
+
+    partidas = np.arange(hora_ini_min, hora_fim_min + 1, max(1, int(passo_min)))
+    resultado = perfil(
+        obter_padroes(grade), caminhada_origem(paradas, lat, lon), partidas,
+        max_min, BUFFER_HORIZONTE_MIN, transf.vizinhos, max_transferencias,
+    )
+    t_min, t_med, t_max = resultado.estatisticas()
+
+    def _min(v):
+        return round(float(v), 1) if np.isfinite(v) else None
+
+    features = []
+    for s in np.flatnonzero(np.isfinite(t_min)).tolist():
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [float(paradas.lon[s]), float(paradas.lat[s])]},
+                "properties": {
+                    "stop_id": paradas.ids[s],
+                    "stop_name": paradas.nomes[s],
+                    "tempo_min": _min(t_min[s]),
+                    "tempo_mediano": _min(t_med[s]),
+                    "tempo_max": _min(t_max[s]),
+                },
+            }
+        )
+
+    return {
+        "type": "FeatureCollection",
+        "features": features,
+        "properties": {"partidas": len(partidas), "hora_ini_min": hora_ini_min, "hora_fim_min": hora_fim_min},
+    }
@@ -0,0 +1,126 @@
+import threading
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, FrozenSet, List, Optional, Union
+
+import numpy as np
+
+from transporte.algorithms.grade_horaria import servicos_do_dia, versao_feed
+from transporte.models import Calendar, CalendarDate
+
+"""
+calendario.py — Serviços ativos numa data (calendar + calendar_dates)
+--------------------------------------------------------------------------
+Cada serviço vira um bitset de dias sobre o período de validade do feed
+(do menor ``start_date``/exceção ao maior ``end_date``/exceção):
+
+  1. dias da semana marcados em ``calendar.txt`` dentro de
+     ``[start_date, end_date]``;
+  2. exceções de ``calendar_dates.txt``: tipo 1 liga o dia, tipo 2 desliga.
+
+A matriz (serviços × dias) fica empacotada com ``np.packbits`` e é montada
+uma vez por versão do feed; "serviços ativos em D" é só a leitura de uma
+coluna de bits. Datas fora do período não têm serviço.
+
+Horários depois de 24h (viagens que atravessam a meia‑noite) pertencem ao
+dia de serviço em que a viagem começou, como no GTFS.
+"""
+
+EXCECAO_ADICIONADO = 1
+EXCECAO_REMOVIDO = 2
+
+
+@dataclass(slots=True)
+class Calendario:
+    inicio: Optional[date]
+    servicos: np.ndarray             # str (object), um por linha de ``bits``
+    bits: np.ndarray                 # uint8 (serviços × ceil(dias / 8)), packbits
+    n_dias: int
+    _por_dia: Dict[int, FrozenSet[str]] = field(default_factory=dict)
+
+    def ativos(self, dia: date) -> FrozenSet[str]:
+        if self.inicio is None:
+            return frozenset()
+        d = (dia - self.inicio).days
+        if not 0 <= d < self.n_dias:
+            return frozenset()
+        ativos = self._por_dia.get(d)
+        if ativos is None:
+            coluna = (self.bits[:, d >> 3] >> (7 - (d & 7))) & 1
+            ativos = self._por_dia[d] = frozenset(self.servicos[coluna.astype(bool)].tolist())
+        return ativos
+
+
+def montar_calendario() -> Calendario:
+    regras = list(Calendar.objects.values_list(
+        "service_id", "monday", "tuesday", "wednesday", "thursday", "friday",
+        "saturday", "sunday", "start_date", "end_date",
+    ))
+    excecoes = list(CalendarDate.objects.values_list("service_id", "date", "exception_type"))
+
+    servicos: List[str] = sorted({r[0] for r in regras} | {e[0] for e in excecoes})
+    regras = [r for r in regras if r[8] is not None and r[9] is not None]
+    datas = [r[8] for r in regras] + [r[9] for r in regras] + [e[1] for e in excecoes]
+    if not servicos or not datas:
+        return Calendario(None, np.array([], dtype=object), np.zeros((0, 0), dtype=np.uint8), 0)
+
+    inicio = min(datas)
+    n_dias = (max(datas) - inicio).days + 1
+    linha = {s: i for i, s in enumerate(servicos)}
+    ativo = np.zeros((len(servicos), n_dias), dtype=bool)
+
+    # dia da semana de cada coluna (segunda = 0, como em ``date.weekday``)
+    semana = (inicio.weekday() + np.arange(n_dias)) % 7
+    for sid, *dias, ini, fim in regras:
+        a, b = (ini - inicio).days, (fim - inicio).days + 1
+        ativo[linha[sid], a:b] = np.asarray(dias, dtype=bool)[semana[a:b]]
+
+    for sid, dia, tipo in excecoes:
+        if tipo in (EXCECAO_ADICIONADO, EXCECAO_REMOVIDO):
+            ativo[linha[sid], (dia - inicio).days] = tipo == EXCECAO_ADICIONADO
+
+    return Calendario(inicio, np.array(servicos, dtype=object), np.packbits(ativo, axis=1), n_dias)
+
+
+# ------------------------------------------------------------
+# Cache por versão do feed
+# ------------------------------------------------------------
+_calendario: Optional[Calendario] = None
+_calendario_versao: Optional[str] = None
+_calendario_lock = threading.Lock()
+
+
+def obter_calendario() -> Calendario:
+    global _calendario, _calendario_versao
+    versao = versao_feed()
+    with _calendario_lock:
+        if _calendario is None or _calendario_versao != versao:
+            _calendario = montar_calendario()
+            _calendario_versao = versao
+        return _calendario
+
+
+def servicos_da_data(dia: date) -> FrozenSet[str]:
+    """service_id ativos na data (calendar + calendar_dates)."""
+    return obter_calendario().ativos(dia)
+
+
+DIAS_SEMANA = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def interpretar_dia(valor: str) -> Union[date, str]:
+    """"thursday" → o próprio nome; "AAAA-MM-DD" → ``date`` (``ValueError`` se não for nenhum)."""
+    if valor in DIAS_SEMANA:
+        return valor
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ValueError(f"{valor!r}: use um dia da semana ({', '.join(DIAS_SEMANA)}) ou AAAA-MM-DD")
+
+
+def servicos_ativos(dia: Union[date, str]) -> FrozenSet[str]:
+    """Aceita uma data ou, como antes, o nome do dia da semana ("thursday")."""
+    if isinstance(dia, date):
+        return servicos_da_data(dia)
+    return servicos_do_dia(dia)
+
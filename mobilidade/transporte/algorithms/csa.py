@@ -0,0 +1,99 @@
+import heapq
+from typing import Callable, Iterable, List, Tuple
+
+import numpy as np
+
+from transporte.algorithms.grade_horaria import GradeHoraria
+
+"""
+csa.py — Connection Scan Algorithm (earliest‑arrival) sobre a grade colunar
+--------------------------------------------------------------------------
+Uma única passada pelas conexões ordenadas por partida: começa na primeira
+partida ≥ hora de início (busca binária em ``dep_min``) e para no
+horizonte. O trabalho é linear no número de conexões dentro da janela. Viagens por
+headway entram geradas só para a janela (``Frequencias.conexoes``).
+
+• ``embarcado[trip]`` marca viagens já alcançadas — quem está no ônibus
+  segue nele mesmo que a parada intermediária não tenha melhorado.
+• Caminhadas entre paradas são relaxadas quando uma parada melhora;
+  como no algoritmo anterior, caminhadas podem ser encadeadas enquanto o
+  tempo não passa de ``t_max``.
+"""
+
+# vizinhos(s) → (índices das paradas vizinhas, minutos de caminhada)
+Vizinhos = Callable[[int], Tuple[Iterable[int], Iterable[float]]]
+
+
+def relaxar_caminhadas(eat, origens: Iterable[int], t_max: float, vizinhos: Vizinhos) -> List[int]:
+    """Fecho das caminhadas a partir de ``origens`` (Dijkstra local).
+
+    Retorna as paradas que melhoraram só por caminhada.
+    """
+    heap = [(eat[s], s) for s in origens]
+    heapq.heapify(heap)
+    melhoradas = []
+    while heap:
+        t_cur, s = heapq.heappop(heap)
+        if t_cur > eat[s] or t_cur > t_max:
+            continue
+        for j, tw in zip(*vizinhos(s)):
+            if j == s:
+                continue
+            arr_nb = t_cur + tw
+            if arr_nb < eat[j]:
+                eat[j] = arr_nb
+                melhoradas.append(j)
+                heapq.heappush(heap, (arr_nb, j))
+    return melhoradas
+
+
+def varrer_conexoes(
+    grade: GradeHoraria,
+    eat: np.ndarray,
+    t_ini: float,
+    t_max: float,
+    horizonte: float,
+    vizinhos: Vizinhos,
+) -> np.ndarray:
+    """Earliest‑arrival por parada (modifica e retorna ``eat``).
+
+    ``eat`` chega preenchido com os tempos de chegada a pé desde a origem.
+    Só embarca quem chegou à parada até ``t_max``; só considera partidas em
+    ``[t_ini, horizonte]``.
+    """
+    # Listas Python são bem mais rápidas que escalares NumPy dentro do laço.
+    tempos = eat.tolist()
+    relaxar_caminhadas(tempos, np.flatnonzero(np.isfinite(eat)).tolist(), t_max, vizinhos)
+
+    ini = int(np.searchsorted(grade.dep_min, t_ini, side="left"))
+    fim = int(np.searchsorted(grade.dep_min, horizonte, side="right"))
+
+    janela = slice(ini, fim)
+    colunas = [
+        grade.dep_stop[janela], grade.arr_stop[janela],
+        grade.dep_min[janela], grade.arr_min[janela], grade.trip[janela],
+    ]
+    n_trips = len(grade.trip_ids)
+
+    # Viagens por headway: só as partidas da janela, intercaladas às fixas
+    *freq, instancia = grade.frequencias.conexoes(t_ini, horizonte)
+    if len(instancia):
+        colunas = [np.concatenate((c, f)) for c, f in zip(colunas, freq + [instancia + n_trips])]
+        ordem = np.lexsort((colunas[3], colunas[2]))
+        colunas = [c[ordem] for c in colunas]
+        n_trips += int(instancia.max()) + 1
+
+    embarcado = bytearray(n_trips)
+    for d_stop, a_stop, dep, arr, t in zip(*(c.tolist() for c in colunas)):
+        if not embarcado[t]:
+            t_parada = tempos[d_stop]
+            if t_parada > dep or t_parada > t_max:
+                continue
+            embarcado[t] = 1
+        if arr < tempos[a_stop]:
+            tempos[a_stop] = arr
+            if arr <= t_max:
+                relaxar_caminhadas(tempos, (a_stop,), t_max, vizinhos)
+
+    eat[:] = tempos
+    return eat
@@ -0,0 +1,32 @@
+import numpy as np
+
+"""
+esfera.py — Conversões entre graus, esfera unitária e metros
+--------------------------------------------------------------------------
+Sem Django nem modelos: serve ao índice das paradas, à malha viária e aos
+utilitários de ``transporte/utils``.
+"""
+
+RAIO_TERRA_M = 6_371_000
+
+
+def xyz(lat, lon) -> np.ndarray:
+    """Graus → pontos (x, y, z) na esfera unitária, um por linha."""
+    φ, λ = np.radians(lat), np.radians(lon)
+    return np.column_stack((np.cos(φ) * np.cos(λ), np.cos(φ) * np.sin(λ), np.sin(φ)))
+
+
+def corda(metros):
+    """Distância sobre a esfera (m) → corda na esfera unitária."""
+    return 2 * np.sin(np.asarray(metros) / (2 * RAIO_TERRA_M))
+
+
+def metros(corda_):
+    """Corda na esfera unitária → distância sobre a esfera (m)."""
+    return 2 * RAIO_TERRA_M * np.arcsin(np.minimum(np.asarray(corda_) / 2, 1.0))
+
+
+def haversine_m(lat1, lon1, lat2, lon2) -> np.ndarray:
+    φ1, φ2 = np.radians(lat1), np.radians(lat2)
+    a = np.sin((φ2 - φ1) / 2) ** 2 + np.cos(φ1) * np.cos(φ2) * np.sin(np.radians(lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA_M * np.arcsin(np.sqrt(a))
@@ -0,0 +1,513 @@
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import groupby, repeat
+from operator import itemgetter
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max
+
+from transporte.gtfs_loader import conexoes
+from transporte.models import Calendar, FeedVersion, Frequency, Stop, StopTime, Trip
+
+"""
+grade_horaria.py — Grade horária do dia compartilhada entre requisições
+--------------------------------------------------------------------------
+Montar as conexões a partir do PostGIS custa segundos por requisição. Aqui
+a grade é construída uma única vez por (conjunto de serviços, versão do
+feed) e reaproveitada por todas as chamadas do processo.
+
+• Uma nova importação GTFS muda a versão do feed → a grade é refeita na
+  próxima consulta, sem reiniciar o servidor.
+• O total em memória é limitado por ``RAIO_GRADE_CACHE_MB``; grades de
+  dias menos usados são descartadas (LRU).
+• As conexões ficam em vetores NumPy paralelos (int32) com as paradas
+  internadas em índices densos, em vez de um objeto por conexão. Elas vêm
+  prontas do banco (tabela derivada de ``gtfs_loader/conexoes.py``).
+• Viagens por headway (``frequencies.txt``) não viram conexões: ficam
+  como (padrão, início, fim, intervalo) em ``Frequencias`` e os motores
+  geram só as partidas de que precisam.
+"""
+
+# ------------------------------------------------------------
+# Parâmetros globais
+# ------------------------------------------------------------
+VERSAO_FEED_TTL_S = 30             # Intervalo mínimo entre checagens da versão
+BYTES_POR_PARADA = 160             # Estimativa (str + entrada no dict + nome)
+BYTES_POR_TRIP = 88                # Estimativa (str em ``trip_ids`` + ref. em ``route_ids``)
+LOTE_CURSOR = 50_000               # Linhas por ida ao cursor do servidor
+
+
+# ------------------------------------------------------------
+# Utilidades auxiliares
+# ------------------------------------------------------------
+
+def seg_para_min(s):
+    """Segundos → minuto mais próximo (inteiro ou vetor NumPy de inteiros).
+
+    Única regra de arredondamento da grade: horários, janelas de frequência
+    e headways passam todos por aqui.
+    """
+    return (s + 30) // 60
+
+
+def diretorio_cache() -> Path:
+    """``RAIO_CACHE_DIR``: onde ficam grade, transferências e malha compiladas."""
+    return Path(getattr(settings, "RAIO_CACHE_DIR", settings.BASE_DIR / "cache"))
+
+
+# ------------------------------------------------------------
+# Estruturas colunares
+# ------------------------------------------------------------
+@dataclass(slots=True)
+class Paradas:
+    """Paradas internadas: stop_id ↔ índice denso 0..n-1."""
+    ids: List[str]
+    idx: Dict[str, int]
+    nomes: List[str]
+    lat: np.ndarray                  # float64
+    lon: np.ndarray                  # float64
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.lat.nbytes + self.lon.nbytes + len(self.ids) * BYTES_POR_PARADA
+
+
+def _faixas(inicios: np.ndarray, tamanhos: np.ndarray) -> np.ndarray:
+    """Concatena ``arange(inicios[k], inicios[k] + tamanhos[k])`` sem laço."""
+    total = int(tamanhos.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    desloc = np.repeat(inicios - np.cumsum(tamanhos) + tamanhos, tamanhos)
+    return desloc + np.arange(total)
+
+
+@dataclass(slots=True)
+class Frequencias:
+    """Viagens por headway comprimidas em (padrão, início, fim, intervalo).
+
+    Padrões são deduplicados por sequência de paradas + deslocamentos: o
+    padrão ``k`` passa por ``paradas[ini[k]:ini[k + 1]]``, partindo de cada
+    uma ``dep_off`` minutos após o início da viagem (``arr_off`` para a
+    chegada). Cada entrada ``e`` tem viagens em ``inicio[e]``,
+    ``inicio[e] + headway[e]``, … até ``fim[e]``.
+    """
+    ini: np.ndarray                  # int64, len = n_padroes + 1
+    paradas: np.ndarray              # int32
+    dep_off: np.ndarray              # int32, minutos desde o início da viagem
+    arr_off: np.ndarray              # int32
+    padrao: np.ndarray               # int32, por entrada
+    inicio: np.ndarray               # int32, minutos desde 0h00
+    fim: np.ndarray                  # int32
+    headway: np.ndarray              # int32, minutos (≥ 1)
+    trip_ids: List[str]              # trip modelo de cada entrada
+    route_ids: List[str]             # route_id de cada entrada
+
+    def __len__(self):
+        return len(self.padrao)
+
+    @property
+    def nbytes(self) -> int:
+        vetores = (
+            self.ini, self.paradas, self.dep_off, self.arr_off,
+            self.padrao, self.inicio, self.fim, self.headway,
+        )
+        return sum(v.nbytes for v in vetores) + len(self.trip_ids) * BYTES_POR_TRIP
+
+    def conexoes(self, t_de: float, t_ate: float):
+        """Conexões das viagens com partida de algum trecho em ``[t_de, t_ate]``.
+
+        Retorna (dep_stop, arr_stop, dep_min, arr_min, viagem), com
+        ``viagem`` numerando as instâncias geradas a partir de 0.
+        """
+        if not len(self):
+            vazio = np.zeros(0, dtype=np.int32)
+            return vazio, vazio, vazio, vazio, vazio
+        tam = np.diff(self.ini)[self.padrao]
+        # maior deslocamento de partida de cada padrão (penúltima parada)
+        dep_max = self.dep_off[self.ini[1:] - 2][self.padrao]
+
+        # instâncias j com base = inicio + j·headway em [t_de − dep_max, t_ate]
+        h = self.headway.astype(np.int64)
+        j_de = np.maximum(0, np.ceil((t_de - dep_max - self.inicio) / h)).astype(np.int64)
+        j_ate = np.minimum((self.fim - self.inicio) // h, np.floor((t_ate - self.inicio) / h)).astype(np.int64)
+        n_inst = np.maximum(0, j_ate - j_de + 1)
+        entrada = np.repeat(np.arange(len(self)), n_inst)
+        base = self.inicio[entrada] + _faixas(j_de, n_inst) * h[entrada]
+
+        # instância × trecho
+        n_seg = tam[entrada] - 1
+        inst = np.repeat(np.arange(len(entrada)), n_seg)
+        pos = self.ini[self.padrao[entrada]][inst] + _faixas(np.zeros_like(n_seg), n_seg)
+        dep = base[inst] + self.dep_off[pos]
+        ok = (dep >= t_de) & (dep <= t_ate)
+        pos, inst, dep = pos[ok], inst[ok], dep[ok]
+        return (
+            self.paradas[pos], self.paradas[pos + 1],
+            dep.astype(np.int32), (base[inst] + self.arr_off[pos + 1]).astype(np.int32),
+            inst.astype(np.int32),
+        )
+
+
+@dataclass(slots=True, weakref_slot=True)
+class GradeHoraria:
+    """Conexões do dia como vetores paralelos, ordenados por ``dep_min``.
+
+    Só viagens com horários fixos viram conexões; as por headway ficam em
+    ``frequencias``.
+    """
+    chave: Tuple[FrozenSet[str], str]
+    paradas: Paradas
+    dep_stop: np.ndarray             # int32, índice da parada
+    arr_stop: np.ndarray             # int32
+    dep_min: np.ndarray              # int32, minutos desde 0h00
+    arr_min: np.ndarray              # int32
+    trip: np.ndarray                 # int32, índice em ``trip_ids``
+    trip_ids: List[str]              # instâncias de headway repetem o trip_id
+    route_ids: List[str]             # route_id de cada trip (padrões do RAPTOR)
+    frequencias: Frequencias
+
+    def __len__(self):
+        return len(self.dep_min)
+
+    @property
+    def nbytes(self) -> int:
+        vetores = (self.dep_stop, self.arr_stop, self.dep_min, self.arr_min, self.trip)
+        return (
+            sum(v.nbytes for v in vetores) + len(self.trip_ids) * BYTES_POR_TRIP
+            + self.frequencias.nbytes
+        )
+
+
+# ------------------------------------------------------------
+# Paradas
+# ------------------------------------------------------------
+
+def carregar_paradas() -> Paradas:
+    ids, nomes, lat, lon = [], [], array("d"), array("d")
+    for sid, nome, la, lo in (
+        Stop.objects.exclude(geom__isnull=True)
+        .order_by("stop_id")
+        .values_list("stop_id", "stop_name", "stop_lat", "stop_lon")
+        .iterator(chunk_size=10_000)
+    ):
+        ids.append(sid)
+        nomes.append(nome)
+        lat.append(la)
+        lon.append(lo)
+    return Paradas(
+        ids=ids,
+        idx={sid: i for i, sid in enumerate(ids)},
+        nomes=nomes,
+        lat=np.frombuffer(lat, dtype=np.float64),
+        lon=np.frombuffer(lon, dtype=np.float64),
+    )
+
+
+# ------------------------------------------------------------
+# Construção das conexões do dia
+# ------------------------------------------------------------
+# (trip_id, stop_id, arrival_time, departure_time) — horários em segundos
+LinhaStopTime = Tuple[str, str, int, int]
+
+
+class _Moldes:
+    """Padrões das viagens por headway, deduplicados durante a leitura."""
+
+    def __init__(self):
+        self.ids: Dict[tuple, int] = {}
+        self.de_trip: Dict[str, int] = {}
+        self.paradas, self.dep_off, self.arr_off = array("i"), array("i"), array("i")
+        self.ini = array("q", [0])
+
+    def add_trip(self, rows: List[LinhaStopTime], stop_idx: Dict[str, int]):
+        rows = [r for r in rows if r[1] in stop_idx]
+        if len(rows) < 2:
+            return
+        t0 = seg_para_min(rows[0][3])
+        chave = (
+            tuple(stop_idx[r[1]] for r in rows),
+            tuple(seg_para_min(r[3]) - t0 for r in rows),
+            tuple(seg_para_min(r[2]) - t0 for r in rows),
+        )
+        k = self.ids.get(chave)
+        if k is None:
+            k = self.ids[chave] = len(self.ids)
+            self.paradas.extend(chave[0])
+            self.dep_off.extend(chave[1])
+            self.arr_off.extend(chave[2])
+            self.ini.append(len(self.paradas))
+        self.de_trip[rows[0][0]] = k
+
+    def frequencias(self, linhas, rota_de: Dict[str, str]) -> Frequencias:
+        """``linhas``: (trip_id, start_time, end_time, headway_secs) em segundos."""
+        padrao, inicio, fim, headway, trip_ids = array("i"), array("i"), array("i"), array("i"), []
+        for trip_id, ini, fim_s, head in linhas:
+            k = self.de_trip.get(trip_id)
+            if k is None:
+                continue
+            padrao.append(k)
+            inicio.append(seg_para_min(ini))
+            fim.append(seg_para_min(fim_s))
+            headway.append(max(1, seg_para_min(head)))
+            trip_ids.append(trip_id)
+        return Frequencias(
+            ini=np.frombuffer(self.ini, dtype=np.int64),
+            paradas=_vetor(self.paradas),
+            dep_off=_vetor(self.dep_off),
+            arr_off=_vetor(self.arr_off),
+            padrao=_vetor(padrao),
+            inicio=_vetor(inicio),
+            fim=_vetor(fim),
+            headway=_vetor(headway),
+            trip_ids=trip_ids,
+            route_ids=[rota_de.get(t, "") for t in trip_ids],
+        )
+
+
+def servicos_do_dia(dia_semana: str) -> FrozenSet[str]:
+    """service_id ativos no dia da semana ("monday", …)."""
+    return frozenset(
+        Calendar.objects.filter(**{dia_semana: True}).values_list("service_id", flat=True)
+    )
+
+
+def _vetor(a: array) -> np.ndarray:
+    return np.frombuffer(a, dtype=np.int32) if len(a) else np.zeros(0, dtype=np.int32)
+
+
+def _conexoes_fixas(servicos, paradas: Paradas):
+    """Conexões de horário fixo lidas da tabela ``conexoes.TABELA``.
+
+    Um cursor do lado do servidor entrega lotes de ``LOTE_CURSOR`` linhas já
+    pareadas pelo ``LEAD()``; cada lote vira vetores NumPy. As linhas vêm
+    ordenadas por viagem, então o índice da viagem sai das mudanças de
+    ``trip_id`` (inclusive entre um lote e o seguinte).
+    """
+    idx = paradas.idx.get
+    partes: List[Tuple[np.ndarray, ...]] = []
+    trip_ids: List[str] = []
+    anterior = None
+    with connection.chunked_cursor() as cur:
+        cur.execute(conexoes.sql_do_dia(), [sorted(servicos)])
+        while linhas := cur.fetchmany(LOTE_CURSOR):
+            trips, dep, arr, dep_s, arr_s = zip(*linhas)
+            trips = np.array(trips, dtype=object)
+            nova = np.empty(len(trips), dtype=bool)
+            nova[0] = trips[0] != anterior
+            nova[1:] = trips[1:] != trips[:-1]
+            anterior = trips[-1]
+            trip = len(trip_ids) - 1 + np.cumsum(nova)
+            trip_ids.extend(trips[nova].tolist())
+
+            n = len(trips)
+            dep = np.fromiter(map(idx, dep, repeat(-1)), dtype=np.int32, count=n)
+            arr = np.fromiter(map(idx, arr, repeat(-1)), dtype=np.int32, count=n)
+            # paradas fora do conjunto carregado (feed trocando no meio) ficam de fora
+            ok = (dep >= 0) & (arr >= 0)
+            partes.append((
+                dep[ok], arr[ok],
+                seg_para_min(np.asarray(dep_s, dtype=np.int64)[ok]).astype(np.int32),
+                seg_para_min(np.asarray(arr_s, dtype=np.int64)[ok]).astype(np.int32),
+                trip[ok].astype(np.int32),
+            ))
+
+    if not partes:
+        vazio = np.zeros(0, dtype=np.int32)
+        return vazio, vazio, vazio, vazio, vazio, trip_ids
+    return (*(np.concatenate(c) for c in zip(*partes)), trip_ids)
+
+
+def _rotas(servicos) -> Dict[str, str]:
+    """trip_id → route_id das viagens dos serviços (uma str por rota)."""
+    unicas: Dict[str, str] = {}
+    return {
+        t: unicas.setdefault(r, r)
+        for t, r in Trip.objects.filter(service_id__in=servicos).values_list("trip_id", "route_id")
+        .iterator(chunk_size=50_000)
+    }
+
+
+def carregar_conexoes(servicos, paradas: Paradas, chave=None) -> GradeHoraria:
+    moldes = _Moldes()
+    rota_de = _rotas(servicos)
+
+    # Viagens de frequencies.txt: os stop_times são só o modelo do percurso
+    com_headway = Frequency.objects.filter(trip__service_id__in=servicos)
+    headways = list(
+        com_headway.order_by("trip_id", "start_time")
+        .values_list("trip_id", "start_time", "end_time", "headway_secs")
+    )
+    qs = (
+        StopTime.objects.filter(trip_id__in=com_headway.values("trip_id"))
+        .order_by("trip_id", "stop_sequence")
+        .values_list("trip_id", "stop_id", "arrival_time", "departure_time")
+        .iterator(chunk_size=50_000)
+    )
+    for _, rows in groupby(qs, key=itemgetter(0)):
+        moldes.add_trip(list(rows), paradas.idx)
+
+    # ------------ trips com horários fixos -------------
+    dep_stop, arr_stop, dep_min, arr_min, trip, trip_ids = _conexoes_fixas(servicos, paradas)
+    return montar_grade(
+        paradas, dep_stop, arr_stop, dep_min, arr_min, trip, trip_ids,
+        [rota_de.get(t, "") for t in trip_ids], moldes.frequencias(headways, rota_de), chave=chave,
+    )
+
+
+def montar_grade(
+    paradas: Paradas, dep_stop, arr_stop, dep_min, arr_min, trip, trip_ids: List[str],
+    route_ids: List[str], frequencias: Frequencias, chave=None,
+) -> GradeHoraria:
+    """Ordena as conexões (int32, em qualquer ordem) por partida."""
+    # Empates de partida: trechos de duração zero primeiro (a CSA depende disso).
+    ordem = np.lexsort((arr_min, dep_min))
+    return GradeHoraria(
+        chave=chave,
+        paradas=paradas,
+        dep_stop=dep_stop[ordem],
+        arr_stop=arr_stop[ordem],
+        dep_min=dep_min[ordem],
+        arr_min=arr_min[ordem],
+        trip=trip[ordem],
+        trip_ids=trip_ids,
+        route_ids=route_ids,
+        frequencias=frequencias,
+    )
+
+
+# ------------------------------------------------------------
+# Versão do feed
+# ------------------------------------------------------------
+_versao_lock = threading.Lock()
+_versao: Optional[Tuple[float, str]] = None  # (instante da checagem, versão)
+
+
+def versao_feed() -> str:
+    """Id da ``FeedVersion`` ativa; muda a cada importação publicada.
+
+    Bancos carregados antes do versionamento não têm versão ativa — aí vale
+    uma impressão digital barata das tabelas.
+    """
+    global _versao
+    agora = time.monotonic()
+    with _versao_lock:
+        if _versao is not None and agora - _versao[0] < VERSAO_FEED_TTL_S:
+            return _versao[1]
+
+    ativa = FeedVersion.objects.filter(is_active=True).order_by("-activated_at").values_list("id", flat=True).first()
+    if ativa is not None:
+        versao = f"v{ativa}"
+    else:
+        st = StopTime.objects.aggregate(m=Max("id"))["m"]
+        fq = Frequency.objects.aggregate(m=Max("id"))["m"]
+        cal = Calendar.objects.aggregate(n=Count("service_id"))["n"]
+        versao = f"{st or 0}-{fq or 0}-{cal}"
+
+    with _versao_lock:
+        _versao = (agora, versao)
+    return versao
+
+
+def invalidar_versao_feed():
+    """Força a próxima consulta a reler a versão (ex.: logo após importar)."""
+    global _versao
+    with _versao_lock:
+        _versao = None
+
+
+# ------------------------------------------------------------
+# Cache LRU de grades
+# ------------------------------------------------------------
+_grades: "OrderedDict[tuple, GradeHoraria]" = OrderedDict()
+_grades_lock = threading.Lock()
+_construcao_locks: Dict[tuple, threading.Lock] = {}
+_paradas: Optional[Paradas] = None
+_paradas_versao: Optional[str] = None
+_paradas_lock = threading.Lock()
+
+
+def _limite_bytes() -> int:
+    return int(getattr(settings, "RAIO_GRADE_CACHE_MB", 1024)) * 1024 * 1024
+
+
+def _evictar(limite: int):
+    """Remove as grades menos usadas até caber no limite (mantém a mais recente)."""
+    total = sum(g.nbytes for g in _grades.values())
+    while total > limite and len(_grades) > 1:
+        _, velha = _grades.popitem(last=False)
+        total -= velha.nbytes
+
+
+def obter_paradas() -> Paradas:
+    """Paradas internadas da versão atual do feed (compartilhadas pelas grades)."""
+    global _paradas, _paradas_versao
+    versao = versao_feed()
+    with _paradas_lock:
+        if _paradas is None or _paradas_versao != versao:
+            _paradas = carregar_paradas()
+            _paradas_versao = versao
+        return _paradas
+
+
+def _do_arquivo(chave) -> Optional[GradeHoraria]:
+    """Grade compilada por ``manage.py exportar_grade`` (memmap), se houver."""
+    from transporte.algorithms import arquivo_grade, indice_paradas, raptor, transferencias
+
+    compilada = arquivo_grade.carregar_se_existir(chave)
+    if compilada is None:
+        return None
+    raptor.registrar_padroes(compilada.grade, compilada.padroes)
+    transferencias.registrar(compilada.transferencias)
+    indice_paradas.registrar(compilada.grade.paradas, compilada.pontos)
+    return compilada.grade
+
+
+def obter_grade(servicos) -> GradeHoraria:
+    """Grade do conjunto de serviços para a versão atual do feed (com cache)."""
+    chave = (frozenset(servicos), versao_feed())
+
+    with _grades_lock:
+        grade = _grades.get(chave)
+        if grade is not None:
+            _grades.move_to_end(chave)
+            return grade
+        lock = _construcao_locks.setdefault(chave, threading.Lock())
+
+    # Só uma thread constrói cada chave; as demais esperam pelo resultado.
+    with lock:
+        with _grades_lock:
+            grade = _grades.get(chave)
+            if grade is not None:
+                _grades.move_to_end(chave)
+                return grade
+
+        grade = _do_arquivo(chave) or carregar_conexoes(chave[0], obter_paradas(), chave=chave)
+
+        with _grades_lock:
+            # Versões antigas do mesmo feed nunca mais serão pedidas.
+            for k in [k for k in _grades if k[1] != chave[1]]:
+                del _grades[k]
+            _grades[chave] = grade
+            _evictar(_limite_bytes())
+            _construcao_locks.pop(chave, None)
+    return grade
+
+
+def limpar_cache():
+    global _paradas
+    with _grades_lock:
+        _grades.clear()
+        _construcao_locks.clear()
+    with _paradas_lock:
+        _paradas = None
+    invalidar_versao_feed()
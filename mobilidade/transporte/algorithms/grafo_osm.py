@@ -0,0 +1,81 @@
+import xml.etree.ElementTree as ET
+from array import array
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from scipy.sparse import csr_matrix
+
+from transporte.algorithms.esfera import haversine_m
+
+"""
+grafo_osm.py — graphml do OSMnx → matriz CSR de caminhada
+--------------------------------------------------------------------------
+Só lê ``settings`` (sem ``django.setup()`` nem modelos), então pode ser
+importado pelos utilitários de ``transporte/utils`` que baixam e recortam
+o grafo. A malha usada nas consultas (``malha_viaria``) compila o graphml
+por aqui.
+"""
+
+
+def caminho_graphml() -> Optional[Path]:
+    """``RAIO_GRAFO_CAMINHADA``: onde os utilitários gravam e de onde a malha é lida."""
+    caminho = getattr(settings, "RAIO_GRAFO_CAMINHADA", None)
+    return Path(caminho) if caminho else None
+
+
+# ------------------------------------------------------------
+# Compilação do graphml
+# ------------------------------------------------------------
+
+def _ler_graphml(caminho: Path):
+    """Nós (lat, lon) e arestas (origem, destino, metros) de um graphml do OSMnx."""
+    chaves: Dict[Tuple[str, str], str] = {}
+    ids: Dict[str, int] = {}
+    lat, lon = array("d"), array("d")
+    origem, destino, metros = array("q"), array("q"), array("d")
+
+    for _, el in ET.iterparse(caminho, events=("end",)):
+        tag = el.tag.rsplit("}", 1)[-1]
+        if tag == "key":
+            chaves[(el.get("for"), el.get("attr.name"))] = el.get("id")
+        elif tag == "node":
+            dados = {d.get("key"): d.text for d in el}
+            ids[el.get("id")] = len(lat)
+            lat.append(float(dados[chaves[("node", "y")]]))
+            lon.append(float(dados[chaves[("node", "x")]]))
+            el.clear()
+        elif tag == "edge":
+            dados = {d.get("key"): d.text for d in el}
+            comprimento = dados.get(chaves.get(("edge", "length")))
+            origem.append(ids[el.get("source")])
+            destino.append(ids[el.get("target")])
+            metros.append(float(comprimento) if comprimento else np.nan)
+            el.clear()
+
+    lat, lon = np.frombuffer(lat), np.frombuffer(lon)
+    o, d, m = np.frombuffer(origem, dtype=np.int64), np.frombuffer(destino, dtype=np.int64), np.frombuffer(metros)
+    sem = np.isnan(m)
+    m = m.copy()
+    m[sem] = haversine_m(lat[o[sem]], lon[o[sem]], lat[d[sem]], lon[d[sem]])
+    return lat, lon, o, d, m
+
+
+def compilar(caminho: Path):
+    """graphml → (indptr, indices, metros, lat, lon) da CSR simétrica."""
+    lat, lon, o, d, m = _ler_graphml(caminho)
+    n = len(lat)
+    # os dois sentidos; arestas repetidas ficam com o menor comprimento
+    a, b = np.concatenate((o, d)), np.concatenate((d, o))
+    m = np.concatenate((m, m))
+    fora_laco = a != b
+    a, b, m = a[fora_laco], b[fora_laco], m[fora_laco]
+    ordem = np.lexsort((m, b, a))
+    a, b, m = a[ordem], b[ordem], m[ordem]
+    primeiro = np.ones(len(a), dtype=bool)
+    primeiro[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    a, b, m = a[primeiro], b[primeiro], m[primeiro]
+    # zero numa CSR é "sem aresta": comprimento mínimo de 1 cm
+    matriz = csr_matrix((np.maximum(m, 0.01).astype(np.float32), (a, b)), shape=(n, n))
+    return matriz.indptr, matriz.indices, matriz.data, lat, lon
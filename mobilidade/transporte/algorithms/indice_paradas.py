@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from transporte.algorithms.esfera import corda, metros, xyz
+from transporte.algorithms.grade_horaria import Paradas
+
+"""
+indice_paradas.py — Índice espacial das paradas, em metros
+--------------------------------------------------------------------------
+Uma ``cKDTree`` sobre as paradas na esfera unitária (x, y, z), montada uma
+vez por conjunto de paradas e reaproveitada por todas as consultas do
+processo. Como as paradas são recarregadas quando a versão do feed muda
+(``obter_paradas``), um feed novo gera um índice novo; os antigos saem do
+cache (LRU de ``MAX_INDICES``).
+
+Na esfera unitária a distância euclidiana é a corda ``2·sen(d / 2R)``, que
+cresce junto com a distância sobre a superfície: o raio em metros vira um
+raio de corda exato, sem o erro de tratar graus de longitude como graus de
+latitude (em São Paulo, ~8 % a menos por grau).
+"""
+
+MAX_INDICES = 4
+
+
+@dataclass(slots=True)
+class IndiceParadas:
+    paradas: Paradas
+    pontos: np.ndarray               # float64 (n, 3), esfera unitária
+    arvore: cKDTree
+
+    def __len__(self):
+        return len(self.pontos)
+
+    def no_raio(self, lat: float, lon: float, raio_m: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(paradas, metros) a até ``raio_m`` do ponto."""
+        _, idx, dist = self.no_raio_lote([lat], [lon], raio_m)
+        return idx, dist
+
+    def no_raio_lote(self, lats, lons, raio_m: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Paradas a até ``raio_m`` de cada origem, em CSR.
+
+        As paradas da origem k são ``idx[inicio[k]:inicio[k + 1]]`` e as
+        distâncias (m) ``dist[inicio[k]:inicio[k + 1]]``.
+        """
+        origens = xyz(np.atleast_1d(lats), np.atleast_1d(lons))
+        vizinhas = self.arvore.query_ball_point(origens, r=float(corda(raio_m)), return_sorted=True)
+        contagem = np.fromiter((len(v) for v in vizinhas), dtype=np.int64, count=len(vizinhas))
+        inicio = np.zeros(len(vizinhas) + 1, dtype=np.int64)
+        np.cumsum(contagem, out=inicio[1:])
+        if not inicio[-1]:
+            return inicio, np.zeros(0, dtype=np.int64), np.zeros(0)
+        idx = np.fromiter((i for v in vizinhas for i in v), dtype=np.int64, count=int(inicio[-1]))
+        dono = np.repeat(np.arange(len(vizinhas)), contagem)
+        dist = metros(np.linalg.norm(self.pontos[idx] - origens[dono], axis=1))
+        return inicio, idx, dist
+
+    def pares(self, raio_m: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(i, j, metros) de cada par de paradas a até ``raio_m`` (i < j)."""
+        p = self.arvore.query_pairs(float(corda(raio_m)), output_type="ndarray")
+        i, j = p[:, 0], p[:, 1]
+        return i, j, metros(np.linalg.norm(self.pontos[i] - self.pontos[j], axis=1))
+
+
+# ------------------------------------------------------------
+# Cache do processo
+# ------------------------------------------------------------
+# chave = id das paradas; a entrada guarda o próprio objeto, então o id
+# não é reaproveitado enquanto ela estiver no cache
+_indices: "OrderedDict[int, IndiceParadas]" = OrderedDict()
+_indices_lock = threading.Lock()
+
+
+def registrar(paradas: Paradas, pontos: Optional[np.ndarray] = None) -> IndiceParadas:
+    """Monta o índice das paradas; ``pontos`` já calculados (arquivo da grade) são usados direto."""
+    if pontos is None:
+        pontos = xyz(paradas.lat, paradas.lon)
+    indice = IndiceParadas(paradas, pontos, cKDTree(pontos))
+    with _indices_lock:
+        _indices[id(paradas)] = indice
+        _indices.move_to_end(id(paradas))
+        while len(_indices) > MAX_INDICES:
+            _indices.popitem(last=False)
+    return indice
+
+
+def obter_indice(paradas: Paradas) -> IndiceParadas:
+    with _indices_lock:
+        indice = _indices.get(id(paradas))
+        if indice is not None and indice.paradas is paradas:
+            _indices.move_to_end(id(paradas))
+            return indice
+    return registrar(paradas)
@@ -0,0 +1,252 @@
+import json
+import struct
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from django.conf import settings
+from shapely.geometry import mapping
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+"""
+isocrona.py — Polígonos de isócrona a partir do earliest‑arrival
+--------------------------------------------------------------------------
+Cada parada alcançada em ``t`` minutos vira um círculo de caminhada com
+raio proporcional ao tempo que sobra até o limiar. Várias faixas
+(10/20/30… min) saem de uma única busca:
+
+    área(T_k) = buffer(área(T_{k-1}), (T_k − T_{k-1})·v)
+                ∪ círculos das paradas com t ∈ (T_{k-1}, T_k]
+
+O buffer de uma união de círculos é a união dos círculos aumentados, então
+a faixa seguinte reaproveita a anterior em vez de unir tudo de novo, e as
+faixas saem naturalmente aninhadas.
+
+Tudo é vetorizado com shapely 2.x: buffers de todos os pontos num array,
+união em cascata por blocos da grade e reprojeção dos vetores de
+coordenadas inteiros pelo pyproj.
+
+``superficie_tempos`` gera, em vez de polígonos, uma grade de tempo de
+viagem (minutos) por célula — ver o formato em ``serializar_grade``.
+"""
+
+RAIO_MINIMO_M = 10                 # ignora buffers minúsculos
+SEGMENTOS_QUADRANTE = 8            # círculos de 32 segmentos
+BLOCO_UNIAO_M = 2000               # lado dos blocos da união em cascata
+GRADE_MAGICO = b"RGRD"
+GRADE_SEM_DADO = np.iinfo(np.uint16).max
+GRADE_MAX_CELULAS = 4_000_000      # ~8 MB de resposta; acima disso, ValueError
+GRADE_CELULAS_CONSULTA = 262_144   # células por consulta à KD-tree
+GRADE_VIZINHOS = 4                 # paradas por célula na 1ª consulta (dobra se preciso)
+
+
+def _metros_por_min(velocidade_kmh: float) -> float:
+    return velocidade_kmh * 1000 / 60
+
+
+def _tolerancia_padrao() -> float:
+    return float(getattr(settings, "RAIO_SIMPLIFICACAO_M", 0))
+
+
+def uniao_por_blocos(geoms: np.ndarray, xs: np.ndarray, ys: np.ndarray, bloco_m: float = BLOCO_UNIAO_M):
+    """União em cascata: primeiro dentro de cada bloco da grade, depois dos blocos.
+
+    Círculos de blocos distantes nunca se tocam, então unir por bloco evita
+    que o GEOS compare tudo com tudo numa única união gigante.
+    """
+    if not len(geoms):
+        return None
+    chave = np.floor(xs / bloco_m).astype(np.int64) * 1_000_003 + np.floor(ys / bloco_m).astype(np.int64)
+    ordem = np.argsort(chave, kind="stable")
+    cortes = np.flatnonzero(np.diff(chave[ordem])) + 1
+    blocos = [shapely.union_all(geoms[g]) for g in np.split(ordem, cortes)]
+    return shapely.union_all(blocos)
+
+
+def _para_graus(geom, to_deg: Transformer):
+    """Reprojeta todas as coordenadas de uma vez (sem callback por ponto)."""
+    def fn(xy):
+        x, y = to_deg.transform(xy[:, 0], xy[:, 1])
+        return np.column_stack((x, y))
+    return shapely.transform(geom, fn)
+
+
+def areas_por_faixa(
+    lon: np.ndarray,
+    lat: np.ndarray,
+    tempos_min: np.ndarray,
+    limiares: Sequence[float],
+    velocidade_kmh: float,
+    tolerancia_m: Optional[float] = None,
+) -> List[Tuple[float, object]]:
+    """[(limiar, geometria WGS‑84)] em ordem crescente de limiar.
+
+    ``tempos_min`` é o tempo de viagem (min) até cada parada em ``lon``/``lat``.
+    ``tolerancia_m`` simplifica os polígonos (em metros) antes de reprojetar;
+    ``None`` usa ``RAIO_SIMPLIFICACAO_M``.
+    """
+    to_m = Transformer.from_crs("epsg:4326", "epsg:3857", always_xy=True)
+    to_deg = Transformer.from_crs("epsg:3857", "epsg:4326", always_xy=True)
+    v = _metros_por_min(velocidade_kmh)
+    if tolerancia_m is None:
+        tolerancia_m = _tolerancia_padrao()
+
+    ordem = np.argsort(tempos_min, kind="stable")
+    xs, ys = to_m.transform(np.asarray(lon)[ordem], np.asarray(lat)[ordem])
+    tempos = np.asarray(tempos_min)[ordem]
+    pontos = shapely.points(xs, ys)
+
+    faixas = []
+    area_m = None
+    anterior = None
+    feito = 0
+    for limiar in sorted(set(limiares)):
+        ate = int(np.searchsorted(tempos, limiar, side="right"))
+        novos = slice(feito, ate)
+        raios = np.maximum((limiar - tempos[novos]) * v, RAIO_MINIMO_M)
+        circulos = shapely.buffer(pontos[novos], raios, quad_segs=SEGMENTOS_QUADRANTE)
+        partes = [uniao_por_blocos(circulos, xs[novos], ys[novos])]
+        if area_m is not None:
+            partes.append(shapely.buffer(area_m, (limiar - anterior) * v, quad_segs=SEGMENTOS_QUADRANTE))
+        partes = [p for p in partes if p is not None]
+        if partes:
+            area_m = shapely.union_all(partes)
+            saida = shapely.simplify(area_m, tolerancia_m) if tolerancia_m > 0 else area_m
+            faixas.append((limiar, _para_graus(saida, to_deg)))
+        feito, anterior = ate, limiar
+    return faixas
+
+
+def features_poligonos(faixas: List[Tuple[float, object]]) -> List[dict]:
+    """Decompõe MultiPolygons em features distintas, uma faixa após a outra."""
+    features = []
+    for limiar, area in faixas:
+        if area.geom_type == "Polygon":
+            polys = [area]
+        elif area.geom_type == "MultiPolygon":
+            polys = list(area.geoms)
+        else:
+            polys = []
+        features.extend(
+            {
+                "type": "Feature",
+                "geometry": mapping(p),
+                "properties": {"tipo": "isocrona", "tempo_min": limiar},
+            }
+            for p in polys
+        )
+    return features
+
+
+# ------------------------------------------------------------
+# Saída em grade (raster)
+# ------------------------------------------------------------
+
+def superficie_tempos(
+    lon: np.ndarray,
+    lat: np.ndarray,
+    tempos_min: np.ndarray,
+    origem: Tuple[float, float],
+    max_minutos: float,
+    velocidade_kmh: float,
+    resolucao_m: float = 100,
+) -> Tuple[np.ndarray, dict]:
+    """Tempo mínimo (parada + caminhada) até cada célula de uma grade.
+
+    A grade está em EPSG:3857, com o passo ajustado para ``resolucao_m``
+    metros reais na latitude da origem. A origem entra como uma "parada"
+    com tempo zero. Retorna (matriz uint16 em minutos, cabeçalho);
+    ``GRADE_SEM_DADO`` marca células não alcançadas.
+
+    Memória proporcional à grade (no máximo ``GRADE_MAX_CELULAS``), não ao
+    número de pares parada × célula: as células consultam a KD-tree das
+    paradas em blocos de ``GRADE_CELULAS_CONSULTA``.
+    """
+    if resolucao_m <= 0:
+        raise ValueError("resolucao_m deve ser positiva")
+    to_m = Transformer.from_crs("epsg:4326", "epsg:3857", always_xy=True)
+    v = _metros_por_min(velocidade_kmh)
+    escala = 1 / np.cos(np.radians(origem[1]))      # metros reais → metros 3857
+    passo = resolucao_m * escala
+
+    lon = np.append(np.asarray(lon, dtype=np.float64), origem[0])
+    lat = np.append(np.asarray(lat, dtype=np.float64), origem[1])
+    tempos = np.append(np.asarray(tempos_min, dtype=np.float64), 0.0)
+    xs, ys = to_m.transform(lon, lat)
+    raios = (max_minutos - tempos) * v * escala      # alcance a pé em unidades 3857
+
+    x0 = np.floor((xs - raios).min() / passo) * passo
+    y1 = np.ceil((ys + raios).max() / passo) * passo
+    largura = int(np.ceil(((xs + raios).max() - x0) / passo))
+    altura = int(np.ceil((y1 - (ys - raios).min()) / passo))
+
+    if largura * altura > GRADE_MAX_CELULAS:
+        raise ValueError(
+            f"grade de {largura}×{altura} células; aumente resolucao_m (máximo {GRADE_MAX_CELULAS:,} células)"
+        )
+
+    # Coordenadas já em "minutos a pé": tempo na célula = t_parada + distância
+    por_min = 1 / (v * escala)
+    cx = (np.arange(largura) + 0.5) * passo * por_min
+    cy = (np.arange(altura) + 0.5) * passo * por_min
+    px, py = (xs - x0) * por_min, (y1 - ys) * por_min
+
+    # KD-tree das paradas em (x, y, t), consultada a partir dos centros das
+    # células (x, y, 0). A distância nesse espaço, √(d² + t²), não passa de
+    # t + d: se a k-ésima parada mais próxima já está a ``max_minutos`` ou
+    # a mais que o melhor tempo achado, nenhuma das seguintes ganha. Senão a
+    # célula volta com 2k.
+    alcance = tempos < max_minutos
+    pontos = np.column_stack((px[alcance], py[alcance]))
+    arvore = cKDTree(np.column_stack((pontos, tempos[alcance])))
+    pontos = np.vstack((pontos, [np.inf, np.inf]))  # índice n = vizinho ausente
+    n = len(pontos) - 1
+    melhor = np.full(largura * altura, np.inf)
+    for ini in range(0, largura * altura if n else 0, GRADE_CELULAS_CONSULTA):
+        pendentes = np.arange(ini, min(ini + GRADE_CELULAS_CONSULTA, largura * altura))
+        k = GRADE_VIZINHOS
+        while len(pendentes):
+            k = min(k, n)
+            centros = np.column_stack((cx[pendentes % largura], cy[pendentes // largura]))
+            dist, j = arvore.query(np.column_stack((centros, np.zeros(len(centros)))), k=k,
+                                   distance_upper_bound=max_minutos)
+            dist, j = dist.reshape(-1, k), j.reshape(-1, k)
+            d = np.hypot(pontos[j, 0] - centros[:, :1], pontos[j, 1] - centros[:, 1:])
+            t = (d + arvore.data[np.minimum(j, n - 1), 2]).min(axis=1)
+            melhor[pendentes] = t
+            pendentes = pendentes[(dist[:, -1] < t) & (k < n)]
+            k *= 2
+
+    minutos = np.full(largura * altura, GRADE_SEM_DADO, dtype=np.uint16)
+    ok = melhor <= max_minutos
+    minutos[ok] = np.ceil(melhor[ok]).astype(np.uint16)
+
+    cabecalho = {
+        "formato": "raio-grade-v1",
+        "largura": largura,
+        "altura": altura,
+        "crs": "EPSG:3857",
+        # GDAL: (x0, dx, 0, y0, 0, -dy)
+        "geotransform": [float(x0), float(passo), 0.0, float(y1), 0.0, -float(passo)],
+        "resolucao_m": resolucao_m,
+        "dtype": "uint16",
+        "nodata": int(GRADE_SEM_DADO),
+        "unidade": "min",
+    }
+    return minutos.reshape(altura, largura), cabecalho
+
+
+def serializar_grade(minutos: np.ndarray, cabecalho: dict) -> bytes:
+    """``RGRD`` + uint32 LE (tamanho do cabeçalho) + cabeçalho JSON + matriz uint16 LE."""
+    cab = json.dumps(cabecalho, separators=(",", ":")).encode()
+    return GRADE_MAGICO + struct.pack("<I", len(cab)) + cab + minutos.astype("<u2").tobytes()
+
+
+def ler_grade(dados: bytes) -> Tuple[np.ndarray, dict]:
+    if dados[:4] != GRADE_MAGICO:
+        raise ValueError("não é uma grade RGRD")
+    (n,) = struct.unpack("<I", dados[4:8])
+    cabecalho = json.loads(dados[8:8 + n])
+    minutos = np.frombuffer(dados, dtype="<u2", offset=8 + n)
+    return minutos.reshape(cabecalho["altura"], cabecalho["largura"]), cabecalho
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from transporte.algorithms.esfera import metros, xyz
+from transporte.algorithms.grade_horaria import Paradas, diretorio_cache
+from transporte.algorithms.grafo_osm import caminho_graphml, compilar
+from transporte.algorithms.indice_paradas import obter_indice
+
+"""
+malha_viaria.py — Caminhada pela malha de ruas (OSM) com Dijkstra esparso
+--------------------------------------------------------------------------
+O graphml em ``RAIO_GRAFO_CAMINHADA`` (gravado por ``utils/baixar_osm.py``) é lido
+uma única vez (``grafo_osm.compilar``: ``xml.etree.iterparse``, sem NetworkX)
+e compilado numa matriz CSR de distâncias em metros, salva em
+``RAIO_CACHE_DIR``:
+
+• arestas paralelas ficam com o menor comprimento; a malha é simétrica
+  (caminhada vale nos dois sentidos);
+• paradas e origens são encaixadas no nó mais próximo (cKDTree na esfera
+  unitária) e a distância até o nó entra na conta;
+• transferências entre paradas e acesso a partir da origem saem de
+  ``scipy.sparse.csgraph.dijkstra`` com ``limit`` no raio de caminhada,
+  em lotes de origens.
+
+Sem o arquivo (``RAIO_GRAFO_CAMINHADA``) continua valendo a distância em
+linha reta.
+"""
+
+LOTE_DIJKSTRA = 16                 # origens por chamada (saída é densa: lote × nós)
+
+
+@dataclass(slots=True)
+class MalhaViaria:
+    assinatura: str
+    matriz: csr_matrix               # metros entre nós vizinhos (simétrica)
+    lat: np.ndarray                  # float64, por nó
+    lon: np.ndarray
+    arvore: cKDTree                  # nós na esfera unitária
+
+    def __len__(self):
+        return self.matriz.shape[0]
+
+    def encaixar(self, lat, lon) -> Tuple[np.ndarray, np.ndarray]:
+        """Nó mais próximo de cada ponto e a distância (m) até ele."""
+        corda, nos = self.arvore.query(xyz(np.atleast_1d(lat), np.atleast_1d(lon)))
+        return nos.astype(np.int64), metros(corda)
+
+    def distancias(self, nos: np.ndarray, limite_m: float) -> np.ndarray:
+        """Dijkstra a partir de ``nos`` (uma linha por nó, inf além do limite)."""
+        return dijkstra(self.matriz, directed=False, indices=nos, limit=limite_m)
+
+
+# ------------------------------------------------------------
+# Persistência + cache do processo
+# ------------------------------------------------------------
+
+def _assinatura(caminho: Path) -> str:
+    st = caminho.stat()
+    return hashlib.sha1(f"{caminho.resolve()}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()[:16]
+
+
+def _montar(assinatura: str, indptr, indices, dados, lat, lon) -> MalhaViaria:
+    n = len(lat)
+    matriz = csr_matrix((dados.astype(np.float64), indices, indptr), shape=(n, n))
+    return MalhaViaria(assinatura, matriz, lat, lon, cKDTree(xyz(lat, lon)))
+
+
+def carregar_ou_compilar(caminho: Path, recompilar: bool = False) -> MalhaViaria:
+    assinatura = _assinatura(caminho)
+    compilado = diretorio_cache() / f"malha_{assinatura}.npz"
+    if compilado.exists() and not recompilar:
+        with np.load(compilado) as z:
+            return _montar(assinatura, z["indptr"], z["indices"], z["dados"], z["lat"], z["lon"])
+
+    indptr, indices, dados, lat, lon = compilar(caminho)
+    compilado.parent.mkdir(parents=True, exist_ok=True)
+    tmp = compilado.with_suffix(".tmp.npz")
+    np.savez(tmp, indptr=indptr, indices=indices, dados=dados, lat=lat, lon=lon)
+    os.replace(tmp, compilado)
+    return _montar(assinatura, indptr, indices, dados, lat, lon)
+
+
+_malha: Optional[MalhaViaria] = None
+_malha_lock = threading.Lock()
+_encaixe: Tuple = (None, None)     # (paradas, malha) → (nós, metros até o nó)
+
+
+def obter_malha() -> Optional[MalhaViaria]:
+    """Malha de caminhada do processo (``None`` sem ``RAIO_GRAFO_CAMINHADA``)."""
+    global _malha
+    caminho = caminho_graphml()
+    if caminho is None or not caminho.exists():
+        return None
+    with _malha_lock:
+        if _malha is None or _malha.assinatura != _assinatura(caminho):
+            _malha = carregar_ou_compilar(caminho)
+        return _malha
+
+
+def encaixar_paradas(malha: MalhaViaria, paradas: Paradas) -> Tuple[np.ndarray, np.ndarray]:
+    global _encaixe
+    with _malha_lock:
+        if _encaixe[0] is not None and _encaixe[0][0] is paradas and _encaixe[0][1] is malha:
+            return _encaixe[1]
+    nos = malha.encaixar(paradas.lat, paradas.lon)
+    with _malha_lock:
+        _encaixe = ((paradas, malha), nos)
+    return nos
+
+
+# ------------------------------------------------------------
+# Consultas
+# ------------------------------------------------------------
+
+def pares_a_pe(malha: MalhaViaria, paradas: Paradas, raio_m: float):
+    """(i, j, metros) de todos os pares de paradas a até ``raio_m`` pela malha.
+
+    Paradas no mesmo nó saem de uma só linha do Dijkstra; a distância de
+    encaixe das duas pontas é somada ao caminho. Só as paradas a até
+    ``raio_m`` em linha reta (``IndiceParadas.no_raio_lote``) são lidas da
+    saída do Dijkstra — pelas ruas nunca é mais perto que em linha reta.
+    """
+    nos, encaixe = encaixar_paradas(malha, paradas)
+    unicos, grupo = np.unique(nos, return_inverse=True)
+    ordem = np.argsort(grupo, kind="stable")
+    inicio = np.searchsorted(grupo[ordem], np.arange(len(unicos) + 1))
+    indice = obter_indice(paradas)
+
+    pi, pj, pm = [], [], []
+    for a in range(0, len(unicos), LOTE_DIJKSTRA):
+        b = min(a + LOTE_DIJKSTRA, len(unicos))
+        membros = ordem[inicio[a]:inicio[b]]                         # paradas dos nós do lote
+        folga = raio_m - encaixe[membros].min()
+        if folga < 0:
+            continue
+        dist = malha.distancias(unicos[a:b], folga)                  # lote × nós
+        cand_ini, cand, _ = indice.no_raio_lote(paradas.lat[membros], paradas.lon[membros], raio_m)
+        dono = np.repeat(np.arange(len(membros)), np.diff(cand_ini))
+        i, j = membros[dono], cand
+        outra = i != j
+        i, j = i[outra], j[outra]
+        total = encaixe[i] + dist[grupo[i] - a, nos[j]] + encaixe[j]
+        perto = total <= raio_m
+        pi.append(i[perto])
+        pj.append(j[perto])
+        pm.append(total[perto])
+    if not pi:
+        vazio = np.zeros(0, dtype=np.int64)
+        return vazio, vazio, np.zeros(0)
+    return np.concatenate(pi), np.concatenate(pj), np.concatenate(pm)
+
+
+def acesso_a_pe(malha: MalhaViaria, paradas: Paradas, lat: float, lon: float, raio_m: float) -> np.ndarray:
+    """Metros a pé da origem até cada parada pela malha (inf além de ``raio_m``)."""
+    no, encaixe_o = malha.encaixar(lat, lon)
+    nos, encaixe = encaixar_paradas(malha, paradas)
+    if encaixe_o[0] > raio_m:
+        return np.full(len(paradas), np.inf)
+    dist = malha.distancias(no[0], raio_m - encaixe_o[0])
+    total = encaixe_o[0] + dist[nos] + encaixe
+    total[total > raio_m] = np.inf
+    return total
@@ -0,0 +1,314 @@
+import threading
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from transporte.algorithms.csa import Vizinhos, relaxar_caminhadas
+from transporte.algorithms.grade_horaria import GradeHoraria
+
+"""
+raptor.py — RAPTOR (Round‑bAsed Public Transit Optimized Router)
+--------------------------------------------------------------------------
+Alternativa ao CSA que percorre padrões de linha em vez de conexões
+soltas. Um padrão é o conjunto de viagens de uma mesma ``Route`` com a
+mesma sequência de paradas; seus horários ficam em matrizes
+(viagens × paradas) ordenadas por partida.
+
+Cada rodada k:
+  1. junta os padrões que passam por paradas marcadas na rodada anterior
+     (a partir da posição mais cedo marcada);
+  2. percorre cada padrão uma única vez, embarcando na primeira viagem
+     possível e trocando para uma anterior quando der;
+  3. relaxa as caminhadas a partir das paradas que melhoraram.
+
+Viagens por headway formam ``PadraoFrequencia`` (deslocamentos + períodos):
+a primeira viagem em cada parada é calculada, não procurada numa matriz.
+
+Rodada k = no máximo k‑1 transferências. A busca termina quando nenhuma
+parada melhora ou ao atingir ``max_transferencias``.
+"""
+
+
+# ------------------------------------------------------------
+# Estruturas
+# ------------------------------------------------------------
+@dataclass(slots=True)
+class Padrao:
+    route_id: str
+    paradas: np.ndarray              # int32, sequência de paradas
+    dep: np.ndarray                  # int32 (viagens × paradas), colunas ordenadas
+    arr: np.ndarray                  # int32 (viagens × paradas)
+
+
+@dataclass(slots=True)
+class PadraoFrequencia:
+    route_id: str
+    paradas: np.ndarray              # int32, sequência de paradas
+    dep: np.ndarray                  # int32, minutos após o início da viagem
+    arr: np.ndarray                  # int32
+    inicio: np.ndarray               # int32, por período: primeira partida
+    fim: np.ndarray                  # int32, última partida
+    headway: np.ndarray              # int32, minutos
+
+
+@dataclass(slots=True)
+class Padroes:
+    # ``Padrao`` primeiro, ``PadraoFrequencia`` depois
+    lista: List[Union[Padrao, PadraoFrequencia]]
+    # parada s → (padrão, posição) em ``por_parada[inicio[s]:inicio[s + 1]]``
+    inicio: np.ndarray               # int64, len = n_paradas + 1
+    por_parada: np.ndarray           # int32 (n, 2)
+
+    def de_parada(self, s: int) -> List[Tuple[int, int]]:
+        return [tuple(x) for x in self.por_parada[self.inicio[s]:self.inicio[s + 1]].tolist()]
+
+
+# ------------------------------------------------------------
+# Construção dos padrões a partir da grade do dia
+# ------------------------------------------------------------
+
+def _separar_fifo(dep: np.ndarray, arr: np.ndarray) -> List[np.ndarray]:
+    """Divide viagens que se ultrapassam em subpadrões FIFO.
+
+    A busca da primeira viagem em cada parada assume que as colunas de
+    ``dep``/``arr`` estão ordenadas; viagens que ultrapassam outras vão
+    para outro subpadrão.
+    """
+    ordem = np.lexsort((arr[:, -1], dep[:, 0]))
+    grupos: List[List[int]] = []
+    for v in ordem.tolist():
+        for g in grupos:
+            u = g[-1]
+            if (dep[v] >= dep[u]).all() and (arr[v] >= arr[u]).all():
+                g.append(v)
+                break
+        else:
+            grupos.append([v])
+    return [np.asarray(g) for g in grupos]
+
+
+def montar_padroes(grade: GradeHoraria) -> Padroes:
+    """Padrões a partir só da grade (``route_ids`` vêm junto das viagens)."""
+    # Conexões agrupadas por viagem, na ordem do percurso
+    ordem = np.lexsort((grade.arr_min, grade.dep_min, grade.trip))
+    trip = grade.trip[ordem]
+    cortes = np.flatnonzero(np.diff(trip)) + 1
+    inicios = np.concatenate(([0], cortes))
+    fins = np.concatenate((cortes, [len(trip)]))
+
+    grupos: Dict[tuple, List[int]] = defaultdict(list)  # (route, paradas) → viagens
+    horarios = []
+    for v, (a, b) in enumerate(zip(inicios.tolist(), fins.tolist())):
+        cs = ordem[a:b]
+        paradas = (int(grade.dep_stop[cs[0]]),) + tuple(grade.arr_stop[cs].tolist())
+        dep = np.append(grade.dep_min[cs], grade.arr_min[cs[-1]])
+        arr = np.insert(grade.arr_min[cs], 0, grade.dep_min[cs[0]])
+        horarios.append((dep, arr))
+        route_id = grade.route_ids[trip[a]]
+        grupos[(route_id, paradas)].append(v)
+
+    lista: List[Padrao] = []
+    for (route_id, paradas), viagens in grupos.items():
+        dep = np.stack([horarios[v][0] for v in viagens]).astype(np.int32)
+        arr = np.stack([horarios[v][1] for v in viagens]).astype(np.int32)
+        for sub in _separar_fifo(dep, arr):
+            lista.append(Padrao(route_id, np.asarray(paradas, dtype=np.int32), dep[sub], arr[sub]))
+
+    # Viagens por headway: um padrão por (molde, rota) com todos os períodos
+    fq = grade.frequencias
+    periodos: Dict[tuple, List[int]] = defaultdict(list)
+    for e, (k, route_id) in enumerate(zip(fq.padrao.tolist(), fq.route_ids)):
+        periodos[(k, route_id)].append(e)
+    for (k, route_id), es in periodos.items():
+        a, b = int(fq.ini[k]), int(fq.ini[k + 1])
+        lista.append(PadraoFrequencia(
+            route_id, fq.paradas[a:b], fq.dep_off[a:b], fq.arr_off[a:b],
+            fq.inicio[es], fq.fim[es], fq.headway[es],
+        ))
+
+    pares = [(s, p, pos) for p, pad in enumerate(lista) for pos, s in enumerate(pad.paradas.tolist())]
+    pares.sort()
+    n = len(grade.paradas)
+    origem = np.fromiter((s for s, _, _ in pares), dtype=np.int64, count=len(pares))
+    inicio = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(origem, minlength=n), out=inicio[1:])
+    por_parada = np.array([(p, pos) for _, p, pos in pares], dtype=np.int32).reshape(-1, 2)
+    return Padroes(lista, inicio, por_parada)
+
+
+_padroes: "weakref.WeakKeyDictionary[GradeHoraria, Padroes]" = weakref.WeakKeyDictionary()
+_padroes_lock = threading.Lock()
+
+
+def registrar_padroes(grade: GradeHoraria, padroes: Padroes):
+    """Usa padrões já prontos (ex.: lidos do arquivo compilado) para a grade."""
+    with _padroes_lock:
+        _padroes[grade] = padroes
+
+
+def obter_padroes(grade: GradeHoraria) -> Padroes:
+    """Padrões da grade; somem junto com ela quando a grade sai do cache."""
+    with _padroes_lock:
+        padroes = _padroes.get(grade)
+        if padroes is None:
+            padroes = _padroes[grade] = montar_padroes(grade)
+        return padroes
+
+
+# ------------------------------------------------------------
+# Algoritmo
+# ------------------------------------------------------------
+
+def _percorrer(pad: Padrao, pos: int, tau: np.ndarray, t_max: float, horizonte: float):
+    """(posições i com viagem em uso, chegada em i + 1) percorrendo a partir de ``pos``."""
+    dep = pad.dep[:, pos:]
+    n_viagens = dep.shape[0]
+
+    # primeira viagem com partida ≥ tau em cada parada (colunas ordenadas)
+    embarque = (dep < tau).sum(axis=0)
+    embarque[tau > t_max] = n_viagens
+    ok = embarque < n_viagens
+    ok[ok] = dep[embarque[ok], np.flatnonzero(ok)] <= horizonte
+    embarque[~ok] = n_viagens
+
+    # viagem em uso ao chegar na parada i = a mais cedo embarcada antes de i
+    viagem = np.minimum.accumulate(embarque)[:-1]
+    validas = np.flatnonzero(viagem < n_viagens)
+    return validas, pad.arr[viagem[validas], pos + validas + 1]
+
+
+def _percorrer_frequencia(pad: PadraoFrequencia, pos: int, tau: np.ndarray, t_max: float, horizonte: float):
+    """Como ``_percorrer``, com a viagem seguinte a ``tau`` calculada por período:
+    ``inicio + ceil((tau − dep − inicio) / headway) · headway``.
+    """
+    dep = pad.dep[pos:].astype(np.float64)
+    alvo = tau[None, :] - dep[None, :] - pad.inicio[:, None]
+    h = pad.headway[:, None]
+    base = pad.inicio[:, None] + np.maximum(0, np.ceil(alvo / h)) * h
+    ok = (base <= pad.fim[:, None]) & (base + dep[None, :] <= horizonte) & (tau <= t_max)[None, :]
+
+    # viagem em uso em i = a que começou mais cedo entre as embarcáveis antes de i
+    base = np.minimum.accumulate(np.where(ok, base, np.inf).min(axis=0))[:-1]
+    validas = np.flatnonzero(np.isfinite(base))
+    return validas, base[validas] + pad.arr[pos + validas + 1]
+
+
+def rotear(
+    padroes: Padroes,
+    eat: np.ndarray,
+    t_max: float,
+    horizonte: float,
+    vizinhos: Vizinhos,
+    max_transferencias: Optional[int] = None,
+    origens: Optional[List[int]] = None,
+) -> np.ndarray:
+    """Earliest‑arrival por parada com RAPTOR (modifica e retorna ``eat``).
+
+    ``eat`` chega preenchido com os tempos de chegada a pé desde a origem.
+    ``max_transferencias=None`` roda até não haver mais melhoria.
+    ``origens`` restringe as paradas marcadas na largada (usado pelo
+    rRAPTOR, em que ``eat`` já traz rótulos de partidas posteriores).
+    """
+    tempos = eat.tolist()
+    if origens is None:
+        origens = np.flatnonzero(np.isfinite(eat)).tolist()
+    marcadas = set(origens) | set(relaxar_caminhadas(tempos, origens, t_max, vizinhos))
+
+    rodadas = len(padroes.lista) + 1 if max_transferencias is None else max_transferencias + 1
+    for _ in range(rodadas):
+        if not marcadas:
+            break
+
+        # 1) padrões a percorrer, cada um a partir da posição marcada mais cedo
+        fila: Dict[int, int] = {}
+        for s in marcadas:
+            for p, pos in padroes.de_parada(s):
+                if pos < fila.get(p, pos + 1):
+                    fila[p] = pos
+
+        # 2) percorre os padrões; embarque usa os tempos da rodada anterior
+        anterior = np.asarray(tempos)
+        melhoradas = []
+        for p, pos in fila.items():
+            pad = padroes.lista[p]
+            paradas = pad.paradas[pos:]
+            percorrer = _percorrer_frequencia if isinstance(pad, PadraoFrequencia) else _percorrer
+            validas, chegadas = percorrer(pad, pos, anterior[paradas], t_max, horizonte)
+            for s, a in zip(paradas[validas + 1].tolist(), chegadas.tolist()):
+                if a < tempos[s]:
+                    tempos[s] = a
+                    if a <= t_max:
+                        melhoradas.append(s)
+
+        # 3) caminhadas a partir de quem melhorou
+        marcadas = set(melhoradas)
+        marcadas.update(relaxar_caminhadas(tempos, melhoradas, t_max, vizinhos))
+
+    eat[:] = tempos
+    return eat
+
+
+# ------------------------------------------------------------
+# Perfil (rRAPTOR) — várias partidas numa janela
+# ------------------------------------------------------------
+@dataclass(slots=True)
+class Perfil:
+    partidas: np.ndarray             # int32, minutos (ordem crescente)
+    viagem_min: np.ndarray           # float32 (partidas × paradas), inf = não alcança
+
+    def estatisticas(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Tempo mínimo, mediano e máximo de viagem por parada na janela."""
+        v = self.viagem_min
+        return v.min(axis=0), np.median(v, axis=0), v.max(axis=0)
+
+    def pareto(self, s: int) -> List[Tuple[int, float]]:
+        """Pares (partida, chegada) não dominados para a parada ``s``."""
+        chegadas = self.partidas + self.viagem_min[:, s]
+        pares, melhor = [], np.inf
+        for d, a in zip(self.partidas[::-1].tolist(), chegadas[::-1].tolist()):
+            if a < melhor:
+                pares.append((d, a))
+                melhor = a
+        return pares[::-1]
+
+
+def perfil(
+    padroes: Padroes,
+    caminhada_min: np.ndarray,
+    partidas: np.ndarray,
+    max_minutos: float,
+    margem_min: float,
+    vizinhos: Vizinhos,
+    max_transferencias: Optional[int] = None,
+) -> Perfil:
+    """rRAPTOR: roda as partidas da mais tardia para a mais cedo.
+
+    Sem limite de transferências os rótulos de uma partida continuam
+    válidos para a anterior (basta esperar), então cada rodada só explora
+    o que melhorou — a janela inteira custa pouco mais que uma consulta.
+    Com limite, os rótulos são refeitos a cada partida para não misturar
+    caminhos com números diferentes de transferências.
+    """
+    partidas = np.sort(np.asarray(partidas, dtype=np.int32))
+    origens = np.flatnonzero(np.isfinite(caminhada_min))
+    viagem = np.full((len(partidas), len(caminhada_min)), np.inf, dtype=np.float32)
+    eat = np.full(len(caminhada_min), np.inf)
+
+    for i in range(len(partidas) - 1, -1, -1):
+        d = int(partidas[i])
+        if max_transferencias is not None:
+            eat.fill(np.inf)
+        chegada_pe = d + caminhada_min[origens]
+        melhora = chegada_pe < eat[origens]
+        eat[origens[melhora]] = chegada_pe[melhora]
+        rotear(
+            padroes, eat, d + max_minutos, d + max_minutos + margem_min, vizinhos,
+            max_transferencias, origens=origens[melhora].tolist(),
+        )
+        t = eat - d
+        viagem[i] = np.where(t <= max_minutos, t, np.inf)
+
+    return Perfil(partidas, viagem)
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from transporte.algorithms.grade_horaria import Paradas, diretorio_cache
+from transporte.algorithms.indice_paradas import obter_indice
+from transporte.algorithms.malha_viaria import MalhaViaria, obter_malha, pares_a_pe
+
+"""
+transferencias.py — Grafo de caminhada entre paradas pré‑computado
+--------------------------------------------------------------------------
+Todas as transferências a pé (from_stop, to_stop, minutos) dentro do raio
+máximo de caminhada, em formato CSR:
+
+    vizinhos de s  = destino[inicio[s]:inicio[s + 1]]
+    minutos de s   = minutos[inicio[s]:inicio[s + 1]]
+
+O grafo é salvo em ``RAIO_CACHE_DIR`` com o hash das paradas no nome do
+arquivo, então só é recalculado quando as paradas (ou os parâmetros de
+caminhada) mudam. Durante a busca não há nenhuma consulta espacial.
+
+Com a malha de ruas disponível (``malha_viaria``) a distância é a do
+caminho pelas ruas; sem ela, a distância em linha reta.
+"""
+
+
+@dataclass(slots=True)
+class Transferencias:
+    assinatura: str
+    inicio: np.ndarray               # int64, len = n_paradas + 1
+    destino: np.ndarray              # int32
+    minutos: np.ndarray              # float32
+
+    def __len__(self):
+        return len(self.destino)
+
+    def vizinhos(self, s: int) -> Tuple[List[int], List[float]]:
+        a, b = self.inicio[s], self.inicio[s + 1]
+        return self.destino[a:b].tolist(), self.minutos[a:b].tolist()
+
+
+# ------------------------------------------------------------
+# Construção
+# ------------------------------------------------------------
+
+def assinatura_paradas(paradas: Paradas, raio_m: float, velocidade_kmh: float, malha: Optional[MalhaViaria] = None) -> str:
+    h = hashlib.sha1()
+    h.update("\n".join(paradas.ids).encode())
+    h.update(np.ascontiguousarray(paradas.lat).tobytes())
+    h.update(np.ascontiguousarray(paradas.lon).tobytes())
+    h.update(f"{raio_m}:{velocidade_kmh}:{malha.assinatura if malha else 'reta'}".encode())
+    return h.hexdigest()[:16]
+
+
+def construir_transferencias(paradas: Paradas, raio_m: float, velocidade_kmh: float, malha: Optional[MalhaViaria] = None) -> Transferencias:
+    n = len(paradas)
+    if malha is not None:
+        # Dijkstra de cada parada já devolve os dois sentidos
+        origem, destino, dist = pares_a_pe(malha, paradas, raio_m)
+    else:
+        # pares já em metros, do índice espacial das paradas (cacheado)
+        i, j, dist = obter_indice(paradas).pares(raio_m)
+
+        # Caminhada é simétrica: guarda os dois sentidos
+        origem, destino, dist = np.concatenate((i, j)), np.concatenate((j, i)), np.concatenate((dist, dist))
+
+    destino = destino.astype(np.int32)
+    minutos = (dist / 1000 / velocidade_kmh * 60).astype(np.float32)
+
+    ordem = np.lexsort((minutos, origem))
+    inicio = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(origem, minlength=n), out=inicio[1:])
+    return Transferencias(
+        assinatura=assinatura_paradas(paradas, raio_m, velocidade_kmh, malha),
+        inicio=inicio,
+        destino=destino[ordem],
+        minutos=minutos[ordem],
+    )
+
+
+# ------------------------------------------------------------
+# Persistência + cache do processo
+# ------------------------------------------------------------
+
+def _arquivo(assinatura: str) -> Path:
+    return diretorio_cache() / f"transferencias_{assinatura}.npz"
+
+
+def salvar(transf: Transferencias):
+    destino = _arquivo(transf.assinatura)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    tmp = destino.with_suffix(".tmp.npz")
+    np.savez(tmp, inicio=transf.inicio, destino=transf.destino, minutos=transf.minutos)
+    os.replace(tmp, destino)
+
+
+def carregar(assinatura: str):
+    caminho = _arquivo(assinatura)
+    if not caminho.exists():
+        return None
+    with np.load(caminho) as z:
+        return Transferencias(assinatura, z["inicio"], z["destino"], z["minutos"])
+
+
+_cache: Dict[str, Transferencias] = {}
+_cache_lock = threading.Lock()
+_ultimo: Tuple = (None, None)  # (chave por identidade das paradas, transferências)
+
+
+def registrar(transf: Transferencias):
+    """Deixa em memória transferências já prontas (ex.: do arquivo compilado)."""
+    with _cache_lock:
+        _cache.setdefault(transf.assinatura, transf)
+
+
+def obter_transferencias(paradas: Paradas, raio_m: float, velocidade_kmh: float) -> Transferencias:
+    """Transferências das paradas: memória → disco → construção."""
+    global _ultimo
+    chave = (id(paradas), raio_m, velocidade_kmh)
+    with _cache_lock:
+        if _ultimo[0] == chave and _ultimo[1][0] is paradas:
+            return _ultimo[1][1]
+
+    malha = obter_malha()
+    assinatura = assinatura_paradas(paradas, raio_m, velocidade_kmh, malha)
+    with _cache_lock:
+        transf = _cache.get(assinatura)
+        if transf is None:
+            transf = carregar(assinatura)
+            if transf is None:
+                transf = construir_transferencias(paradas, raio_m, velocidade_kmh, malha)
+                salvar(transf)
+            _cache.clear()  # paradas mudaram: a versão anterior não serve mais
+            _cache[assinatura] = transf
+        _ultimo = (chave, (paradas, transf))
+        return transf
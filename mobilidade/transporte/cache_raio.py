@@ -0,0 +1,102 @@
+import hashlib
+import json
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+from transporte.algorithms.calcular_raio_csa import calcular_perfil, calcular_raio
+from transporte.algorithms.grade_horaria import versao_feed
+
+"""
+cache_raio.py — Cache de resultados de isócrona
+--------------------------------------------------------------------------
+A origem é "encaixada" no centro de uma célula de ``RAIO_CACHE_CELULA_M``
+metros e o cálculo usa esse centro, então todos os cliques dentro da mesma
+célula compartilham o resultado. A chave junta célula, parâmetros e a
+versão do feed — uma nova importação GTFS gera chaves novas e o que era
+antigo expira sozinho (TTL/``MAX_ENTRIES`` do backend ``raio``).
+
+Não há limpeza explícita: com ``LocMemCache`` cada processo tem o seu
+cache, e o importador não alcança os dos servidores. Cada processo relê a
+versão ativa no máximo a cada ``VERSAO_FEED_TTL_S`` (30 s); é essa a janela
+em que ainda pode servir resultados do feed anterior, seja qual for o
+backend configurado em ``CACHES["raio"]``.
+
+Os valores guardados já são o corpo da resposta serializado (JSON ou RGRD).
+"""
+
+ALIAS = "raio"
+METROS_POR_GRAU = 111_320
+
+
+def obter_cache():
+    try:
+        return caches[ALIAS]
+    except InvalidCacheBackendError:
+        return caches["default"]
+
+
+def celula(lat: float, lon: float, tamanho_m: float):
+    """(i, j, lat_centro, lon_centro) da célula que contém o ponto."""
+    passo_lat = tamanho_m / METROS_POR_GRAU
+    i = math.floor(lat / passo_lat)
+    lat_c = (i + 0.5) * passo_lat
+    # passo em longitude fixo por faixa de latitude, para a célula ser ~quadrada
+    passo_lon = tamanho_m / (METROS_POR_GRAU * math.cos(math.radians(lat_c)))
+    j = math.floor(lon / passo_lon)
+    return i, j, lat_c, (j + 0.5) * passo_lon
+
+
+def _chave(tipo: str, i: int, j: int, params: dict) -> str:
+    bruto = json.dumps([tipo, i, j, params, versao_feed()], sort_keys=True, default=str)
+    return f"raio:v1:{hashlib.sha1(bruto.encode()).hexdigest()}"
+
+
+def _tamanho_celula() -> float:
+    return float(getattr(settings, "RAIO_CACHE_CELULA_M", 100))
+
+
+def localizar(tipo, lat, lon, params):
+    """(chave no cache, lat/lon do centro da célula) de uma consulta."""
+    i, j, lat_c, lon_c = celula(lat, lon, _tamanho_celula())
+    return _chave(tipo, i, j, params), lat_c, lon_c
+
+
+def serializar(resultado) -> bytes:
+    return resultado if isinstance(resultado, bytes) else json.dumps(resultado).encode()
+
+
+def params_raio(max_min, dia, hora_ini_min, opcoes) -> dict:
+    return dict(opcoes, max_min=max_min, dia=dia, hora_ini_min=hora_ini_min)
+
+
+def params_perfil(max_min, dia, hora_ini_min, hora_fim_min, opcoes) -> dict:
+    return dict(opcoes, max_min=max_min, dia=dia, hora_ini_min=hora_ini_min, hora_fim_min=hora_fim_min)
+
+
+def _com_cache(tipo, lat, lon, params, calcular):
+    chave, lat_c, lon_c = localizar(tipo, lat, lon, params)
+    cache = obter_cache()
+    conteudo = cache.get(chave)
+    if conteudo is None:
+        conteudo = serializar(calcular(lat_c, lon_c))
+        cache.set(chave, conteudo)
+    return conteudo
+
+
+def calcular_raio_cacheado(lat, lon, max_min, dia, hora_ini_min, **opcoes) -> bytes:
+    """Como ``calcular_raio``, mas devolve o corpo serializado (JSON ou RGRD)."""
+    return _com_cache(
+        "raio", lat, lon, params_raio(max_min, dia, hora_ini_min, opcoes),
+        lambda la, lo: calcular_raio(la, lo, max_min, dia, hora_ini_min, **opcoes),
+    )
+
+
+def calcular_perfil_cacheado(lat, lon, max_min, dia, hora_ini_min, hora_fim_min, **opcoes) -> bytes:
+    return _com_cache(
+        "perfil", lat, lon, params_perfil(max_min, dia, hora_ini_min, hora_fim_min, opcoes),
+        lambda la, lo: calcular_perfil(la, lo, max_min, dia, hora_ini_min, hora_fim_min, **opcoes),
+    )
+
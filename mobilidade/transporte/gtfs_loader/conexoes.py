@@ -0,0 +1,100 @@
+from django.db import connection
+
+from transporte.gtfs_loader.versao import ESQUEMA_ATIVO
+from transporte.models import Frequency, Stop, StopTime, Trip
+
+"""
+conexoes.py — Conexões elementares materializadas no PostgreSQL
+--------------------------------------------------------------------------
+Cada par de paradas consecutivas de uma viagem é uma conexão. Em vez de o
+Python agrupar ``stop_times`` por viagem, a tabela derivada ``TABELA`` é
+preenchida no banco com ``LEAD()``:
+
+    LEAD(stop_id, arrival_time) OVER (PARTITION BY trip_id ORDER BY stop_sequence)
+
+Paradas sem geometria ficam de fora antes do ``LEAD`` — a viagem segue
+direto para a próxima parada válida, como o roteamento sempre fez.
+
+• Importação completa: ``criar`` monta a tabela no schema da carga, junto
+  das tabelas novas, e ``versao.publicar`` a troca com elas.
+• Atualização diferencial: ``atualizar(trip_ids)`` apaga e recalcula só as
+  conexões das viagens informadas (a janela ``PARTITION BY trip_id`` não
+  depende das outras viagens), então o custo acompanha o tamanho da
+  alteração e não o do feed.
+
+O sufixo ``_v<n>`` muda quando as colunas mudam; a tabela antiga é removida
+pela migração que cria a nova.
+"""
+
+VERSAO_TABELA = 2
+TABELA = f"transporte_conexao_v{VERSAO_TABELA}"
+LOTE_VIAGENS = 5_000               # trip_ids por DELETE/INSERT em ``atualizar``
+
+
+def _q(nome: str) -> str:
+    return connection.ops.quote_name(nome)
+
+
+def sql_selecao(esquema: str, filtro: str = "") -> str:
+    """SELECT das conexões sobre as tabelas de ``esquema``.
+
+    ``filtro`` entra antes do ``LEAD`` (ex.: ``AND st.trip_id = ANY(%s)``).
+    """
+    e = _q(esquema)
+    st, stop, trip = (_q(m._meta.db_table) for m in (StopTime, Stop, Trip))
+    return f"""
+        SELECT t.service_id, c.trip_id, c.stop_sequence,
+               c.stop_id AS dep_stop_id, c.departure_time AS dep_s,
+               c.prox_stop_id AS arr_stop_id, c.prox_chegada AS arr_s
+          FROM (
+                SELECT st.trip_id, st.stop_sequence, st.stop_id, st.departure_time,
+                       LEAD(st.stop_id) OVER w AS prox_stop_id,
+                       LEAD(st.arrival_time) OVER w AS prox_chegada
+                  FROM {e}.{st} st
+                  JOIN {e}.{stop} s ON s.stop_id = st.stop_id
+                 WHERE s.geom IS NOT NULL {filtro}
+                WINDOW w AS (PARTITION BY st.trip_id ORDER BY st.stop_sequence)
+               ) c
+          JOIN {e}.{trip} t ON t.trip_id = c.trip_id
+         WHERE c.prox_stop_id IS NOT NULL
+    """
+
+
+def criar(esquema: str):
+    """Cria (e preenche) a tabela sobre as tabelas de ``esquema``."""
+    e = _q(esquema)
+    with connection.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {e}.{_q(TABELA)}")
+        cur.execute(f"CREATE TABLE {e}.{_q(TABELA)} AS {sql_selecao(esquema)}")
+        cur.execute(f"CREATE UNIQUE INDEX ON {e}.{_q(TABELA)} (trip_id, stop_sequence)")
+        cur.execute(f"CREATE INDEX ON {e}.{_q(TABELA)} (service_id)")
+        cur.execute(f"ANALYZE {e}.{_q(TABELA)}")
+
+
+def atualizar(trip_ids):
+    """Refaz as conexões de ``trip_ids`` (novas, alteradas ou removidas).
+
+    Roda na transação do importador diferencial: as leituras seguem vendo
+    as conexões antigas até o commit.
+    """
+    t = _q(TABELA)
+    ids = sorted(trip_ids)
+    with connection.cursor() as cur:
+        for i in range(0, len(ids), LOTE_VIAGENS):
+            lote = ids[i:i + LOTE_VIAGENS]
+            cur.execute(f"DELETE FROM {t} WHERE trip_id = ANY(%s)", [lote])
+            cur.execute(
+                f"INSERT INTO {t} {sql_selecao(ESQUEMA_ATIVO, 'AND st.trip_id = ANY(%s)')}",
+                [lote],
+            )
+
+
+def sql_do_dia() -> str:
+    """Conexões de horário fixo dos serviços ``%s`` (viagens por headway ficam de fora)."""
+    return f"""
+        SELECT c.trip_id, c.dep_stop_id, c.arr_stop_id, c.dep_s, c.arr_s
+          FROM {_q(TABELA)} c
+         WHERE c.service_id = ANY(%s)
+           AND NOT EXISTS (SELECT 1 FROM {_q(Frequency._meta.db_table)} f WHERE f.trip_id = c.trip_id)
+         ORDER BY c.trip_id, c.stop_sequence
+    """
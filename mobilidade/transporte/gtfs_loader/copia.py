@@ -0,0 +1,197 @@
+import csv
+import io
+import os
+import time
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+from django.db import connection, transaction
+
+from transporte.gtfs_loader.horarios import SEM_HORARIO, segundos_vetor
+from transporte.models import Shape, StopTime
+
+"""
+copia.py — Importação em fluxo via ``COPY FROM STDIN``
+--------------------------------------------------------------------------
+Em vez de montar milhões de objetos ``StopTime``/``Shape`` e mandar tudo
+num ``bulk_create``, o CSV é lido linha a linha, reescrito em blocos de
+``LINHAS_POR_BLOCO`` linhas e entregue ao PostgreSQL por um arquivo
+"virtual" (``FluxoCopia``). A memória fica constante, qualquer que seja o
+tamanho do feed.
+
+Com ``ignorar_conflitos=True`` (o comportamento do ``bulk_create`` atual)
+o COPY vai para uma tabela temporária e de lá para a tabela real com
+``ON CONFLICT DO NOTHING``; sem isso, o COPY escreve direto na tabela.
+"""
+
+LINHAS_POR_BLOCO = 50_000          # linhas por bloco de texto enviado ao COPY
+RELATORIO_A_CADA = 1_000_000       # linhas entre mensagens de progresso
+TAMANHO_LEITURA = 1 << 20          # bytes por leitura do psycopg2
+CAMPOS_STOP_TIMES = ("trip_id", "stop_id", "arrival_time", "departure_time", "stop_sequence")
+
+
+# ------------------------------------------------------------
+# Arquivo virtual + envio
+# ------------------------------------------------------------
+class FluxoCopia:
+    """Arquivo somente‑leitura alimentado por um gerador de blocos de texto."""
+
+    def __init__(self, blocos: Iterable[str]):
+        self._blocos = iter(blocos)
+        self._buf = b""
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while self._pos >= len(self._buf):
+            bloco = next(self._blocos, None)
+            if bloco is None:
+                return b""
+            self._buf, self._pos = bloco.encode(), 0
+        fim = len(self._buf) if size is None or size < 0 else self._pos + size
+        pedaco = self._buf[self._pos:fim]
+        self._pos += len(pedaco)
+        return pedaco
+
+
+def _enviar(cursor, sql: str, blocos: Iterable[str]):
+    """COPY com psycopg2 (``copy_expert``) ou psycopg 3 (``cursor.copy``)."""
+    bruto = cursor.cursor  # cursor do driver por trás do wrapper do Django
+    if hasattr(bruto, "copy_expert"):
+        bruto.copy_expert(sql, FluxoCopia(blocos), size=TAMANHO_LEITURA)
+    else:
+        with bruto.copy(sql) as copia:
+            for bloco in blocos:
+                copia.write(bloco)
+
+
+class _Progresso:
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.inicio = time.perf_counter()
+        self.proximo = RELATORIO_A_CADA
+
+    def taxa(self, linhas: int) -> float:
+        return linhas / max(time.perf_counter() - self.inicio, 1e-9)
+
+    def __call__(self, linhas: int):
+        if linhas >= self.proximo:
+            print(f"⏳ {self.nome}: {linhas:,} linhas ({self.taxa(linhas):,.0f} linhas/s)")
+            self.proximo += RELATORIO_A_CADA
+
+
+def _blocos_csv(linhas: Iterable[Sequence], progresso: Callable[[int], None], contagem: List[int]) -> Iterator[str]:
+    """Reescreve as linhas em CSV, ``LINHAS_POR_BLOCO`` por vez (``None`` → NULL)."""
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    n = 0
+    for linha in linhas:
+        w.writerow(linha)
+        n += 1
+        if n % LINHAS_POR_BLOCO == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            progresso(n)
+    if buf.tell():
+        yield buf.getvalue()
+    contagem[0] = n
+
+
+def copiar_tabela(modelo, colunas: Sequence[str], linhas: Iterable[Sequence], nome: Optional[str] = None, ignorar_conflitos: bool = True) -> int:
+    """Envia ``linhas`` (na ordem de ``colunas``) para a tabela do ``modelo``.
+
+    Retorna o número de linhas lidas.
+    """
+    q = connection.ops.quote_name
+    tabela = q(modelo._meta.db_table)
+    cols = ", ".join(q(c) for c in colunas)
+    nome = nome or modelo.__name__
+    progresso = _Progresso(nome)
+    contagem = [0]
+    blocos = _blocos_csv(linhas, progresso, contagem)
+
+    with transaction.atomic(), connection.cursor() as cur:
+        if ignorar_conflitos:
+            cur.execute(
+                f"CREATE TEMP TABLE _copia ON COMMIT DROP AS SELECT {cols} FROM {tabela} WITH NO DATA"
+            )
+            _enviar(cur, f"COPY _copia ({cols}) FROM STDIN WITH (FORMAT csv)", blocos)
+            cur.execute(f"INSERT INTO {tabela} ({cols}) SELECT {cols} FROM _copia ON CONFLICT DO NOTHING")
+            inseridas = cur.rowcount
+        else:
+            _enviar(cur, f"COPY {tabela} ({cols}) FROM STDIN WITH (FORMAT csv)", blocos)
+            inseridas = contagem[0]
+
+    n = contagem[0]
+    print(f"✅ {nome}: {inseridas:,} de {n:,} linhas importadas ({progresso.taxa(n):,.0f} linhas/s).")
+    return n
+
+
+# ------------------------------------------------------------
+# Leitura dos arquivos GTFS
+# ------------------------------------------------------------
+
+def linhas_csv(caminho: str, colunas: Sequence[str]) -> Iterator[List[str]]:
+    """Linhas do CSV só com ``colunas``, na ordem pedida (sem ``DictReader``)."""
+    with open(caminho, encoding="utf-8-sig", newline="") as f:
+        leitor = csv.reader(f)
+        cab = [c.strip() for c in next(leitor)]
+        pos = [cab.index(c) for c in colunas]
+        for linha in leitor:
+            if linha:
+                yield [linha[p] for p in pos]
+
+
+def blocos_stop_times(caminho: str) -> Iterator[tuple]:
+    """``stop_times`` em blocos de ``LINHAS_POR_BLOCO`` linhas.
+
+    Cada bloco é (trip_id, stop_id, chegada, partida, stop_sequence,
+    válidas): textos como tuplas, horários em segundos (int32, convertidos
+    de uma vez) e ``válidas`` marcando as linhas com os dois horários.
+    """
+    linhas = linhas_csv(caminho, CAMPOS_STOP_TIMES)
+    while True:
+        bloco = list(islice(linhas, LINHAS_POR_BLOCO))
+        if not bloco:
+            return
+        trip_id, stop_id, chegada, partida, seq = zip(*bloco)
+        chegada, partida = segundos_vetor(chegada), segundos_vetor(partida)
+        yield trip_id, stop_id, chegada, partida, seq, (chegada != SEM_HORARIO) & (partida != SEM_HORARIO)
+
+
+def _stop_times(caminho: str, descartadas: List[int]) -> Iterator[list]:
+    """Linhas de ``stop_times`` com horários em segundos, convertidos por bloco."""
+    for trip_id, stop_id, chegada, partida, seq, ok in blocos_stop_times(caminho):
+        descartadas[0] += len(ok) - int(ok.sum())   # colunas NOT NULL
+        chegada, partida = chegada.tolist(), partida.tolist()
+        for i in np.flatnonzero(ok).tolist():
+            yield [trip_id[i], stop_id[i], chegada[i], partida[i], seq[i]]
+
+
+def copiar_stop_times(caminho_gtfs: str, ignorar_conflitos: bool = True) -> int:
+    descartadas = [0]
+    n = copiar_tabela(
+        StopTime,
+        CAMPOS_STOP_TIMES,
+        _stop_times(os.path.join(caminho_gtfs, "stop_times.txt"), descartadas),
+        nome="StopTimes",
+        ignorar_conflitos=ignorar_conflitos,
+    )
+    if descartadas[0]:
+        print(f"⚠️ StopTimes: {descartadas[0]:,} linhas sem horário válido foram ignoradas.")
+    return n
+
+
+def copiar_shapes(caminho_gtfs: str, ignorar_conflitos: bool = True) -> int:
+    colunas = ("shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence")
+    return copiar_tabela(
+        Shape,
+        colunas,
+        linhas_csv(os.path.join(caminho_gtfs, "shapes.txt"), colunas),
+        nome="Shapes",
+        ignorar_conflitos=ignorar_conflitos,
+    )
@@ -0,0 +1,399 @@
+import hashlib
+import os
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+
+from transporte.algorithms.grade_horaria import invalidar_versao_feed
+from transporte.gtfs_loader import conexoes
+from transporte.gtfs_loader.copia import CAMPOS_STOP_TIMES, blocos_stop_times, linhas_csv
+from transporte.gtfs_loader.horarios import SEM_HORARIO, segundos_vetor
+from transporte.gtfs_loader.import_gtfs import (
+    ler_agency, ler_calendar, ler_calendar_dates, ler_routes, ler_stops, ler_trips,
+)
+from transporte.models import (
+    Agency, Calendar, CalendarDate, EntityHash, FeedVersion, Frequency, Route, Stop, StopTime, Trip,
+)
+
+"""
+diferencial.py — Atualização incremental do feed GTFS
+--------------------------------------------------------------------------
+Compara o feed novo com o carregado por entidade e só escreve o que mudou:
+
+• parada  → hash da linha de ``stops.txt``;
+• viagem  → hash da linha de ``trips.txt`` + suas ``stop_times`` (+ headways
+  de ``frequencies.txt``). A combinação é uma soma mod 2⁶⁴ dos hashes das
+  linhas, então a ordem das linhas no arquivo não importa.
+
+Cada arquivo é lido uma vez (``ler_feed``): os horários são convertidos
+por bloco com ``segundos_vetor`` e os hashes das linhas filhas saem de
+colunas NumPy (splitmix64), sem um objeto por linha. As ``stop_times``
+ficam em blocos colunares até a aplicação, que escreve só as das viagens
+novas ou alteradas.
+
+Os hashes ficam em ``EntityHash``; na primeira execução (ou depois de uma
+importação completa, que os apaga) eles são calculados a partir do banco.
+Agency, Calendar e Routes são pequenas e vão inteiras (upsert), e as que
+sumiram do feed são apagadas; CalendarDate é trocada inteira. Shapes e
+tarifas continuam com a importação completa.
+
+As remoções seguem a ordem das dependências: viagens, depois linhas (que
+não podem ter viagens restantes), agências, calendários e paradas (que não
+podem ter ``stop_times`` restantes). As conexões (``conexoes.TABELA``) são
+refeitas só para as viagens novas, alteradas ou removidas.
+
+Tudo é aplicado numa transação que também ativa uma nova ``FeedVersion``
+e devolve o conjunto de alterações (``Alteracoes``). A versão nova muda a
+chave das grades e do cache de resultados, então as estruturas derivadas
+não precisam de mais nada.
+"""
+
+MASCARA = (1 << 64) - 1
+LOTE = 5_000                       # linhas por bulk_create / ids por DELETE
+LOTE_HASH = 50_000                 # linhas por bloco de hash (frequencies e banco)
+CAMPOS_FREQ = ("trip_id", "start_time", "end_time", "headway_secs")
+
+
+@dataclass(slots=True)
+class Alteracoes:
+    versao: Optional[int] = None
+    paradas_novas: List[str] = field(default_factory=list)
+    paradas_alteradas: List[str] = field(default_factory=list)
+    paradas_removidas: List[str] = field(default_factory=list)
+    trips_novas: List[str] = field(default_factory=list)
+    trips_alteradas: List[str] = field(default_factory=list)
+    trips_removidas: List[str] = field(default_factory=list)
+    agencias_removidas: List[str] = field(default_factory=list)
+    calendarios_removidos: List[str] = field(default_factory=list)
+    linhas_removidas: List[str] = field(default_factory=list)
+
+    def vazia(self) -> bool:
+        return not any(getattr(self, c) for c in self.__dataclass_fields__ if c != "versao")
+
+    def resumo(self) -> str:
+        return (
+            f"paradas +{len(self.paradas_novas)} ~{len(self.paradas_alteradas)} -{len(self.paradas_removidas)}, "
+            f"trips +{len(self.trips_novas)} ~{len(self.trips_alteradas)} -{len(self.trips_removidas)}, "
+            f"agências -{len(self.agencias_removidas)}, calendários -{len(self.calendarios_removidos)}, "
+            f"linhas -{len(self.linhas_removidas)}"
+        )
+
+
+# ------------------------------------------------------------
+# Forma canônica + hash (mesma para arquivo e banco)
+# ------------------------------------------------------------
+
+def _digest(*valores) -> int:
+    s = "\x1f".join("" if v is None else str(v) for v in valores)
+    return int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little")
+
+
+def _com_sinal(h: int) -> int:
+    """uint64 → int64 (``BigIntegerField``)."""
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def _h_stop(s: Stop) -> int:
+    return _digest("stop", s.stop_id, s.stop_name, s.stop_lat, s.stop_lon, s.stop_desc or "")
+
+
+def _h_trip(t: Trip) -> int:
+    return _digest("trip", t.trip_id, t.route_id, t.service_id, t.trip_headsign or "", t.direction_id, t.shape_id or "")
+
+
+def _misturar(x: np.ndarray) -> np.ndarray:
+    """splitmix64, vetorizado (uint64 → uint64)."""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _h_linhas(tipo: str, *colunas) -> np.ndarray:
+    """Hash uint64 de cada linha a partir de colunas inteiras (textos já como hash)."""
+    h = np.full(len(colunas[0]), _digest(tipo), dtype=np.uint64)
+    for c in colunas:
+        h = _misturar(h ^ np.asarray(c).astype(np.int64).astype(np.uint64))
+    return h
+
+
+def _textos(valores) -> Tuple[np.ndarray, np.ndarray]:
+    """(valores únicos, posição de cada linha neles)."""
+    return np.unique(np.asarray(valores, dtype=str), return_inverse=True)
+
+
+def _h_textos(unicos: np.ndarray) -> np.ndarray:
+    return np.fromiter((_digest(u) for u in unicos.tolist()), dtype=np.uint64, count=len(unicos))
+
+
+class _HashesTrips:
+    """Hash por viagem: linha de ``trips`` + soma (mod 2⁶⁴) das linhas filhas."""
+
+    def __init__(self, trips: Iterable[Trip]):
+        self.ids: List[str] = []
+        base = array("Q")
+        for t in trips:
+            self.ids.append(t.trip_id)
+            base.append(_h_trip(t))
+        self.idx = {t: i for i, t in enumerate(self.ids)}
+        self.soma = np.frombuffer(base, dtype=np.uint64).copy()
+
+    def indices(self, trip_ids) -> np.ndarray:
+        """Índice de cada linha em ``ids`` (-1: viagem fora de ``trips``)."""
+        unicos, pos = _textos(trip_ids)
+        mapa = np.fromiter((self.idx.get(u, -1) for u in unicos.tolist()), dtype=np.int64, count=len(unicos))
+        return mapa[pos]
+
+    def somar(self, indices: np.ndarray, h: np.ndarray):
+        ok = indices >= 0
+        np.add.at(self.soma, indices[ok], h[ok])
+
+    def como_dict(self) -> Dict[str, int]:
+        return dict(zip(self.ids, self.soma.tolist()))
+
+
+# ------------------------------------------------------------
+# Leitura (cada arquivo uma vez)
+# ------------------------------------------------------------
+@dataclass(slots=True)
+class _BlocoStopTimes:
+    trip: np.ndarray                 # int64, índice em ``FeedLido.trip_ids`` (-1: fora de trips.txt)
+    paradas: np.ndarray              # stop_id únicos do bloco
+    parada: np.ndarray               # posição de cada linha em ``paradas``
+    chegada: np.ndarray              # int32, segundos
+    partida: np.ndarray              # int32
+    seq: np.ndarray                  # int32
+
+    def linhas(self, trips: np.ndarray) -> Iterator[Tuple[int, str, int, int, int]]:
+        """(índice da viagem, stop_id, chegada, partida, seq) das viagens em ``trips``."""
+        sel = np.flatnonzero(np.isin(self.trip, trips))
+        return zip(
+            self.trip[sel].tolist(), self.paradas[self.parada[sel]].tolist(),
+            self.chegada[sel].tolist(), self.partida[sel].tolist(), self.seq[sel].tolist(),
+        )
+
+
+def _somar_stop_times(hashes: _HashesTrips, trip_id, stop_id, chegada, partida, seq) -> _BlocoStopTimes:
+    bloco = _BlocoStopTimes(hashes.indices(trip_id), *_textos(stop_id), chegada, partida, seq)
+    h_paradas = _h_textos(bloco.paradas)[bloco.parada]
+    hashes.somar(bloco.trip, _h_linhas("st", h_paradas, chegada, partida, seq))
+    return bloco
+
+
+def _somar_frequencies(hashes: _HashesTrips, trip_id, ini, fim, headway) -> np.ndarray:
+    indices = hashes.indices(trip_id)
+    hashes.somar(indices, _h_linhas("freq", ini, fim, headway))
+    return indices
+
+
+@dataclass(slots=True)
+class FeedLido:
+    paradas: Dict[str, Stop]
+    trips: Dict[str, Trip]
+    trip_ids: List[str]              # ordem dos índices em ``stop_times``/``frequencias``
+    trip_idx: Dict[str, int]
+    stop_times: List[_BlocoStopTimes]
+    frequencias: List[Tuple[int, int, int, int]]   # (índice da viagem, início, fim, headway)
+    hashes_paradas: Dict[str, int]
+    hashes_trips: Dict[str, int]
+
+
+def ler_feed(caminho_gtfs: str) -> FeedLido:
+    """Lê stops/trips/stop_times/frequencies uma vez: entidades + hashes.
+
+    Horários convertidos por bloco com ``segundos_vetor``; linhas sem
+    horário válido ficam de fora, como no importador completo.
+    """
+    paradas = {s.stop_id: s for s in ler_stops(caminho_gtfs)}
+    trips = {t.trip_id: t for t in ler_trips(caminho_gtfs)}
+    hashes = _HashesTrips(trips.values())
+
+    stop_times = []
+    for trip_id, stop_id, chegada, partida, seq, ok in blocos_stop_times(os.path.join(caminho_gtfs, "stop_times.txt")):
+        stop_times.append(_somar_stop_times(
+            hashes, np.asarray(trip_id)[ok], np.asarray(stop_id)[ok],
+            chegada[ok], partida[ok], np.asarray(seq)[ok].astype(np.int32),
+        ))
+
+    frequencias = []
+    caminho = os.path.join(caminho_gtfs, "frequencies.txt")
+    if os.path.exists(caminho):
+        for bloco in _lotes(linhas_csv(caminho, CAMPOS_FREQ), LOTE_HASH):
+            trip_id, ini, fim, headway = zip(*bloco)
+            ini, fim = segundos_vetor(ini), segundos_vetor(fim)
+            ok = (ini != SEM_HORARIO) & (fim != SEM_HORARIO)
+            headway = np.asarray(headway)[ok].astype(np.int32)
+            indices = _somar_frequencies(hashes, np.asarray(trip_id)[ok], ini[ok], fim[ok], headway)
+            frequencias.extend(zip(indices.tolist(), ini[ok].tolist(), fim[ok].tolist(), headway.tolist()))
+
+    return FeedLido(
+        paradas, trips, hashes.ids, hashes.idx, stop_times, frequencias,
+        {sid: _h_stop(s) for sid, s in paradas.items()}, hashes.como_dict(),
+    )
+
+
+def hashes_banco() -> Tuple[Dict[str, int], Dict[str, int]]:
+    """Hashes do feed carregado: de ``EntityHash`` ou, se vazio, recalculados."""
+    paradas: Dict[str, int] = {}
+    trips: Dict[str, int] = {}
+    salvos = EntityHash.objects.values_list("kind", "entity_id", "digest").iterator(chunk_size=50_000)
+    for kind, entity_id, digest in salvos:
+        (paradas if kind == "stop" else trips)[entity_id] = digest & MASCARA
+    if paradas or trips:
+        return paradas, trips
+
+    print("🔎 Sem hashes salvos: calculando a partir do banco...")
+    paradas = {s.stop_id: _h_stop(s) for s in Stop.objects.defer("geom").iterator(chunk_size=50_000)}
+    hashes = _HashesTrips(Trip.objects.iterator(chunk_size=50_000))
+    linhas = StopTime.objects.values_list(*CAMPOS_STOP_TIMES).iterator(chunk_size=LOTE_HASH)
+    for bloco in _lotes(linhas, LOTE_HASH):
+        _somar_stop_times(hashes, *zip(*bloco))
+    linhas = Frequency.objects.values_list(*CAMPOS_FREQ).iterator(chunk_size=LOTE_HASH)
+    for bloco in _lotes(linhas, LOTE_HASH):
+        _somar_frequencies(hashes, *zip(*bloco))
+    return paradas, hashes.como_dict()
+
+
+def _comparar(antigos: Dict[str, int], novos: Dict[str, int]) -> Tuple[List[str], List[str], List[str]]:
+    inseridos = sorted(novos.keys() - antigos.keys())
+    removidos = sorted(antigos.keys() - novos.keys())
+    alterados = sorted(k for k in novos.keys() & antigos.keys() if novos[k] != antigos[k])
+    return inseridos, alterados, removidos
+
+
+# ------------------------------------------------------------
+# Aplicação
+# ------------------------------------------------------------
+
+def _lotes(itens: Iterable, n: int = LOTE) -> Iterator[list]:
+    lote = []
+    for x in itens:
+        lote.append(x)
+        if len(lote) >= n:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def _upsert(modelo, objs: Iterable):
+    pk = modelo._meta.pk.name
+    campos = [f.name for f in modelo._meta.concrete_fields if not f.primary_key]
+    for lote in _lotes(objs):
+        modelo.objects.bulk_create(lote, update_conflicts=True, unique_fields=[pk], update_fields=campos)
+
+
+def _apagar(qs_por_ids, ids: List[str]):
+    for lote in _lotes(ids):
+        qs_por_ids(lote).delete()
+
+
+def _salvar_hashes(kind: str, hashes: Dict[str, int], mudaram: List[str], removidos: List[str]):
+    _apagar(lambda ids: EntityHash.objects.filter(kind=kind, entity_id__in=ids), removidos)
+    for lote in _lotes(mudaram):
+        EntityHash.objects.bulk_create(
+            [EntityHash(kind=kind, entity_id=k, digest=_com_sinal(hashes[k])) for k in lote],
+            update_conflicts=True, unique_fields=["kind", "entity_id"], update_fields=["digest"],
+        )
+
+
+def _removidos(modelo, objs: List) -> List[str]:
+    """Chaves de ``modelo`` no banco que não estão em ``objs`` (do feed)."""
+    pk = modelo._meta.pk.name
+    no_feed = {o.pk for o in objs}
+    return sorted(set(modelo.objects.values_list(pk, flat=True)) - no_feed)
+
+
+def atualizar_gtfs(caminho_gtfs) -> Alteracoes:
+    """Aplica só as diferenças entre o feed em ``caminho_gtfs`` e o carregado."""
+    print(f"🔄 Atualização diferencial a partir de: {caminho_gtfs}")
+    p_antigos, t_antigos = hashes_banco()
+    feed = ler_feed(caminho_gtfs)
+    p_novos, t_novos = feed.hashes_paradas, feed.hashes_trips
+    if not EntityHash.objects.exists():
+        # primeira execução: grava a base inteira para as próximas compararem
+        _salvar_hashes("stop", p_antigos, list(p_antigos), [])
+        _salvar_hashes("trip", t_antigos, list(t_antigos), [])
+
+    alt = Alteracoes()
+    alt.paradas_novas, alt.paradas_alteradas, alt.paradas_removidas = _comparar(p_antigos, p_novos)
+    alt.trips_novas, alt.trips_alteradas, alt.trips_removidas = _comparar(t_antigos, t_novos)
+    agencias, calendarios, linhas = list(ler_agency(caminho_gtfs)), list(ler_calendar(caminho_gtfs)), list(ler_routes(caminho_gtfs))
+    alt.agencias_removidas = _removidos(Agency, agencias)
+    alt.calendarios_removidos = _removidos(Calendar, calendarios)
+    alt.linhas_removidas = _removidos(Route, linhas)
+    if alt.vazia():
+        print("✅ Nada mudou no feed.")
+        return alt
+    print(f"🧮 {alt.resumo()}")
+
+    paradas_escrever: Set[str] = set(alt.paradas_novas) | set(alt.paradas_alteradas)
+    trips_escrever: Set[str] = set(alt.trips_novas) | set(alt.trips_alteradas)
+
+    with transaction.atomic():
+        # Tabelas pequenas: inteiras
+        _upsert(Agency, agencias)
+        _upsert(Calendar, calendarios)
+        CalendarDate.objects.all().delete()
+        for lote in _lotes(ler_calendar_dates(caminho_gtfs)):
+            CalendarDate.objects.bulk_create(lote)
+        _upsert(Route, linhas)
+
+        _upsert(Stop, (feed.paradas[sid] for sid in sorted(paradas_escrever)))
+        _upsert(Trip, (feed.trips[tid] for tid in sorted(trips_escrever)))
+
+        # Viagens alteradas: horários refeitos do zero
+        _apagar(lambda ids: StopTime.objects.filter(trip_id__in=ids), alt.trips_alteradas)
+        _apagar(lambda ids: Frequency.objects.filter(trip_id__in=ids), alt.trips_alteradas)
+        escrever = np.fromiter((feed.trip_idx[t] for t in trips_escrever), dtype=np.int64, count=len(trips_escrever))
+        ids = feed.trip_ids
+        for bloco in feed.stop_times:
+            for lote in _lotes(bloco.linhas(escrever)):
+                StopTime.objects.bulk_create([
+                    StopTime(trip_id=ids[t], stop_id=s, arrival_time=a, departure_time=d, stop_sequence=seq)
+                    for t, s, a, d, seq in lote
+                ])
+        escrever = set(escrever.tolist())
+        for lote in _lotes(fq for fq in feed.frequencias if fq[0] in escrever):
+            Frequency.objects.bulk_create([
+                Frequency(trip_id=ids[t], start_time=i, end_time=f, headway_secs=h)
+                for t, i, f, h in lote
+            ])
+
+        _apagar(lambda ids: Trip.objects.filter(trip_id__in=ids), alt.trips_removidas)
+        for lote in _lotes(alt.linhas_removidas):
+            if Trip.objects.filter(route_id__in=lote).exists():
+                raise ValueError("feed inválido: trips apontam para linhas removidas")
+        _apagar(lambda ids: Route.objects.filter(route_id__in=ids), alt.linhas_removidas)
+        _apagar(lambda ids: Agency.objects.filter(agency_id__in=ids), alt.agencias_removidas)
+        _apagar(lambda ids: Calendar.objects.filter(service_id__in=ids), alt.calendarios_removidos)
+        for lote in _lotes(alt.paradas_removidas):
+            if StopTime.objects.filter(stop_id__in=lote).exists():
+                raise ValueError("feed inválido: stop_times apontam para paradas removidas")
+        _apagar(lambda ids: Stop.objects.filter(stop_id__in=ids), alt.paradas_removidas)
+
+        with connection.cursor() as cur:
+            for lote in _lotes(sorted(paradas_escrever)):
+                cur.execute(
+                    f"UPDATE {Stop._meta.db_table} "
+                    "SET geom = ST_SetSRID(ST_MakePoint(stop_lon, stop_lat), 4326)::geography "
+                    "WHERE stop_id = ANY(%s)",
+                    [lote],
+                )
+
+        _salvar_hashes("stop", p_novos, sorted(paradas_escrever), alt.paradas_removidas)
+        _salvar_hashes("trip", t_novos, sorted(trips_escrever), alt.trips_removidas)
+        # a versão nova só é ativada com as conexões já recalculadas
+        conexoes.atualizar(trips_escrever | set(alt.trips_removidas))
+
+        FeedVersion.objects.filter(is_active=True).update(is_active=False)
+        versao = FeedVersion.objects.create(source=str(caminho_gtfs), is_active=True, activated_at=timezone.now())
+        alt.versao = versao.pk
+
+    invalidar_versao_feed()
+    print(f"🎉 Versão {alt.versao} ativa.")
+    return alt
@@ -0,0 +1,63 @@
+import re
+from typing import Optional, Sequence
+
+import numpy as np
+
+"""
+horarios.py — Horários GTFS em segundos
+--------------------------------------------------------------------------
+O GTFS conta o tempo a partir do meio‑dia menos 12h do dia de serviço, e
+viagens que atravessam a meia‑noite usam horários como ``25:10:00``. O
+``TimeField`` não representa isso; os horários passam a ser guardados como
+inteiros (segundos desde 0h00 do dia de serviço).
+
+``segundos_vetor`` converte um bloco inteiro de strings de uma vez com
+NumPy: as strings viram uma matriz de bytes alinhada à direita
+(``"  7:05:00"``), e horas/minutos/segundos saem de colunas fixas.
+"""
+
+LARGURA = 9                        # "HHH:MM:SS"
+SEM_HORARIO = -1                   # vazio ou inválido
+_FORMATO = re.compile(r"\s*(\d{1,3}):([0-5]\d):([0-5]\d)\s*")
+
+
+def segundos(valor) -> Optional[int]:
+    """"H:MM:SS" → segundos (``None`` se vazio/inválido)."""
+    r = _FORMATO.fullmatch(str(valor))
+    if r is None:
+        return None
+    h, m, s = r.groups()
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+def segundos_vetor(valores: Sequence[str]) -> np.ndarray:
+    """Versão vetorizada de ``segundos``: int32, ``SEM_HORARIO`` onde inválido."""
+    if not len(valores):
+        return np.zeros(0, dtype=np.int32)
+    b = np.char.strip(np.asarray(valores, dtype="S"))
+    longos = np.char.str_len(b) > LARGURA
+    b = np.char.rjust(b.astype(f"S{LARGURA}"), LARGURA)
+
+    # dígitos 0..9, ':' = 10, espaço = -16
+    d = b.view(np.uint8).reshape(-1, LARGURA).astype(np.int32) - ord("0")
+    eh_digito = (d >= 0) & (d <= 9)
+    horas_cols = d[:, :-6]
+    horas_dig = eh_digito[:, :-6]
+
+    ok = ~longos & (d[:, -3] == 10) & (d[:, -6] == 10)
+    ok &= eh_digito[:, [-7, -5, -4, -2, -1]].all(axis=1)
+    # horas: só espaços à esquerda, depois dígitos
+    ok &= ((horas_cols == ord(" ") - ord("0")) | horas_dig).all(axis=1)
+    ok &= (np.diff(horas_dig.astype(np.int8), axis=1) >= 0).all(axis=1)
+
+    pesos = 10 ** np.arange(horas_cols.shape[1] - 1, -1, -1)
+    h = (np.where(horas_dig, horas_cols, 0) * pesos).sum(axis=1)
+    m = d[:, -5] * 10 + d[:, -4]
+    s = d[:, -2] * 10 + d[:, -1]
+    ok &= (m < 60) & (s < 60)
+    return np.where(ok, h * 3600 + m * 60 + s, SEM_HORARIO).astype(np.int32)
+
+
+def formatar(seg: int) -> str:
+    """Segundos → "HH:MM:SS" (horas podem passar de 24)."""
+    return f"{seg // 3600:02d}:{seg % 3600 // 60:02d}:{seg % 60:02d}"
@@ -3,15 +3,15 @@ import csv
 from datetime import datetime
 from django.db import transaction
 from transporte.models import (
-    Agency, Calendar, Stop, Route, Trip, StopTime, Shape,
-    FareAttribute, FareRule, Frequency
+    Agency, Calendar, CalendarDate, Stop, Route, Trip, StopTime, Shape,
+    FareAttribute, FareRule, Frequency, EntityHash
 )
-
-def parse_time(value):
-    try:
-        return datetime.strptime(value, "%H:%M:%S").time()
-    except:
-        return None
+from transporte.algorithms.grade_horaria import invalidar_versao_feed
+from transporte.gtfs_loader import conexoes
+from transporte.gtfs_loader.copia import copiar_shapes, copiar_stop_times
+from transporte.gtfs_loader.horarios import segundos
+from transporte.gtfs_loader.pipeline import Etapa, executar
+from transporte.gtfs_loader.versao import ESQUEMA_NOVO, preparar, publicar, validar
 
 def parse_date(value):
     try:
@@ -19,33 +19,33 @@ def parse_date(value):
     except:
         return None
 
-#@transaction.atomic
-def importar_gtfs(caminho_gtfs):
-    print(f"🔄 Iniciando importação GTFS de: {caminho_gtfs}")
+def _abrir(caminho_gtfs, nome):
+    return open(os.path.join(caminho_gtfs, nome), encoding='utf-8')
 
-    def open_file(nome):
-        return open(os.path.join(caminho_gtfs, nome), encoding='utf-8')
 
-    # Agency
-    with open_file('agency.txt') as f:
-        agencies = []
+def ler_agency(caminho_gtfs):
+    with _abrir(caminho_gtfs, 'agency.txt') as f:
         for row in csv.DictReader(f):
-            agencies.append(Agency(
+            yield Agency(
                 agency_id=row['agency_id'],
                 agency_name=row['agency_name'],
                 agency_url=row['agency_url'],
                 agency_timezone=row['agency_timezone'],
                 agency_lang=row.get('agency_lang'),
                 agency_phone=row.get('agency_phone'),
-            ))
-        Agency.objects.bulk_create(agencies, ignore_conflicts=True)
-        print(f"✅ Agency: {len(agencies)} registros importados.")
+            )
+
+
+def importar_agency(caminho_gtfs):
+    agencies = list(ler_agency(caminho_gtfs))
+    Agency.objects.bulk_create(agencies, ignore_conflicts=True)
+    print(f"✅ Agency: {len(agencies)} registros importados.")
+
 
-    # Calendar
-    with open_file('calendar.txt') as f:
-        calendars = []
+def ler_calendar(caminho_gtfs):
+    with _abrir(caminho_gtfs, 'calendar.txt') as f:
         for row in csv.DictReader(f):
-            calendars.append(Calendar(
+            yield Calendar(
                 service_id=row['service_id'],
                 monday=row['monday'] == '1',
                 tuesday=row['tuesday'] == '1',
@@ -56,162 +56,98 @@ def importar_gtfs(caminho_gtfs):
                 sunday=row['sunday'] == '1',
                 start_date=parse_date(row['start_date']),
                 end_date=parse_date(row['end_date']),
-            ))
-        Calendar.objects.bulk_create(calendars, ignore_conflicts=True)
-        print(f"✅ Calendar: {len(calendars)} registros importados.")
+            )
+
 
-    # Stops
-    with open_file('stops.txt') as f:
-        stops = []
+def importar_calendar(caminho_gtfs):
+    calendars = list(ler_calendar(caminho_gtfs))
+    Calendar.objects.bulk_create(calendars, ignore_conflicts=True)
+    print(f"✅ Calendar: {len(calendars)} registros importados.")
+
+
+def ler_calendar_dates(caminho_gtfs):
+    # opcional no GTFS
+    if not os.path.exists(os.path.join(caminho_gtfs, 'calendar_dates.txt')):
+        return
+    with _abrir(caminho_gtfs, 'calendar_dates.txt') as f:
         for row in csv.DictReader(f):
-            stops.append(Stop(
+            yield CalendarDate(
+                service_id=row['service_id'],
+                date=parse_date(row['date']),
+                exception_type=int(row['exception_type']),
+            )
+
+
+def importar_calendar_dates(caminho_gtfs):
+    excecoes = list(ler_calendar_dates(caminho_gtfs))
+    CalendarDate.objects.bulk_create(excecoes, ignore_conflicts=True)
+    print(f"✅ CalendarDate: {len(excecoes)} registros importados.")
+
+
+def ler_stops(caminho_gtfs):
+    with _abrir(caminho_gtfs, 'stops.txt') as f:
+        for row in csv.DictReader(f):
+            yield Stop(
                 stop_id=row['stop_id'],
                 stop_name=row['stop_name'],
                 stop_lat=float(row['stop_lat']),
                 stop_lon=float(row['stop_lon']),
                 stop_desc=row.get('stop_desc'),
-            ))
-        Stop.objects.bulk_create(stops, ignore_conflicts=True)
-        print(f"✅ Stops: {len(stops)} registros importados.")
+            )
+
+
+def importar_stops(caminho_gtfs):
+    stops = list(ler_stops(caminho_gtfs))
+    Stop.objects.bulk_create(stops, ignore_conflicts=True)
+    print(f"✅ Stops: {len(stops)} registros importados.")
+
 
-    # Routes
-    with open_file('routes.txt') as f:
-        routes = []
+def ler_routes(caminho_gtfs):
+    with _abrir(caminho_gtfs, 'routes.txt') as f:
         for row in csv.DictReader(f):
-            routes.append(Route(
+            yield Route(
                 route_id=row['route_id'],
                 agency_id=row.get('agency_id'),
                 route_short_name=row['route_short_name'],
                 route_long_name=row['route_long_name'],
                 route_type=int(row['route_type']),
-            ))
-        Route.objects.bulk_create(routes, ignore_conflicts=True)
-        print(f"✅ Routes: {len(routes)} registros importados.")
+            )
+
+
+def importar_routes(caminho_gtfs):
+    routes = list(ler_routes(caminho_gtfs))
+    Route.objects.bulk_create(routes, ignore_conflicts=True)
+    print(f"✅ Routes: {len(routes)} registros importados.")
+
 
-    # Trips
-    with open_file('trips.txt') as f:
-        trips = []
+def ler_trips(caminho_gtfs):
+    with _abrir(caminho_gtfs, 'trips.txt') as f:
         for row in csv.DictReader(f):
-            trips.append(Trip(
+            yield Trip(
                 trip_id=row['trip_id'],
                 route_id=row['route_id'],
                 service_id=row['service_id'],
                 trip_headsign=row.get('trip_headsign'),
                 direction_id=int(row.get('direction_id', 0)),
                 shape_id=row.get('shape_id'),
-            ))
-        Trip.objects.bulk_create(trips, ignore_conflicts=True)
-        print(f"✅ Trips: {len(trips)} registros importados.")
-
-    # StopTimes
-    with open_file('stop_times.txt') as f:
-        stoptimes = []
-        for row in csv.DictReader(f):
-            stoptimes.append(StopTime(
-                trip_id=row['trip_id'],
-                stop_id=row['stop_id'],
-                arrival_time=parse_time(row['arrival_time']),
-                departure_time=parse_time(row['departure_time']),
-                stop_sequence=int(row['stop_sequence']),
-            ))
-        StopTime.objects.bulk_create(stoptimes, ignore_conflicts=True)
-        print(f"✅ StopTimes: {len(stoptimes)} registros importados.")
-
-    # Shapes
-    with open_file('shapes.txt') as f:
-        shapes = []
-        for row in csv.DictReader(f):
-            shapes.append(Shape(
-                shape_id=row['shape_id'],
-                shape_pt_lat=float(row['shape_pt_lat']),
-                shape_pt_lon=float(row['shape_pt_lon']),
-                shape_pt_sequence=int(row['shape_pt_sequence']),
-            ))
-        Shape.objects.bulk_create(shapes, ignore_conflicts=True)
-        print(f"✅ Shapes: {len(shapes)} registros importados.")
+            )
 
-    # FareAttributes
-    with open_file('fare_attributes.txt') as f:
-        fares = []
-        for row in csv.DictReader(f):
-            fares.append(FareAttribute(
-                fare_id=row['fare_id'],
-                price=row['price'],
-                currency_type=row['currency_type'],
-                payment_method=int(row['payment_method']),
-                transfers=int(row['transfers']) if row.get('transfers') and row['transfers'].isdigit() else None,
-                agency_id=row.get('agency_id'),
-            ))
-        FareAttribute.objects.bulk_create(fares, ignore_conflicts=True)
-        print(f"✅ FareAttributes: {len(fares)} registros importados.")
 
-    # FareRules
-    with open_file('fare_rules.txt') as f:
-        rules = []
-        for row in csv.DictReader(f):
-            rules.append(FareRule(
-                fare_id=row['fare_id'],
-                route_id=row['route_id'],
-                origin_id=row.get('origin_id'),
-                destination_id=row.get('destination_id'),
-                contains_id=row.get('contains_id'),
-            ))
-        FareRule.objects.bulk_create(rules, ignore_conflicts=True)
-        print(f"✅ FareRules: {len(rules)} registros importados.")
+def importar_trips(caminho_gtfs):
+    trips = list(ler_trips(caminho_gtfs))
+    Trip.objects.bulk_create(trips, ignore_conflicts=True)
+    print(f"✅ Trips: {len(trips)} registros importados.")
 
-    # Frequencies
-    with open_file('frequencies.txt') as f:
-        freqs = []
-        for row in csv.DictReader(f):
-            freqs.append(Frequency(
-                trip_id=row['trip_id'],
-                start_time=parse_time(row['start_time']),
-                end_time=parse_time(row['end_time']),
-                headway_secs=int(row['headway_secs']),
-            ))
-        Frequency.objects.bulk_create(freqs, ignore_conflicts=True)
-        print(f"✅ Frequencies: {len(freqs)} registros importados.")
 
-    print("🎉 Importação GTFS concluída com sucesso.")
+def importar_stop_times(caminho_gtfs):
+    # Em fluxo via COPY (memória constante)
+    copiar_stop_times(caminho_gtfs)
 
 
 def importar_shapes(caminho_gtfs):
-    from transporte.models import Shape
-    import os, csv
-
-    def open_file(nome):
-        return open(os.path.join(caminho_gtfs, nome), encoding='utf-8')
-
-    print("🚀 Iniciando importação de Shapes (lotes de 99)...")
-
-    shapes = []
-    total = 0
-    batch_size = 99
-
-    with open_file('shapes.txt') as f:
-        for i, row in enumerate(csv.DictReader(f), start=1):
-            shape = Shape(
-                shape_id=row['shape_id'],
-                shape_pt_lat=float(row['shape_pt_lat']),
-                shape_pt_lon=float(row['shape_pt_lon']),
-                shape_pt_sequence=int(row['shape_pt_sequence']),
-            )
-            shapes.append(shape)
-
-            # Quando atingir o tamanho do lote, envia ao banco
-            if len(shapes) >= batch_size:
-                Shape.objects.bulk_create(shapes, ignore_conflicts=True)
-                total += len(shapes)
-                print(f"✅ Lote de {len(shapes)} shapes importados (total até agora: {total})")
-                shapes = []
-
-        # Importar qualquer restante final
-        if shapes:
-            Shape.objects.bulk_create(shapes, ignore_conflicts=True)
-            total += len(shapes)
-            print(f"✅ Último lote de {len(shapes)} shapes importados (total: {total})")
-
-    print(f"🎉 Importação finalizada. Total de shapes importados: {total}")
+    print("🚀 Iniciando importação de Shapes (COPY em fluxo)...")
+    total = copiar_shapes(caminho_gtfs)
+    print(f"🎉 Importação finalizada. Total de shapes lidos: {total}")
 
 def importar_fare_attributes(caminho_gtfs):
     from transporte.models import FareAttribute
@@ -233,7 +169,7 @@ def importar_fare_attributes(caminho_gtfs):
                 price=row['price'],
                 currency_type=row['currency_type'],
                 payment_method=int(row['payment_method']),
-                transfers=int(row['transfers']) if row['transfers'].isdigit() else None,
+                transfers=int(row['transfers']) if row.get('transfers') and row['transfers'].isdigit() else None,
                 agency_id=row.get('agency_id'),
             ))
 
@@ -289,17 +225,10 @@ def importar_fare_rules(caminho_gtfs):
 def importar_frequencies(caminho_gtfs):
     from transporte.models import Frequency
     import os, csv
-    from datetime import datetime
 
     def open_file(nome):
         return open(os.path.join(caminho_gtfs, nome), encoding='utf-8')
 
-    def parse_time(value):
-        try:
-            return datetime.strptime(value, "%H:%M:%S").time()
-        except:
-            return None
-
     print("🚀 Iniciando importação de Frequencies (lotes de 499)...")
 
     freqs = []
@@ -310,8 +239,8 @@ def importar_frequencies(caminho_gtfs):
         for row in csv.DictReader(f):
             freqs.append(Frequency(
                 trip_id=row['trip_id'],
-                start_time=parse_time(row['start_time']),
-                end_time=parse_time(row['end_time']),
+                start_time=segundos(row['start_time']),
+                end_time=segundos(row['end_time']),
                 headway_secs=int(row['headway_secs']),
             ))
 
@@ -327,3 +256,50 @@ def importar_frequencies(caminho_gtfs):
             print(f"✅ Último lote de {len(freqs)} frequencies importados (total: {total})")
 
     print(f"🎉 Importação finalizada. Total de frequencies: {total}")
+
+
+# Tabelas e suas dependências de FK (ver ``pipeline.executar``)
+ETAPAS = [
+    Etapa('agency', importar_agency, modelos=(Agency,)),
+    Etapa('calendar', importar_calendar, modelos=(Calendar,)),
+    Etapa('calendar_dates', importar_calendar_dates, modelos=(CalendarDate,)),
+    Etapa('stops', importar_stops, modelos=(Stop,)),
+    Etapa('routes', importar_routes, ('agency',), modelos=(Route,)),
+    Etapa('trips', importar_trips, ('routes',), modelos=(Trip,)),
+    Etapa('stop_times', importar_stop_times, ('trips', 'stops'), modelos=(StopTime,)),
+    Etapa('shapes', importar_shapes, modelos=(Shape,)),
+    Etapa('fare_attributes', importar_fare_attributes, ('agency',), modelos=(FareAttribute,)),
+    Etapa('fare_rules', importar_fare_rules, ('fare_attributes', 'routes'), modelos=(FareRule,)),
+    Etapa('frequencies', importar_frequencies, ('trips',), modelos=(Frequency,)),
+]
+
+
+# Tabelas que não podem chegar vazias numa versão nova
+OBRIGATORIAS = (Agency, Calendar, Stop, Route, Trip, StopTime)
+
+
+def importar_gtfs(caminho_gtfs, trabalhadores=4):
+    """Importa o feed inteiro como uma nova versão e a publica de uma vez.
+
+    A carga vai para tabelas à parte (tabelas independentes em paralelo);
+    as consultas seguem na versão atual até a troca em ``publicar``.
+    """
+    print(f"🔄 Iniciando importação GTFS de: {caminho_gtfs}")
+    modelos = [m for e in ETAPAS for m in e.modelos]
+
+    preparar(modelos)
+    executar(ETAPAS, caminho_gtfs, trabalhadores=trabalhadores, esquema=ESQUEMA_NOVO)
+    contagens = validar(modelos, obrigatorios=OBRIGATORIAS)
+    print(f"🔎 Carga validada: {sum(contagens.values()):,} linhas.")
+    # Conexões pareadas sobre as tabelas novas, trocadas junto com elas
+    conexoes.criar(ESQUEMA_NOVO)
+    print("🔗 Conexões materializadas.")
+    versao = publicar(modelos, str(caminho_gtfs), derivadas=(conexoes.TABELA,))
+    # Hashes do importador diferencial eram da versão anterior
+    EntityHash.objects.all().delete()
+
+    # Versão memorizada neste processo; os demais releem em até VERSAO_FEED_TTL_S
+    # e passam a usar chaves novas no cache de resultados (ver cache_raio)
+    invalidar_versao_feed()
+
+    print(f"🎉 Importação GTFS concluída com sucesso (versão {versao.pk} ativa).")
@@ -0,0 +1,172 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from django.db import connection
+
+"""
+pipeline.py — Importação GTFS em paralelo respeitando as FKs
+--------------------------------------------------------------------------
+Cada tabela é uma ``Etapa`` com as etapas de que depende (as tabelas
+referenciadas pelas suas FKs). ``executar`` dispara, num pool de threads,
+toda etapa cujas dependências já terminaram — ``shapes``, ``calendar`` e
+``stops`` começam junto com ``agency``; ``stop_times``, ``frequencies`` e
+``fare_rules`` rodam lado a lado assim que ``trips``/``routes`` acabam.
+
+O Django abre uma conexão por thread, então cada etapa fala com o banco
+pela sua própria conexão (fechada ao terminar). O grosso do tempo é
+espera de rede/COPY, que libera o GIL.
+
+Com ``adiar_indices=True`` os índices secundários e as FKs das tabelas
+são removidos antes da carga e recriados no fim (os índices em paralelo).
+Índices únicos e chaves primárias ficam — o ``ON CONFLICT`` depende deles.
+
+``esquema`` direciona a carga para outro schema do PostgreSQL (ver
+``versao.py``): cada conexão usa ``search_path = esquema, public``, e o ORM,
+que não qualifica nomes de tabela, passa a escrever nas tabelas de lá.
+"""
+
+
+@dataclass(slots=True)
+class Etapa:
+    nome: str
+    funcao: Callable[[str], object]    # recebe o diretório do feed
+    depende: Tuple[str, ...] = ()
+    modelos: Tuple = ()                # tabelas cujos índices/FKs podem ser adiados
+
+
+def _ordem_topologica(etapas: Sequence[Etapa]) -> List[Etapa]:
+    """Valida o grafo (dependências conhecidas, sem ciclos)."""
+    por_nome = {e.nome: e for e in etapas}
+    for e in etapas:
+        faltando = set(e.depende) - set(por_nome)
+        if faltando:
+            raise ValueError(f"etapa {e.nome!r} depende de etapas inexistentes: {sorted(faltando)}")
+    ordem, feitas = [], set()
+    while len(ordem) < len(etapas):
+        prontas = [e for e in etapas if e.nome not in feitas and set(e.depende) <= feitas]
+        if not prontas:
+            raise ValueError("dependências circulares entre as etapas")
+        ordem.extend(prontas)
+        feitas.update(e.nome for e in prontas)
+    return ordem
+
+
+def _usar_esquema(esquema: Optional[str]):
+    with connection.cursor() as cur:
+        if esquema:
+            cur.execute(f"SET search_path TO {connection.ops.quote_name(esquema)}, public")
+        else:
+            cur.execute("SET search_path TO DEFAULT")
+
+
+def _na_propria_conexao(esquema: Optional[str], funcao: Callable, *args):
+    """Roda ``funcao`` na thread atual e fecha a conexão dela ao final."""
+    try:
+        if esquema:
+            _usar_esquema(esquema)
+        return funcao(*args)
+    finally:
+        connection.close()
+
+
+# ------------------------------------------------------------
+# Índices e constraints adiados
+# ------------------------------------------------------------
+
+def _remover_indices(tabela: str) -> Tuple[List[str], List[str]]:
+    """Remove índices secundários e FKs; devolve os comandos que os recriam."""
+    q = connection.ops.quote_name
+    indices, fks = [], []
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.conname, pg_get_constraintdef(c.oid)
+              FROM pg_constraint c
+             WHERE c.conrelid = %s::regclass AND c.contype = 'f'
+            """,
+            [tabela],
+        )
+        for nome, definicao in cur.fetchall():
+            cur.execute(f"ALTER TABLE {q(tabela)} DROP CONSTRAINT {q(nome)}")
+            fks.append(f"ALTER TABLE {q(tabela)} ADD CONSTRAINT {q(nome)} {definicao}")
+
+        cur.execute(
+            """
+            SELECT i.relname, pg_get_indexdef(x.indexrelid)
+              FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+             WHERE x.indrelid = %s::regclass AND NOT x.indisunique AND NOT x.indisprimary
+            """,
+            [tabela],
+        )
+        for nome, definicao in cur.fetchall():
+            cur.execute(f"DROP INDEX {q(nome)}")
+            indices.append(definicao)
+    return indices, fks
+
+
+def _recriar(comandos: Sequence[str]):
+    with connection.cursor() as cur:
+        for sql in comandos:
+            cur.execute(sql)
+
+
+# ------------------------------------------------------------
+# Execução
+# ------------------------------------------------------------
+
+def executar(
+    etapas: Sequence[Etapa],
+    caminho_gtfs: str,
+    trabalhadores: int = 4,
+    adiar_indices: bool = True,
+    esquema: Optional[str] = None,
+) -> Dict[str, float]:
+    """Roda as etapas respeitando as dependências; retorna segundos por etapa."""
+    etapas = _ordem_topologica(etapas)
+    tempos: Dict[str, float] = {}
+    indices: List[List[str]] = []
+    fks: List[str] = []
+
+    if adiar_indices:
+        _usar_esquema(esquema)
+        for e in etapas:
+            for modelo in e.modelos:
+                idx, fk = _remover_indices(modelo._meta.db_table)
+                indices.append(idx)
+                fks.extend(fk)
+        print(f"⏸️ Adiados: {sum(map(len, indices))} índices e {len(fks)} FKs.")
+
+    def rodar(e: Etapa):
+        inicio = time.perf_counter()
+        _na_propria_conexao(esquema, e.funcao, caminho_gtfs)
+        return time.perf_counter() - inicio
+
+    try:
+        with ThreadPoolExecutor(max_workers=trabalhadores) as pool:
+            pendentes = list(etapas)
+            feitas = set()
+            rodando = {}
+            while pendentes or rodando:
+                for e in [e for e in pendentes if set(e.depende) <= feitas]:
+                    pendentes.remove(e)
+                    rodando[pool.submit(rodar, e)] = e
+                prontos, _ = wait(rodando, return_when=FIRST_COMPLETED)
+                for fut in prontos:
+                    e = rodando.pop(fut)
+                    tempos[e.nome] = fut.result()   # propaga a exceção da etapa
+                    feitas.add(e.nome)
+                    print(f"⏱️ {e.nome}: {tempos[e.nome]:.1f} s")
+    finally:
+        if adiar_indices:
+            # Índices de tabelas diferentes em paralelo; as FKs depois, em
+            # série (cada uma trava também a tabela referenciada).
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=trabalhadores) as pool:
+                for fut in [pool.submit(_na_propria_conexao, esquema, _recriar, c) for c in indices if c]:
+                    fut.result()
+            _recriar(fks)
+            _usar_esquema(None)
+            print(f"▶️ Índices/FKs recriados em {time.perf_counter() - inicio:.1f} s.")
+    return tempos
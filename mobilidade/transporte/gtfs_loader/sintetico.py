@@ -0,0 +1,273 @@
+import csv
+import hashlib
+from dataclasses import dataclass, field
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from transporte.algorithms.grade_horaria import GradeHoraria, Paradas, _Moldes, montar_grade, seg_para_min
+from transporte.gtfs_loader.horarios import formatar
+
+"""
+sintetico.py — Feed GTFS sintético do tamanho de uma metrópole
+--------------------------------------------------------------------------
+Para medir importação e roteamento sem o feed real (nem PostGIS):
+
+  1. paradas espalhadas no retângulo ``extensao_km`` em volta de ``centro``
+     — parte concentrada no centro, parte uniforme;
+  2. cada linha é uma reta com ângulo e comprimento sorteados; as paradas
+     são as mais próximas de pontos a cada ``espacamento_m`` (linhas que se
+     cruzam dividem paradas, então há baldeação);
+  3. ida e volta com ``viagens_por_hora`` (± metade, por linha) entre
+     ``hora_ini`` e ``hora_fim``; uma fração ``fracao_frequencia`` das
+     linhas sai em ``frequencies.txt`` em vez de viagens fixas.
+
+Tudo sai de ``np.random.default_rng(semente)``: mesmos parâmetros, mesmo
+feed. ``escrever`` grava os .txt que ``importar_gtfs`` lê; ``grade`` monta
+a ``GradeHoraria`` direto em memória, sem banco.
+
+Ordem de grandeza (padrões, ida e volta a cada ~15 min, 5h–23h):
+10k paradas ≈ 0,8 M conexões; 100k paradas ≈ 9 M (~230 MB em memória).
+"""
+
+SERVICO = "SINTETICO"
+METROS_POR_GRAU = 111_320
+PERMANENCIA_S = 20                 # parado em cada parada intermediária
+
+
+@dataclass(slots=True)
+class ParametrosSinteticos:
+    paradas: int = 10_000
+    linhas: Optional[int] = None               # padrão: paradas // 40
+    viagens_por_hora: float = 4.0              # por sentido, média entre as linhas
+    fracao_frequencia: float = 0.2
+    extensao_km: Tuple[float, float] = (40.0, 30.0)   # leste‑oeste × norte‑sul
+    centro: Tuple[float, float] = (-23.5505, -46.6333)
+    comprimento_km: Tuple[float, float] = (5.0, 25.0)
+    espacamento_m: float = 400.0
+    velocidade_kmh: float = 20.0
+    hora_ini: int = 5 * 3600
+    hora_fim: int = 23 * 3600
+    inicio: date = date(2026, 1, 1)
+    fim: date = date(2027, 12, 31)
+    semente: int = 0
+
+
+@dataclass(slots=True)
+class LinhaSintetica:
+    route_id: str
+    sentido: int
+    paradas: np.ndarray              # int32, índices em ``FeedSintetico.lat/lon``
+    chegada: np.ndarray              # int32, segundos desde o início da viagem
+    partida: np.ndarray
+    saidas: np.ndarray               # int32, início de cada viagem fixa (s)
+    frequencia: Optional[Tuple[int, int, int]] = None   # (início, fim, headway) em s
+
+    def trip_id(self, k: int) -> str:
+        return f"{self.route_id}_{self.sentido}_{k:04d}"
+
+
+@dataclass(slots=True)
+class FeedSintetico:
+    parametros: ParametrosSinteticos
+    stop_ids: List[str]
+    lat: np.ndarray
+    lon: np.ndarray
+    linhas: List[LinhaSintetica] = field(default_factory=list)
+
+    @property
+    def n_conexoes(self) -> int:
+        """Conexões das viagens fixas (as de headway não entram)."""
+        return sum((len(l.paradas) - 1) * len(l.saidas) for l in self.linhas if not l.frequencia)
+
+
+# ------------------------------------------------------------
+# Geração
+# ------------------------------------------------------------
+
+def _posicoes(p: ParametrosSinteticos, rng: np.random.Generator) -> np.ndarray:
+    """Posições (x, y) em metros a partir do centro."""
+    meia = np.array(p.extensao_km) * 500
+    n_centro = p.paradas * 3 // 5
+    centro = rng.normal(0, meia / 3, size=(n_centro, 2))
+    uniforme = rng.uniform(-meia, meia, size=(p.paradas - n_centro, 2))
+    return np.clip(np.vstack((centro, uniforme)), -meia, meia)
+
+
+def _percurso(xy, arvore, p, rng, atendida: np.ndarray) -> np.ndarray:
+    """Paradas de uma linha reta sorteada (sem repetir parada).
+
+    A linha começa numa parada ainda sem atendimento, enquanto houver.
+    """
+    meia = np.array(p.extensao_km) * 500
+    livres = np.flatnonzero(~atendida)
+    while True:
+        origem = xy[rng.choice(livres) if len(livres) else rng.integers(len(xy))]
+        angulo = rng.uniform(0, np.pi)
+        comprimento = rng.uniform(*p.comprimento_km) * 1000
+        passos = np.arange(0, comprimento, p.espacamento_m)
+        pontos = origem + passos[:, None] * np.array([np.cos(angulo), np.sin(angulo)])
+        pontos = pontos[np.all(np.abs(pontos) <= meia, axis=1)]
+        _, idx = arvore.query(pontos)
+        _, primeira = np.unique(idx, return_index=True)
+        percurso = idx[np.sort(primeira)]
+        if len(percurso) >= 2:
+            atendida[percurso] = True
+            return percurso.astype(np.int32)
+
+
+def _horarios(xy, percurso, p) -> Tuple[np.ndarray, np.ndarray]:
+    """(chegada, partida) em segundos desde a saída do ponto inicial."""
+    metros = np.linalg.norm(np.diff(xy[percurso], axis=0), axis=1)
+    trecho = np.rint(metros / (p.velocidade_kmh / 3.6)).astype(np.int32) + 30
+    chegada = np.zeros(len(percurso), dtype=np.int32)
+    chegada[1:] = np.cumsum(trecho + PERMANENCIA_S) - PERMANENCIA_S
+    partida = chegada + PERMANENCIA_S
+    partida[0], partida[-1] = 0, chegada[-1]
+    return chegada, partida
+
+
+def gerar(p: Optional[ParametrosSinteticos] = None) -> FeedSintetico:
+    p = p or ParametrosSinteticos()
+    rng = np.random.default_rng(p.semente)
+    xy = _posicoes(p, rng)
+    arvore = cKDTree(xy)
+    lat0, lon0 = p.centro
+    lat = lat0 + xy[:, 1] / METROS_POR_GRAU
+    lon = lon0 + xy[:, 0] / (METROS_POR_GRAU * np.cos(np.radians(lat0)))
+    feed = FeedSintetico(p, [f"S{i:06d}" for i in range(p.paradas)], lat, lon)
+    atendida = np.zeros(p.paradas, dtype=bool)
+
+    for r in range(p.linhas or max(1, p.paradas // 40)):
+        ida = _percurso(xy, arvore, p, rng, atendida)
+        headway = int(3600 / (p.viagens_por_hora * rng.uniform(0.5, 1.5)))
+        por_frequencia = rng.random() < p.fracao_frequencia
+        for sentido, percurso in enumerate((ida, ida[::-1].copy())):
+            chegada, partida = _horarios(xy, percurso, p)
+            primeira = p.hora_ini + int(rng.integers(headway))
+            linha = LinhaSintetica(f"R{r:05d}", sentido, percurso, chegada, partida, np.zeros(0, dtype=np.int32))
+            if por_frequencia:
+                # uma viagem‑modelo; as partidas saem de frequencies.txt
+                linha.saidas = np.array([primeira], dtype=np.int32)
+                linha.frequencia = (primeira, p.hora_fim, headway)
+            else:
+                linha.saidas = np.arange(primeira, p.hora_fim, headway, dtype=np.int32)
+            feed.linhas.append(linha)
+    return feed
+
+
+# ------------------------------------------------------------
+# Arquivos GTFS
+# ------------------------------------------------------------
+
+def _tabela(destino: Path, nome: str, cabecalho, linhas=()):
+    with open(destino / nome, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(cabecalho)
+        w.writerows(linhas)
+
+
+def escrever(feed: FeedSintetico, destino) -> Path:
+    """Grava o feed como diretório GTFS (o formato lido por ``importar_gtfs``)."""
+    destino = Path(destino)
+    destino.mkdir(parents=True, exist_ok=True)
+    p = feed.parametros
+
+    _tabela(destino, "agency.txt",
+            ("agency_id", "agency_name", "agency_url", "agency_timezone", "agency_lang"),
+            [("SINT", "Sintética", "https://example.org", "America/Sao_Paulo", "pt")])
+    _tabela(destino, "calendar.txt",
+            ("service_id", "monday", "tuesday", "wednesday", "thursday", "friday",
+             "saturday", "sunday", "start_date", "end_date"),
+            [(SERVICO, *[1] * 7, p.inicio.strftime("%Y%m%d"), p.fim.strftime("%Y%m%d"))])
+    _tabela(destino, "stops.txt", ("stop_id", "stop_name", "stop_lat", "stop_lon"),
+            ((sid, f"Parada {sid}", f"{la:.6f}", f"{lo:.6f}")
+             for sid, la, lo in zip(feed.stop_ids, feed.lat.tolist(), feed.lon.tolist())))
+
+    rotas = sorted({l.route_id for l in feed.linhas})
+    _tabela(destino, "routes.txt",
+            ("route_id", "agency_id", "route_short_name", "route_long_name", "route_type"),
+            ((r, "SINT", r[1:], f"Linha {r}", 3) for r in rotas))
+    _tabela(destino, "trips.txt", ("route_id", "service_id", "trip_id", "direction_id"),
+            ((l.route_id, SERVICO, l.trip_id(k), l.sentido) for l in feed.linhas for k in range(len(l.saidas))))
+    _tabela(destino, "frequencies.txt", ("trip_id", "start_time", "end_time", "headway_secs"),
+            ((l.trip_id(0), formatar(l.frequencia[0]), formatar(l.frequencia[1]), l.frequencia[2])
+             for l in feed.linhas if l.frequencia))
+    _tabela(destino, "shapes.txt", ("shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"))
+    _tabela(destino, "fare_attributes.txt",
+            ("fare_id", "price", "currency_type", "payment_method", "transfers", "agency_id"),
+            [("UNICA", "4.40", "BRL", 0, "", "SINT")])
+    _tabela(destino, "fare_rules.txt", ("fare_id", "route_id"), (("UNICA", r) for r in rotas))
+
+    # stop_times: o grosso do feed — textos de horário vêm de uma tabela pronta
+    textos = [formatar(s) for s in range(p.hora_fim + 6 * 3600)]
+    with open(destino / "stop_times.txt", "w", encoding="utf-8", newline="") as f:
+        f.write("trip_id,arrival_time,departure_time,stop_id,stop_sequence\n")
+        for l in feed.linhas:
+            ids = [feed.stop_ids[s] for s in l.paradas.tolist()]
+            seq = range(1, len(ids) + 1)
+            for k, t0 in enumerate(l.saidas.tolist()):
+                tid = l.trip_id(k)
+                f.writelines(
+                    f"{tid},{textos[t0 + a]},{textos[t0 + d]},{sid},{n}\n"
+                    for a, d, sid, n in zip(l.chegada.tolist(), l.partida.tolist(), ids, seq)
+                )
+    return destino
+
+
+# ------------------------------------------------------------
+# Grade em memória
+# ------------------------------------------------------------
+
+def paradas_do_feed(feed: FeedSintetico) -> Paradas:
+    return Paradas(
+        ids=list(feed.stop_ids),
+        idx={sid: i for i, sid in enumerate(feed.stop_ids)},
+        nomes=[f"Parada {sid}" for sid in feed.stop_ids],
+        lat=feed.lat,
+        lon=feed.lon,
+    )
+
+
+def grade(feed: FeedSintetico) -> GradeHoraria:
+    """A mesma ``GradeHoraria`` que ``carregar_conexoes`` montaria do feed importado."""
+    ps = paradas_do_feed(feed)
+    moldes, headways = _Moldes(), []
+    dep_stop, arr_stop, dep_min, arr_min, trip = [], [], [], [], []
+    trip_ids: List[str] = []
+    route_ids: List[str] = []
+    rota_de: Dict[str, str] = {}
+
+    for l in feed.linhas:
+        if l.frequencia:
+            tid = l.trip_id(0)
+            t0 = int(l.saidas[0])
+            moldes.add_trip(
+                [(tid, feed.stop_ids[s], t0 + int(a), t0 + int(d))
+                 for s, a, d in zip(l.paradas.tolist(), l.chegada, l.partida)],
+                ps.idx,
+            )
+            headways.append((tid, *l.frequencia))
+            rota_de[tid] = l.route_id
+            continue
+        m = len(l.saidas)
+        saidas = l.saidas[:, None].astype(np.int64)
+        dep_stop.append(np.tile(l.paradas[:-1], m))
+        arr_stop.append(np.tile(l.paradas[1:], m))
+        dep_min.append(seg_para_min(saidas + l.partida[:-1]).ravel())
+        arr_min.append(seg_para_min(saidas + l.chegada[1:]).ravel())
+        trip.append(np.repeat(np.arange(len(trip_ids), len(trip_ids) + m), len(l.paradas) - 1))
+        trip_ids.extend(l.trip_id(k) for k in range(m))
+        route_ids.extend([l.route_id] * m)
+
+    def _juntar(partes):
+        return np.concatenate(partes).astype(np.int32) if partes else np.zeros(0, dtype=np.int32)
+
+    chave = (frozenset({SERVICO}), "sintetico-" + hashlib.sha1(repr(feed.parametros).encode()).hexdigest()[:12])
+    return montar_grade(
+        ps, _juntar(dep_stop), _juntar(arr_stop), _juntar(dep_min), _juntar(arr_min),
+        _juntar(trip), trip_ids, route_ids, moldes.frequencias(headways, rota_de), chave=chave,
+    )
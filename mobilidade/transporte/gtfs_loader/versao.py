@@ -0,0 +1,201 @@
+import time
+from typing import Dict, List
+
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from transporte.models import FeedVersion
+
+"""
+versao.py — Versões do feed com troca atômica de tabelas
+--------------------------------------------------------------------------
+Uma importação nunca escreve nas tabelas em uso:
+
+  1. ``preparar``  cria o schema ``gtfs_novo`` com cópias vazias das
+     tabelas GTFS (``LIKE … INCLUDING ALL``);
+  2. a carga roda lá (``pipeline.executar(..., esquema=ESQUEMA_NOVO)``);
+  3. ``validar``   confere contagens e referências órfãs;
+  4. ``publicar``  numa única transação move as tabelas atuais para
+     ``gtfs_anterior`` e as novas para ``public`` (com as tabelas
+     derivadas montadas sobre elas), recria as FKs e cria a ``FeedVersion``
+     já ativa.
+
+Até o passo 4 as consultas continuam vendo a versão anterior inteira; a
+troca só mexe em metadados, então dura milissegundos. Ela precisa, porém,
+de ``ACCESS EXCLUSIVE`` nas tabelas ativas, e enquanto esse pedido espera
+na fila de locks toda leitura nova espera atrás dele. Por isso cada
+tentativa desiste depois de ``ESPERA_TROCA`` e a troca é repetida com
+recuo; uma importação que falha antes disso não deixa ``FeedVersion``
+para trás. O id da versão ativa é o que ``grade_horaria.versao_feed``
+devolve, e os caches de roteamento e de resultados usam esse valor na
+chave. A versão anterior fica em
+``gtfs_anterior`` até a próxima importação.
+"""
+
+ESQUEMA_NOVO = "gtfs_novo"
+ESQUEMA_ANTERIOR = "gtfs_anterior"
+ESQUEMA_ATIVO = "public"
+ESPERA_TROCA = "2s"                # lock_timeout por tentativa (quanto leitores novos podem esperar)
+TENTATIVAS_TROCA = 5
+RECUO_TROCA_S = 1.0                # pausa antes da 2ª tentativa; dobra a cada falha
+LOCK_NAO_DISPONIVEL = "55P03"      # SQLSTATE de lock_timeout
+
+
+def _q(nome: str) -> str:
+    return connection.ops.quote_name(nome)
+
+
+def _tabelas(modelos) -> List[str]:
+    return [m._meta.db_table for m in modelos]
+
+
+def _fks(cur, esquema: str, tabela: str) -> List[tuple]:
+    cur.execute(
+        """
+        SELECT c.conname, pg_get_constraintdef(c.oid)
+          FROM pg_constraint c
+         WHERE c.conrelid = (quote_ident(%s) || '.' || quote_ident(%s))::regclass
+           AND c.contype = 'f'
+        """,
+        [esquema, tabela],
+    )
+    return cur.fetchall()
+
+
+def _indices(cur, esquema: str, tabela: str) -> Dict[tuple, str]:
+    """(único?, definição sem nome/tabela) → nome do índice."""
+    cur.execute(
+        """
+        SELECT i.relname, x.indisunique, pg_get_indexdef(x.indexrelid)
+          FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+         WHERE x.indrelid = (quote_ident(%s) || '.' || quote_ident(%s))::regclass
+        """,
+        [esquema, tabela],
+    )
+    return {(unico, d.split(" USING ", 1)[1]): nome for nome, unico, d in cur.fetchall()}
+
+
+# ------------------------------------------------------------
+# Etapas
+# ------------------------------------------------------------
+
+def preparar(modelos):
+    """Recria ``ESQUEMA_NOVO`` com tabelas vazias iguais às atuais."""
+    with connection.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {_q(ESQUEMA_NOVO)} CASCADE")
+        cur.execute(f"CREATE SCHEMA {_q(ESQUEMA_NOVO)}")
+        for t in _tabelas(modelos):
+            cur.execute(
+                f"CREATE TABLE {_q(ESQUEMA_NOVO)}.{_q(t)} (LIKE {_q(ESQUEMA_ATIVO)}.{_q(t)} INCLUDING ALL)"
+            )
+
+
+def validar(modelos, obrigatorios=()) -> Dict[str, int]:
+    """Confere a carga em ``ESQUEMA_NOVO``; levanta ``ValueError`` se algo falhar.
+
+    Também preenche ``Stop.geom`` a partir de lat/lon (o roteamento só usa
+    paradas com geometria). Retorna o número de linhas por tabela.
+    """
+    novo = _q(ESQUEMA_NOVO)
+    contagens, erros = {}, []
+    with connection.cursor() as cur:
+        for m in modelos:
+            t = m._meta.db_table
+            cur.execute(f"SELECT count(*) FROM {novo}.{_q(t)}")
+            contagens[t] = cur.fetchone()[0]
+            if m in obrigatorios and not contagens[t]:
+                erros.append(f"{t} vazia")
+
+        # Referências órfãs (as tabelas novas ainda não têm FKs)
+        for m in modelos:
+            for f in m._meta.concrete_fields:
+                if not f.is_relation or f.related_model not in modelos:
+                    continue
+                pai = f.related_model._meta
+                cur.execute(
+                    f"SELECT count(*) FROM {novo}.{_q(m._meta.db_table)} c "
+                    f"WHERE c.{_q(f.column)} IS NOT NULL AND NOT EXISTS ("
+                    f"SELECT 1 FROM {novo}.{_q(pai.db_table)} p WHERE p.{_q(pai.pk.column)} = c.{_q(f.column)})"
+                )
+                orfaos = cur.fetchone()[0]
+                if orfaos:
+                    erros.append(f"{m._meta.db_table}.{f.column}: {orfaos} referências inexistentes")
+
+        stop = next((m for m in modelos if m.__name__ == "Stop"), None)
+        if stop is not None:
+            cur.execute(
+                f"UPDATE {novo}.{_q(stop._meta.db_table)} "
+                "SET geom = ST_SetSRID(ST_MakePoint(stop_lon, stop_lat), 4326)::geography "
+                "WHERE geom IS NULL"
+            )
+
+    if erros:
+        raise ValueError("feed inválido: " + "; ".join(erros))
+    return contagens
+
+
+def _lock_esgotado(e: OperationalError) -> bool:
+    causa = e.__cause__
+    return LOCK_NAO_DISPONIVEL in (getattr(causa, "pgcode", None), getattr(causa, "sqlstate", None))
+
+
+def _trocar(cur, tabelas: List[str], derivadas) -> List[tuple]:
+    """Move as tabelas (dentro da transação de ``publicar``); devolve as FKs a recriar."""
+    ativo, novo, anterior = _q(ESQUEMA_ATIVO), _q(ESQUEMA_NOVO), _q(ESQUEMA_ANTERIOR)
+    fks = []
+    cur.execute(f"SET LOCAL lock_timeout = '{ESPERA_TROCA}'")
+    cur.execute(f"DROP SCHEMA IF EXISTS {anterior} CASCADE")
+    cur.execute(f"CREATE SCHEMA {anterior}")
+
+    for t in tabelas:
+        fks.extend((t, nome, d) for nome, d in _fks(cur, ESQUEMA_ATIVO, t))
+    for d in derivadas:
+        cur.execute(f"ALTER TABLE IF EXISTS {ativo}.{_q(d)} SET SCHEMA {anterior}")
+    for t in tabelas:
+        cur.execute(f"ALTER TABLE {ativo}.{_q(t)} SET SCHEMA {anterior}")
+    for t in tabelas:
+        cur.execute(f"ALTER TABLE {novo}.{_q(t)} SET SCHEMA {ativo}")
+    for d in derivadas:
+        cur.execute(f"ALTER TABLE {novo}.{_q(d)} SET SCHEMA {ativo}")
+
+    # Mantém os nomes de índice que as migrações do Django conhecem
+    for t in tabelas:
+        antigos = _indices(cur, ESQUEMA_ANTERIOR, t)
+        for chave, nome in _indices(cur, ESQUEMA_ATIVO, t).items():
+            if chave in antigos and antigos[chave] != nome:
+                cur.execute(f"ALTER INDEX {ativo}.{_q(nome)} RENAME TO {_q(antigos[chave])}")
+
+    # NOT VALID: a validação (varredura) fica para depois da troca
+    for t, nome, d in fks:
+        cur.execute(f"ALTER TABLE {ativo}.{_q(t)} ADD CONSTRAINT {_q(nome)} {d} NOT VALID")
+    return fks
+
+
+def publicar(modelos, fonte: str, derivadas=()) -> FeedVersion:
+    """Troca atômica: tabelas de ``ESQUEMA_NOVO`` passam a ser as ativas.
+
+    ``derivadas`` (tabelas sem modelo já criadas em ``ESQUEMA_NOVO`` a
+    partir das novas, ex.: ``conexoes.TABELA``) são trocadas junto. Cria e
+    devolve a ``FeedVersion`` ativa; se o lock não sair em
+    ``TENTATIVAS_TROCA`` tentativas, levanta ``OperationalError`` e nada
+    muda.
+    """
+    ativo, novo = _q(ESQUEMA_ATIVO), _q(ESQUEMA_NOVO)
+    for tentativa in range(TENTATIVAS_TROCA):
+        try:
+            with transaction.atomic(), connection.cursor() as cur:
+                fks = _trocar(cur, _tabelas(modelos), derivadas)
+                FeedVersion.objects.filter(is_active=True).update(is_active=False)
+                versao = FeedVersion.objects.create(source=fonte, is_active=True, activated_at=timezone.now())
+            break
+        except OperationalError as e:
+            if not _lock_esgotado(e) or tentativa == TENTATIVAS_TROCA - 1:
+                raise
+            print(f"⏳ Tabelas ocupadas; nova tentativa de troca ({tentativa + 2}/{TENTATIVAS_TROCA}).")
+            time.sleep(RECUO_TROCA_S * 2 ** tentativa)
+
+    with connection.cursor() as cur:
+        cur.execute(f"DROP SCHEMA {novo}")
+        for t, nome, _ in fks:
+            cur.execute(f"ALTER TABLE {ativo}.{_q(t)} VALIDATE CONSTRAINT {_q(nome)}")
+    return versao
@@ -0,0 +1,215 @@
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections
+
+from transporte.algorithms.calcular_raio_csa import (
+    CAMINHADA_MAX_METROS,
+    VELOCIDADE_CAMINHADA_KMH,
+    calcular_raio,
+)
+from transporte.algorithms.calendario import servicos_ativos
+from transporte.algorithms.grade_horaria import obter_grade
+from transporte.algorithms.raptor import obter_padroes
+from transporte.algorithms.transferencias import obter_transferencias
+from transporte import pool_raio, trabalhador_raio
+
+"""
+lote_raio.py — Isócronas de muitas origens de uma vez
+--------------------------------------------------------------------------
+Para acessibilidade de milhares de origens (centroides de setores
+censitários, por exemplo). Cada origem é uma tarefa; os resultados saem
+como NDJSON (uma linha JSON por origem) na ordem em que ficam prontos.
+
+• ``calcular_lote`` (comando ``raio_lote``): pool próprio. Onde existe
+  ``fork`` a grade do dia, os padrões e as transferências são carregados
+  uma vez no processo principal e herdados pelos trabalhadores (páginas
+  compartilhadas); no Windows os processos são criados por ``spawn`` e
+  carregam a grade em ``trabalhador_raio.iniciar``.
+• ``calcular_lote_no_pool`` (``/api/raio/lote/``): usa o pool compartilhado
+  de ``pool_raio`` — o servidor web tem threads e não pode fazer ``fork``,
+  e cada requisição não pode abrir processos novos. As tarefas ocupam só
+  a cota de lote do pool (``pool_raio.vagas_lote``); com ela esgotada a
+  requisição espera suas próprias tarefas em vez de falhar, e as consultas
+  interativas continuam com o resto do pool.
+
+No máximo ``EM_VOO_POR_TRABALHADOR`` tarefas por processo ficam pendentes,
+então a memória não cresce com o tamanho do lote.
+"""
+
+EM_VOO_POR_TRABALHADOR = 4
+ESPERA_SOBRECARGA_S = 0.5
+
+Origem = Tuple[str, float, float]  # (id, lat, lon)
+
+
+# ------------------------------------------------------------
+# Origens
+# ------------------------------------------------------------
+_COLUNAS_LAT = ("lat", "latitude", "y")
+_COLUNAS_LON = ("lon", "lng", "longitude", "x")
+
+
+def _coluna(campos: List[str], nomes) -> str:
+    for c in campos:
+        if c.strip().lower() in nomes:
+            return c
+    raise ValueError(f"coluna não encontrada (uma de: {', '.join(nomes)})")
+
+
+def origens_csv(caminho) -> List[Origem]:
+    """CSV com colunas lat/lon (ou latitude/longitude, y/x) e ``id`` opcional."""
+    with open(caminho, encoding="utf-8-sig", newline="") as f:
+        leitor = csv.DictReader(f)
+        campos = leitor.fieldnames or []
+        c_lat, c_lon = _coluna(campos, _COLUNAS_LAT), _coluna(campos, _COLUNAS_LON)
+        c_id = next((c for c in campos if c.strip().lower() == "id"), None)
+        return [
+            (row[c_id] if c_id else str(i), float(row[c_lat]), float(row[c_lon]))
+            for i, row in enumerate(leitor)
+        ]
+
+
+def origens_geojson(caminho) -> List[Origem]:
+    """FeatureCollection; polígonos (ex.: setores) usam o centroide."""
+    from shapely.geometry import shape
+
+    with open(caminho, encoding="utf-8") as f:
+        dados = json.load(f)
+    origens = []
+    for i, feat in enumerate(dados.get("features", [])):
+        geom = shape(feat["geometry"])
+        p = geom if geom.geom_type == "Point" else geom.centroid
+        props = feat.get("properties") or {}
+        origens.append((str(feat.get("id", props.get("id", i))), p.y, p.x))
+    return origens
+
+
+def ler_origens(caminho) -> List[Origem]:
+    sufixo = Path(caminho).suffix.lower()
+    if sufixo in (".geojson", ".json"):
+        return origens_geojson(caminho)
+    if sufixo in (".csv", ".txt"):
+        return origens_csv(caminho)
+    raise ValueError(f"formato de origens não suportado: {sufixo or caminho}")
+
+
+def origens_de_lista(itens: Iterable[dict]) -> List[Origem]:
+    """``[{"id": …, "lat": …, "lon": …}, …]`` (corpo JSON da API)."""
+    return [(str(o.get("id", i)), float(o["lat"]), float(o["lon"])) for i, o in enumerate(itens)]
+
+
+# ------------------------------------------------------------
+# Pool
+# ------------------------------------------------------------
+
+def _preparar(dia, motor: str):
+    """Carrega no processo principal tudo que os trabalhadores vão herdar."""
+    grade = obter_grade(servicos_ativos(dia))
+    obter_transferencias(grade.paradas, CAMINHADA_MAX_METROS, VELOCIDADE_CAMINHADA_KMH)
+    if motor == "raptor":
+        obter_padroes(grade)
+    # Conexões com o banco não podem atravessar o fork: fecha antes e cada
+    # processo (inclusive este) abre a sua quando precisar
+    connections.close_all()
+
+
+def _calcular(origem: Origem, dia, max_min, hora_ini_min, opcoes) -> bytes:
+    oid, lat, lon = origem
+    linha = {"id": oid, "lat": lat, "lon": lon}
+    try:
+        linha["resultado"] = calcular_raio(lat, lon, max_min, dia, hora_ini_min, **opcoes)
+    except Exception as e:
+        linha["erro"] = str(e)
+    return (json.dumps(linha, default=str) + "\n").encode()
+
+
+def trabalhadores_padrao() -> int:
+    return int(getattr(settings, "RAIO_LOTE_TRABALHADORES", 0) or os.cpu_count() or 1)
+
+
+def _validar(opcoes):
+    if opcoes.get("saida", "geojson") != "geojson":
+        raise ValueError("o lote só produz saida='geojson'")
+
+
+def calcular_lote(
+    origens: List[Origem],
+    max_min: int,
+    dia,
+    hora_ini_min: int,
+    trabalhadores: Optional[int] = None,
+    progresso: Optional[Callable[[int, int], None]] = None,
+    **opcoes,
+) -> Iterator[bytes]:
+    """Linhas NDJSON (bytes), uma por origem, na ordem de conclusão.
+
+    ``opcoes`` vão para ``calcular_raio`` (motor, limiares, …); só a saída
+    GeoJSON cabe numa linha JSON. ``progresso(feitas, total)`` é chamado a
+    cada origem concluída. Abre um pool só para o lote: para processos de
+    linha de comando, não para o servidor web.
+    """
+    _validar(opcoes)
+    # Validado já na chamada (o gerador só roda quando a resposta é lida)
+    return _executar(origens, max_min, dia, hora_ini_min, max(1, trabalhadores or trabalhadores_padrao()), progresso, opcoes)
+
+
+def calcular_lote_no_pool(origens: List[Origem], max_min: int, dia, hora_ini_min: int, **opcoes) -> Iterator[bytes]:
+    """Como ``calcular_lote``, nos processos compartilhados de ``pool_raio``."""
+    _validar(opcoes)
+
+    def submeter(origem):
+        return pool_raio.submeter(_calcular, origem, dia, max_min, hora_ini_min, opcoes, lote=True)
+
+    return _em_ordem_de_conclusao(submeter, origens, pool_raio.vagas_lote(), None)
+
+
+def _executar(origens, max_min, dia, hora_ini_min, trabalhadores, progresso, opcoes) -> Iterator[bytes]:
+    if "fork" in multiprocessing.get_all_start_methods():
+        _preparar(dia, opcoes.get("motor", "csa"))
+        pool = ProcessPoolExecutor(trabalhadores, mp_context=multiprocessing.get_context("fork"))
+    else:
+        pool = ProcessPoolExecutor(
+            trabalhadores,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=trabalhador_raio.iniciar,
+            initargs=(os.environ.get("DJANGO_SETTINGS_MODULE", "mobilidade.settings"),),
+        )
+    with pool:
+        def submeter(origem):
+            return pool.submit(_calcular, origem, dia, max_min, hora_ini_min, opcoes)
+
+        yield from _em_ordem_de_conclusao(submeter, origens, trabalhadores * EM_VOO_POR_TRABALHADOR, progresso)
+
+
+def _em_ordem_de_conclusao(submeter, origens, em_voo, progresso) -> Iterator[bytes]:
+    """Mantém até ``em_voo`` origens submetidas e devolve as que terminam.
+
+    ``pool_raio.Sobrecarga`` (pool compartilhado ou cota de lote cheios) espera uma tarefa
+    própria terminar — ou ``ESPERA_SOBRECARGA_S`` se não houver nenhuma.
+    """
+    total = len(origens)
+    i, feitas, pendentes = 0, 0, set()
+    while i < total or pendentes:
+        while i < total and len(pendentes) < em_voo:
+            try:
+                pendentes.add(submeter(origens[i]))
+            except pool_raio.Sobrecarga:
+                if pendentes:
+                    break
+                time.sleep(ESPERA_SOBRECARGA_S)
+                continue
+            i += 1
+        prontas, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+        for futuro in prontas:
+            feitas += 1
+            if progresso is not None:
+                progresso(feitas, total)
+            yield futuro.result()
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transporte.algorithms.malha_viaria import caminho_graphml, carregar_ou_compilar
+
+"""
+compilar_malha — Converte o graphml de caminhada numa matriz CSR
+--------------------------------------------------------------------------
+    python manage.py compilar_malha
+
+Compila o graphml de ``RAIO_GRAFO_CAMINHADA`` — o mesmo que as consultas
+leem; para usar outro arquivo, mude a configuração. Sem este passo a
+compilação acontece na primeira consulta que precisar da malha. Rodar de novo só é necessário quando o graphml muda (o nome do
+arquivo compilado depende do tamanho e da data do graphml).
+"""
+
+
+class Command(BaseCommand):
+    help = "Compila o grafo de caminhada (graphml do OSMnx) para RAIO_CACHE_DIR"
+
+    def handle(self, *args, **opcoes):
+        caminho = caminho_graphml()
+        if caminho is None or not caminho.exists():
+            raise CommandError(f"graphml não encontrado: {caminho}")
+        t0 = time.perf_counter()
+        malha = carregar_ou_compilar(caminho, recompilar=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {len(malha):,} nós, {malha.matriz.nnz // 2:,} trechos em {time.perf_counter() - t0:.1f}s"
+        ))
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transporte.algorithms import arquivo_grade
+from transporte.algorithms.calcular_raio_csa import CAMINHADA_MAX_METROS, VELOCIDADE_CAMINHADA_KMH
+from transporte.algorithms.calendario import DIAS_SEMANA, interpretar_dia, servicos_ativos
+from transporte.algorithms.grade_horaria import (
+    carregar_conexoes,
+    obter_paradas,
+    versao_feed,
+)
+from transporte.algorithms.raptor import montar_padroes
+from transporte.algorithms.transferencias import obter_transferencias
+
+"""
+exportar_grade — Compila a grade horária em arquivos binários (memmap)
+--------------------------------------------------------------------------
+    python manage.py exportar_grade                 # todos os dias da semana
+    python manage.py exportar_grade thursday sunday
+    python manage.py exportar_grade 2026-12-24      # datas (calendar_dates)
+
+Um arquivo por conjunto de serviços (dias com os mesmos serviços dividem o
+arquivo). Rodar depois de cada ``importar_gtfs``: o nome do arquivo inclui
+a versão do feed, então os arquivos antigos deixam de ser usados.
+"""
+
+
+
+class Command(BaseCommand):
+    help = "Exporta a grade horária compilada (conexões, padrões, transferências) para RAIO_CACHE_DIR"
+
+    def add_arguments(self, parser):
+        parser.add_argument("dias", nargs="*", help="dias da semana ou datas AAAA-MM-DD (padrão: todos os dias da semana)")
+
+    def handle(self, *args, **opcoes):
+        versao = versao_feed()
+        paradas = obter_paradas()
+        transf = obter_transferencias(paradas, CAMINHADA_MAX_METROS, VELOCIDADE_CAMINHADA_KMH)
+
+        feitos = {}
+        for dia in opcoes["dias"] or DIAS_SEMANA:
+            try:
+                servicos = servicos_ativos(interpretar_dia(dia))
+            except ValueError as e:
+                raise CommandError(str(e))
+            if servicos in feitos:
+                self.stdout.write(f"↪️  {dia}: mesmo arquivo de {feitos[servicos]}")
+                continue
+            t0 = time.perf_counter()
+            chave = (servicos, versao)
+            grade = carregar_conexoes(servicos, paradas, chave=chave)
+            destino = arquivo_grade.arquivo_para(chave)
+            arquivo_grade.escrever(destino, grade, montar_padroes(grade), transf)
+            feitos[servicos] = dia
+            mb = destino.stat().st_size / 2**20
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {dia}: {len(grade.dep_min):,} conexões + {len(grade.frequencias):,} headways → {destino.name} "
+                f"({mb:.1f} MB, {time.perf_counter() - t0:.1f}s)"
+            ))
@@ -0,0 +1,92 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from transporte.algorithms.calcular_raio_csa import CAMINHADA_MAX_METROS, VELOCIDADE_CAMINHADA_KMH
+from transporte.algorithms.csa import varrer_conexoes
+from transporte.algorithms.raptor import montar_padroes, rotear
+from transporte.algorithms.transferencias import construir_transferencias
+from transporte.gtfs_loader.sintetico import ParametrosSinteticos, escrever, gerar, grade
+
+"""
+gerar_gtfs_sintetico — Feed GTFS sintético para testes de carga
+--------------------------------------------------------------------------
+    python manage.py gerar_gtfs_sintetico /tmp/gtfs_100k --paradas 100000
+    python manage.py shell -c "from transporte.gtfs_loader.import_gtfs import importar_gtfs; importar_gtfs('/tmp/gtfs_100k')"
+
+    python manage.py gerar_gtfs_sintetico --paradas 50000 --medir 20
+
+Com ``--medir`` a grade e os padrões do RAPTOR são montados em memória
+(sem banco) e N buscas a partir de paradas sorteadas são cronometradas em
+cada motor (CSA e RAPTOR, mesmas origens). Mesma ``--semente``, mesmo feed.
+"""
+
+
+class Command(BaseCommand):
+    help = "Gera um feed GTFS sintético (e/ou mede a grade em memória)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("destino", nargs="?", help="diretório dos .txt (omitido: não grava)")
+        parser.add_argument("--paradas", type=int, default=10_000)
+        parser.add_argument("--linhas", type=int, help="padrão: paradas / 40")
+        parser.add_argument("--viagens-hora", type=float, default=4.0, help="por sentido (padrão: 4)")
+        parser.add_argument("--frequencia", type=float, default=0.2, help="fração das linhas em frequencies.txt")
+        parser.add_argument("--extensao", type=float, nargs=2, default=(40.0, 30.0), metavar=("LESTE_OESTE_KM", "NORTE_SUL_KM"))
+        parser.add_argument("--semente", type=int, default=0)
+        parser.add_argument("--medir", type=int, default=0, metavar="N", help="buscas cronometradas por motor (CSA e RAPTOR)")
+
+    def handle(self, *args, **op):
+        if not op["destino"] and not op["medir"]:
+            raise CommandError("informe o destino e/ou --medir N")
+        p = ParametrosSinteticos(
+            paradas=op["paradas"], linhas=op["linhas"], viagens_por_hora=op["viagens_hora"],
+            fracao_frequencia=op["frequencia"], extensao_km=tuple(op["extensao"]), semente=op["semente"],
+        )
+
+        t0 = time.perf_counter()
+        feed = gerar(p)
+        self.stdout.write(
+            f"🧪 {p.paradas:,} paradas, {len(feed.linhas):,} linhas/sentidos, "
+            f"{feed.n_conexoes:,} conexões fixas ({time.perf_counter() - t0:.1f}s)"
+        )
+
+        if op["destino"]:
+            t0 = time.perf_counter()
+            escrever(feed, op["destino"])
+            self.stdout.write(self.style.SUCCESS(f"✅ GTFS em {op['destino']} ({time.perf_counter() - t0:.1f}s)"))
+
+        if op["medir"]:
+            self._medir(feed, op["medir"], op["semente"])
+
+    def _medir(self, feed, n, semente):
+        t0 = time.perf_counter()
+        g = grade(feed)
+        self.stdout.write(f"🗂️  Grade: {len(g.dep_min):,} conexões, {g.nbytes / 2**20:.0f} MB ({time.perf_counter() - t0:.1f}s)")
+        t0 = time.perf_counter()
+        transf = construir_transferencias(g.paradas, CAMINHADA_MAX_METROS, VELOCIDADE_CAMINHADA_KMH)
+        self.stdout.write(f"🚶 Transferências: {len(transf):,} ({time.perf_counter() - t0:.1f}s)")
+        t0 = time.perf_counter()
+        padroes = montar_padroes(g)
+        self.stdout.write(f"🧭 Padrões RAPTOR: {len(padroes.lista):,} ({time.perf_counter() - t0:.1f}s)")
+
+        rng = np.random.default_rng(semente)
+        servidas = np.unique(g.dep_stop)
+        hora, tempo = 8 * 60, 60
+        motores = {
+            "CSA": lambda eat: varrer_conexoes(g, eat, hora, hora + tempo, hora + tempo, transf.vizinhos),
+            "RAPTOR": lambda eat: rotear(padroes, eat, hora + tempo, hora + tempo, transf.vizinhos),
+        }
+        tempos = {nome: [] for nome in motores}
+        for origem in rng.choice(servidas, size=n).tolist():
+            for nome, buscar in motores.items():
+                eat = np.full(len(g.paradas), np.inf)
+                eat[origem] = hora
+                t0 = time.perf_counter()
+                buscar(eat)
+                tempos[nome].append(time.perf_counter() - t0)
+        for nome, t in tempos.items():
+            ms = np.array(t) * 1000
+            self.stdout.write(self.style.SUCCESS(
+                f"⏱️  {nome} ({n} buscas, {tempo} min): mediana {np.median(ms):.0f} ms, p95 {np.percentile(ms, 95):.0f} ms"
+            ))
@@ -0,0 +1,74 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transporte.algorithms.calendario import interpretar_dia
+from transporte.lote_raio import calcular_lote, ler_origens
+
+"""
+raio_lote — Isócronas de muitas origens, em paralelo, para NDJSON
+--------------------------------------------------------------------------
+    python manage.py raio_lote setores.geojson --tempo 60 --data 2026-11-05 \\
+        --hora 07:00 --limiares 15 30 45 60 --saida acessibilidade.ndjson
+
+Origens em CSV (lat/lon, id opcional) ou GeoJSON (pontos ou polígonos,
+que usam o centroide). Sem ``--saida`` as linhas vão para a saída padrão;
+o progresso vai sempre para stderr.
+"""
+
+RELATORIO_A_CADA_S = 2
+
+
+class Command(BaseCommand):
+    help = "Calcula isócronas para todas as origens de um CSV/GeoJSON (NDJSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("origens", help="arquivo .csv ou .geojson")
+        parser.add_argument("--tempo", type=int, default=60, help="minutos (padrão: 60)")
+        parser.add_argument("--data", default="thursday", help="AAAA-MM-DD ou dia da semana (padrão: thursday)")
+        parser.add_argument("--hora", default="18:00", help="HH:MM de partida (padrão: 18:00)")
+        parser.add_argument("--limiares", type=int, nargs="*", help="faixas em minutos (ex.: 15 30 45 60)")
+        parser.add_argument("--motor", choices=("csa", "raptor"), default="csa")
+        parser.add_argument("--max-transferencias", type=int)
+        parser.add_argument("--trabalhadores", type=int, help="processos (padrão: RAIO_LOTE_TRABALHADORES ou núcleos)")
+        parser.add_argument("--saida", help="arquivo .ndjson (padrão: saída padrão)")
+
+    def handle(self, *args, **op):
+        try:
+            origens = ler_origens(op["origens"])
+            dia = interpretar_dia(op["data"])
+            h, m = op["hora"].split(":")[:2]
+            hora_ini = int(h) * 60 + int(m)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        limiares = op["limiares"] or []
+        tempo = max(limiares) if limiares else op["tempo"]
+        self.stderr.write(f"🚀 {len(origens):,} origens, {tempo} min, {op['data']} {op['hora']}")
+
+        t0 = time.perf_counter()
+        ultimo = [t0]
+
+        def progresso(feitas, total):
+            agora = time.perf_counter()
+            if agora - ultimo[0] >= RELATORIO_A_CADA_S or feitas == total:
+                ultimo[0] = agora
+                taxa = feitas / (agora - t0)
+                self.stderr.write(f"   {feitas:,}/{total:,} ({taxa:.1f} origens/s)")
+
+        linhas = calcular_lote(
+            origens, tempo, dia, hora_ini,
+            trabalhadores=op["trabalhadores"], progresso=progresso,
+            motor=op["motor"], max_transferencias=op["max_transferencias"], limiares=limiares,
+        )
+        destino = open(op["saida"], "wb") if op["saida"] else sys.stdout.buffer
+        try:
+            for linha in linhas:
+                destino.write(linha)
+        finally:
+            if op["saida"]:
+                destino.close()
+        self.stderr.write(self.style.SUCCESS(
+            f"✅ {len(origens):,} origens em {time.perf_counter() - t0:.1f}s"
+        ))
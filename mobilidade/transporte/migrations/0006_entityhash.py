@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-17 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transporte", "0005_feedversion"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EntityHash",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("kind", models.CharField(max_length=10)),
+                ("entity_id", models.CharField(max_length=100)),
+                ("digest", models.BigIntegerField()),
+            ],
+            options={
+                "unique_together": {("kind", "entity_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-17 14:05
+
+from django.db import migrations, models
+
+
+def _para_segundos(tabela, coluna):
+    return migrations.RunSQL(
+        sql=(
+            f"ALTER TABLE {tabela} ALTER COLUMN {coluna} TYPE integer "
+            f"USING EXTRACT(EPOCH FROM {coluna})::integer"
+        ),
+        reverse_sql=(
+            f"ALTER TABLE {tabela} ALTER COLUMN {coluna} TYPE time "
+            f"USING make_interval(secs => {coluna} % 86400)::time"
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transporte", "0006_entityhash"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                _para_segundos("transporte_stoptime", "arrival_time"),
+                _para_segundos("transporte_stoptime", "departure_time"),
+                _para_segundos("transporte_frequency", "start_time"),
+                _para_segundos("transporte_frequency", "end_time"),
+                # hashes do importador diferencial usavam os horários em texto
+                migrations.RunSQL("DELETE FROM transporte_entityhash", migrations.RunSQL.noop),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name="stoptime",
+                    name="arrival_time",
+                    field=models.IntegerField(),
+                ),
+                migrations.AlterField(
+                    model_name="stoptime",
+                    name="departure_time",
+                    field=models.IntegerField(),
+                ),
+                migrations.AlterField(
+                    model_name="frequency",
+                    name="start_time",
+                    field=models.IntegerField(),
+                ),
+                migrations.AlterField(
+                    model_name="frequency",
+                    name="end_time",
+                    field=models.IntegerField(),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-17 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transporte", "0007_horarios_em_segundos"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CalendarDate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("service_id", models.CharField(db_index=True, max_length=100)),
+                ("date", models.DateField()),
+                ("exception_type", models.IntegerField()),
+            ],
+            options={
+                "unique_together": {("service_id", "date")},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-17 16:20
+
+from django.db import migrations
+
+# Cópia da definição em gtfs_loader/conexoes.py na versão 1 da view (a
+# migração não pode mudar junto com o código)
+CRIAR = """
+CREATE MATERIALIZED VIEW transporte_conexao_v1 AS
+SELECT t.service_id, c.trip_id, c.stop_sequence,
+       c.stop_id AS dep_stop_id, c.departure_time AS dep_s,
+       c.prox_stop_id AS arr_stop_id, c.prox_chegada AS arr_s
+  FROM (
+        SELECT st.trip_id, st.stop_sequence, st.stop_id, st.departure_time,
+               LEAD(st.stop_id) OVER w AS prox_stop_id,
+               LEAD(st.arrival_time) OVER w AS prox_chegada
+          FROM transporte_stoptime st
+          JOIN transporte_stop s ON s.stop_id = st.stop_id
+         WHERE s.geom IS NOT NULL
+        WINDOW w AS (PARTITION BY st.trip_id ORDER BY st.stop_sequence)
+       ) c
+  JOIN transporte_trip t ON t.trip_id = c.trip_id
+ WHERE c.prox_stop_id IS NOT NULL;
+CREATE UNIQUE INDEX ON transporte_conexao_v1 (trip_id, stop_sequence);
+CREATE INDEX ON transporte_conexao_v1 (service_id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transporte", "0008_calendardate"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CRIAR, "DROP MATERIALIZED VIEW IF EXISTS transporte_conexao_v1"),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transporte", "0010_conexoes_tabela"),
+    ]
+
+    operations = [
+        # hashes das stop_times/frequencies agora saem de colunas NumPy
+        # (splitmix64); os antigos são recalculados do banco na próxima execução
+        migrations.RunSQL("DELETE FROM transporte_entityhash", migrations.RunSQL.noop),
+    ]
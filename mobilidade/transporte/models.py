@@ -21,6 +21,15 @@ class Calendar(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
 
+class CalendarDate(models.Model):
+    # sem FK: calendar_dates.txt pode definir serviços que não estão em calendar.txt
+    service_id = models.CharField(max_length=100, db_index=True)
+    date = models.DateField()
+    exception_type = models.IntegerField()  # 1 = serviço adicionado, 2 = removido
+
+    class Meta:
+        unique_together = ('service_id', 'date')
+
 class Route(models.Model):
     route_id = models.CharField(max_length=100, primary_key=True)
     agency = models.ForeignKey(Agency, on_delete=models.SET_NULL, null=True)
@@ -47,8 +56,9 @@ class Trip(models.Model):
 class StopTime(models.Model):
     trip = models.ForeignKey(Trip, on_delete=models.CASCADE)
     stop = models.ForeignKey(Stop, on_delete=models.CASCADE)
-    arrival_time = models.TimeField()
-    departure_time = models.TimeField()
+    # segundos desde 0h00 do dia de serviço (podem passar de 24h)
+    arrival_time = models.IntegerField()
+    departure_time = models.IntegerField()
     stop_sequence = models.IntegerField()
 
     class Meta:
@@ -80,6 +90,20 @@ class FareRule(models.Model):
 
 class Frequency(models.Model):
     trip = models.ForeignKey(Trip, on_delete=models.CASCADE)
-    start_time = models.TimeField()
-    end_time = models.TimeField()
+    start_time = models.IntegerField()
+    end_time = models.IntegerField()
     headway_secs = models.IntegerField()
+
+class FeedVersion(models.Model):
+    source = models.CharField(max_length=500)
+    created_at = models.DateTimeField(auto_now_add=True)
+    activated_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=False)
+
+class EntityHash(models.Model):
+    kind = models.CharField(max_length=10)
+    entity_id = models.CharField(max_length=100)
+    digest = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ('kind', 'entity_id')
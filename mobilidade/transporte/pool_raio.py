@@ -0,0 +1,157 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from transporte import trabalhador_raio
+from transporte.cache_raio import localizar, obter_cache, params_perfil, params_raio
+
+"""
+pool_raio.py — Isócronas fora do servidor web, com fila limitada
+--------------------------------------------------------------------------
+As views assíncronas não calculam nada no processo do servidor: cada
+consulta vai para um ``ProcessPoolExecutor`` cujos processos já têm a grade
+carregada (``trabalhador_raio.iniciar``).
+
+• No máximo ``trabalhadores + RAIO_POOL_FILA`` consultas ficam em voo
+  (rodando ou esperando). Acima disso ``Sobrecarga`` é levantada na hora
+  e a view responde 503 — sem fila crescendo sem limite nem timeouts.
+• Tarefas de lote (``lote_raio.calcular_lote_no_pool``) têm cota própria:
+  juntas ocupam no máximo ``vagas_lote()`` vagas. Como o executor atende
+  em ordem de chegada, uma consulta interativa espera atrás de no máximo
+  essas tarefas, e os lotes nunca enchem a fila a ponto de causar o 503.
+• O cache de resultados (``cache_raio``) é consultado antes de ocupar o
+  pool, com a mesma chave das views síncronas.
+• Se um processo morrer, o pool é recriado na consulta seguinte.
+"""
+
+
+class Sobrecarga(Exception):
+    """Fila do pool cheia: a consulta deve ser recusada (503)."""
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_em_voo = 0
+_em_voo_lote = 0
+
+
+def trabalhadores() -> int:
+    return int(getattr(settings, "RAIO_POOL_TRABALHADORES", 0) or os.cpu_count() or 1)
+
+
+def _limite() -> int:
+    return trabalhadores() + int(getattr(settings, "RAIO_POOL_FILA", 32))
+
+
+def vagas_lote() -> int:
+    """Tarefas de lote em voo ao mesmo tempo, somando todas as requisições."""
+    return int(getattr(settings, "RAIO_POOL_LOTE", 0) or max(1, trabalhadores() // 2))
+
+
+def _obter_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                trabalhadores(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=trabalhador_raio.iniciar,
+                initargs=(os.environ.get("DJANGO_SETTINGS_MODULE", "mobilidade.settings"),),
+            )
+        return _pool
+
+
+def _esquecer_pool(quebrado: ProcessPoolExecutor):
+    # Um pool quebrado já encerrou os próprios processos; o próximo
+    # ``_obter_pool`` cria outro
+    global _pool
+    with _pool_lock:
+        if _pool is quebrado:
+            _pool = None
+
+
+def _concluida(pool: ProcessPoolExecutor, futuro: Future, lote: bool):
+    global _em_voo, _em_voo_lote
+    with _pool_lock:
+        _em_voo -= 1
+        _em_voo_lote -= lote
+    if not futuro.cancelled() and isinstance(futuro.exception(), BrokenProcessPool):
+        _esquecer_pool(pool)
+
+
+def submeter(funcao, *args, lote: bool = False) -> Future:
+    """Envia ``funcao(*args)`` ao pool ou levanta ``Sobrecarga``.
+
+    Com ``lote=True`` a tarefa também conta na cota dos lotes
+    (``vagas_lote``).
+
+    A vaga só é devolvida quando o processo termina a tarefa (callback do
+    ``Future``), não quando quem espera desiste — uma requisição cancelada
+    não libera espaço para outra enquanto o cálculo dela ainda ocupa o pool.
+    """
+    global _em_voo, _em_voo_lote
+    with _pool_lock:
+        if _em_voo >= _limite():
+            raise Sobrecarga(f"{_em_voo} consultas em andamento")
+        if lote and _em_voo_lote >= vagas_lote():
+            raise Sobrecarga(f"{_em_voo_lote} tarefas de lote em andamento")
+        _em_voo += 1
+        _em_voo_lote += lote
+    pool = _obter_pool()
+    try:
+        futuro = pool.submit(funcao, *args)
+    except BaseException as e:
+        with _pool_lock:
+            _em_voo -= 1
+            _em_voo_lote -= lote
+        if isinstance(e, BrokenProcessPool):
+            _esquecer_pool(pool)
+        raise
+    futuro.add_done_callback(lambda f: _concluida(pool, f, lote))
+    return futuro
+
+
+async def _executar(*args) -> bytes:
+    return await asyncio.wrap_future(submeter(trabalhador_raio.calcular, *args))
+
+
+async def _com_cache(tipo, lat, lon, params, args, opcoes) -> bytes:
+    # a chave inclui a versão do feed (consulta ao banco): fora do event loop
+    chave, lat_c, lon_c = await sync_to_async(localizar)(tipo, lat, lon, params)
+    cache = obter_cache()
+    conteudo = await cache.aget(chave)
+    if conteudo is None:
+        conteudo = await _executar(tipo, lat_c, lon_c, args, opcoes)
+        await cache.aset(chave, conteudo)
+    return conteudo
+
+
+async def calcular_raio_async(lat, lon, max_min, dia, hora_ini_min, **opcoes) -> bytes:
+    """Como ``cache_raio.calcular_raio_cacheado``, no pool de processos."""
+    return await _com_cache(
+        "raio", lat, lon, params_raio(max_min, dia, hora_ini_min, opcoes),
+        (max_min, dia, hora_ini_min), opcoes,
+    )
+
+
+async def calcular_perfil_async(lat, lon, max_min, dia, hora_ini_min, hora_fim_min, **opcoes) -> bytes:
+    return await _com_cache(
+        "perfil", lat, lon, params_perfil(max_min, dia, hora_ini_min, hora_fim_min, opcoes),
+        (max_min, dia, hora_ini_min, hora_fim_min), opcoes,
+    )
+
+
+def encerrar():
+    """Para os processos (ex.: no desligamento do servidor)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
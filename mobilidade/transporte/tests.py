@@ -1,3 +1,243 @@
-from django.test import TestCase
+import bisect
+import heapq
+import json
+import struct
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from transporte import pool_raio
+from transporte.algorithms import arquivo_grade
+from transporte.algorithms.csa import varrer_conexoes
+from transporte.algorithms.indice_paradas import obter_indice
+from transporte.algorithms.isocrona import areas_por_faixa
+from transporte.algorithms.raptor import montar_padroes, perfil, rotear
+from transporte.algorithms.transferencias import construir_transferencias
+from transporte.gtfs_loader import sintetico
+from transporte.gtfs_loader.horarios import SEM_HORARIO, formatar, segundos, segundos_vetor
+from transporte.views import _data, raio_de_alcance_view
+
+"""
+Testes sem banco: a grade vem de ``sintetico.grade`` (mesma estrutura que
+``carregar_conexoes`` monta a partir do PostGIS).
+"""
+
+CAMINHADA_M = 300
+VELOCIDADE_KMH = 5
+HORA = 8 * 60
+TEMPO = 60
+TOLERANCIA_MIN = 1e-3
+
+
+def _feed(**parametros):
+    p = dict(paradas=1500, extensao_km=(10.0, 8.0), semente=7)
+    p.update(parametros)
+    return sintetico.gerar(sintetico.ParametrosSinteticos(**p))
+
+
+def _referencia(grade, transf, origem, t_ini, t_max):
+    """Dijkstra dependente do tempo sobre conexões + caminhadas (sem atalhos)."""
+    *colunas, _ = grade.frequencias.conexoes(t_ini, t_max)
+    dep_stop = np.concatenate((grade.dep_stop, colunas[0])).tolist()
+    arr_stop = np.concatenate((grade.arr_stop, colunas[1])).tolist()
+    dep_min = np.concatenate((grade.dep_min, colunas[2])).tolist()
+    arr_min = np.concatenate((grade.arr_min, colunas[3])).tolist()
+    saidas = {}
+    for d, a, td, ta in sorted(zip(dep_stop, arr_stop, dep_min, arr_min), key=lambda c: c[2]):
+        saidas.setdefault(d, ([], []))
+        saidas[d][0].append(td)
+        saidas[d][1].append((ta, a))
+
+    eat = np.full(len(grade.paradas), np.inf)
+    eat[origem] = t_ini
+    heap = [(float(t_ini), origem)]
+    while heap:
+        t, s = heapq.heappop(heap)
+        if t > eat[s] or t > t_max:
+            continue
+        vizinhos = list(zip(*transf.vizinhos(s)))
+        if s in saidas:
+            partidas, chegadas = saidas[s]
+            for k in range(bisect.bisect_left(partidas, t), len(partidas)):
+                if partidas[k] > t_max:
+                    break
+                vizinhos.append((chegadas[k][1], chegadas[k][0] - t))
+        for j, dt in vizinhos:
+            if t + dt < eat[j]:
+                eat[j] = t + dt
+                heapq.heappush(heap, (eat[j], j))
+    return eat
+
+
+class MotoresTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.grade = sintetico.grade(_feed())
+        cls.padroes = montar_padroes(cls.grade)
+        cls.transf = construir_transferencias(cls.grade.paradas, CAMINHADA_M, VELOCIDADE_KMH)
+        cls.origens = np.random.default_rng(1).choice(np.unique(cls.grade.dep_stop), 12).tolist()
+
+    def _comparar(self, a, b, t_max):
+        self.assertTrue(np.array_equal(a <= t_max, b <= t_max))
+        dentro = a <= t_max
+        np.testing.assert_allclose(a[dentro], b[dentro], atol=TOLERANCIA_MIN)
+
+    def test_csa_raptor_e_referencia_concordam(self):
+        t_max = HORA + TEMPO
+        for origem in self.origens:
+            with self.subTest(origem=origem):
+                csa = np.full(len(self.grade.paradas), np.inf)
+                csa[origem] = HORA
+                raptor = csa.copy()
+                varrer_conexoes(self.grade, csa, HORA, t_max, t_max, self.transf.vizinhos)
+                rotear(self.padroes, raptor, t_max, t_max, self.transf.vizinhos)
+                ref = _referencia(self.grade, self.transf, origem, HORA, t_max)
+                self.assertGreater(int((ref <= t_max).sum()), 1)
+                self._comparar(csa, ref, t_max)
+                self._comparar(raptor, ref, t_max)
+
+    def test_perfil_igual_a_rotear_por_partida(self):
+        paradas = self.grade.paradas
+        origem = self.origens[0]
+        idx, dist = obter_indice(paradas).no_raio(paradas.lat[origem], paradas.lon[origem], CAMINHADA_M)
+        caminhada = np.full(len(paradas), np.inf)
+        caminhada[idx] = dist / 1000 / VELOCIDADE_KMH * 60
+        partidas = np.arange(HORA, HORA + 30, 5)
+
+        for max_transf in (None, 1):
+            with self.subTest(max_transferencias=max_transf):
+                p = perfil(self.padroes, caminhada, partidas, TEMPO, 5, self.transf.vizinhos, max_transf)
+                for i, d in enumerate(partidas.tolist()):
+                    eat = d + caminhada
+                    rotear(self.padroes, eat, d + TEMPO, d + TEMPO + 5, self.transf.vizinhos, max_transf)
+                    t = eat - d
+                    esperado = np.where(t <= TEMPO, t, np.inf).astype(np.float32)
+                    self.assertTrue(np.array_equal(np.isfinite(p.viagem_min[i]), np.isfinite(esperado)))
+                    finitos = np.isfinite(esperado)
+                    np.testing.assert_allclose(p.viagem_min[i][finitos], esperado[finitos], atol=TOLERANCIA_MIN)
+
+
+class ArquivoGradeTests(SimpleTestCase):
+    def test_escrever_e_carregar(self):
+        grade = sintetico.grade(_feed(paradas=800))
+        padroes = montar_padroes(grade)
+        transf = construir_transferencias(grade.paradas, CAMINHADA_M, VELOCIDADE_KMH)
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as d:
+            caminho = Path(d) / "grade.rghf"
+            arquivo_grade.escrever(caminho, grade, padroes, transf)
+            lida = arquivo_grade.carregar(caminho)
+
+            g = lida.grade
+            self.assertEqual(g.chave, grade.chave)
+            self.assertEqual(list(g.paradas.ids), grade.paradas.ids)
+            self.assertEqual(list(g.trip_ids), grade.trip_ids)
+            self.assertEqual(list(g.route_ids), grade.route_ids)
+            for nome in ("dep_stop", "arr_stop", "dep_min", "arr_min", "trip"):
+                np.testing.assert_array_equal(getattr(g, nome), getattr(grade, nome), err_msg=nome)
+            for nome in ("ini", "paradas", "dep_off", "arr_off", "padrao", "inicio", "fim", "headway"):
+                np.testing.assert_array_equal(getattr(g.frequencias, nome), getattr(grade.frequencias, nome), err_msg=nome)
+            self.assertEqual(list(g.frequencias.route_ids), grade.frequencias.route_ids)
+
+            self.assertEqual(len(lida.padroes.lista), len(padroes.lista))
+            for a, b in zip(lida.padroes.lista, padroes.lista):
+                self.assertEqual(a.route_id, b.route_id)
+                np.testing.assert_array_equal(a.paradas, b.paradas)
+                np.testing.assert_array_equal(a.dep, b.dep)
+            np.testing.assert_array_equal(lida.transferencias.destino, transf.destino)
+            np.testing.assert_array_equal(lida.transferencias.minutos, transf.minutos)
+
+            # mesmo resultado da busca a partir do arquivo
+            origem = int(grade.dep_stop[0])
+            a = np.full(len(grade.paradas), np.inf)
+            a[origem] = HORA
+            b = a.copy()
+            varrer_conexoes(grade, a, HORA, HORA + TEMPO, HORA + TEMPO, transf.vizinhos)
+            varrer_conexoes(g, b, HORA, HORA + TEMPO, HORA + TEMPO, lida.transferencias.vizinhos)
+            np.testing.assert_array_equal(a, b)
+
+    def test_formato_antigo_volta_para_o_banco(self):
+        grade = sintetico.grade(_feed(paradas=300))
+        padroes = montar_padroes(grade)
+        transf = construir_transferencias(grade.paradas, CAMINHADA_M, VELOCIDADE_KMH)
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as d, override_settings(RAIO_CACHE_DIR=Path(d)):
+            caminho = arquivo_grade.arquivo_para(grade.chave)
+            self.assertIn(f"_v{arquivo_grade.VERSAO_FORMATO}_", caminho.name)
+            arquivo_grade.escrever(caminho, grade, padroes, transf)
+            self.assertIsNotNone(arquivo_grade.carregar_se_existir(grade.chave))
+
+            # mesmo nome, cabeçalho de uma versão anterior do formato
+            with open(caminho, "r+b") as f:
+                f.seek(4)
+                f.write(struct.pack("<I", arquivo_grade.VERSAO_FORMATO - 1))
+            with self.assertLogs("transporte.algorithms.arquivo_grade", "WARNING"):
+                self.assertIsNone(arquivo_grade.carregar_se_existir(grade.chave))
+
+
+class FaixasTests(SimpleTestCase):
+    def test_faixas_aninhadas(self):
+        rng = np.random.default_rng(2)
+        n = 300
+        lat = -23.55 + rng.uniform(-0.05, 0.05, n)
+        lon = -46.63 + rng.uniform(-0.05, 0.05, n)
+        tempos = rng.uniform(0, 60, n)
+        limiares = [15, 30, 45, 60]
+
+        faixas = areas_por_faixa(lon, lat, tempos, limiares, VELOCIDADE_KMH, tolerancia_m=0)
+        self.assertEqual([f for f, _ in faixas], limiares)
+        for (_, menor), (_, maior) in zip(faixas, faixas[1:]):
+            self.assertGreater(maior.area, menor.area)
+            self.assertLess(menor.difference(maior).area, menor.area * 1e-6)
+
+
+class HorariosTests(SimpleTestCase):
+    def test_segundos_vetor_igual_a_segundos(self):
+        rng = np.random.default_rng(3)
+        validos = [formatar(int(s)) for s in rng.integers(0, 30 * 3600, 500)]
+        validos += ["0:00:00", "7:05:00", " 07:05:00 ", "100:00:00", "999:59:59"]
+        invalidos = [
+            "", "   ", "7:5:00", "07:60:00", "07:00:60", "ab:cd:ef", "7:05",
+            "07:05:00:00", "1000:00:00", "-1:00:00", "07 :05:00", "7:05:0a",
+        ]
+        valores = validos + invalidos
+        esperado = [SEM_HORARIO if segundos(v) is None else segundos(v) for v in valores]
+        self.assertEqual(segundos_vetor(valores).tolist(), esperado)
+        self.assertTrue(all(segundos(v) is None for v in invalidos))
+
+
+class ConsultaTests(SimpleTestCase):
+    def _post(self, **corpo):
+        corpo = {"lat": -23.55, "lon": -46.63, "tempo": 30, **corpo}
+        requisicao = RequestFactory().post("/api/raio/", json.dumps(corpo), content_type="application/json")
+        return raio_de_alcance_view(requisicao)
+
+    def test_hora_fora_do_intervalo_e_400(self):
+        for hora in ("48:00", "-1:00", "18:60", "18:-5", "18"):
+            with self.subTest(hora=hora):
+                self.assertEqual(self._post(hora=hora).status_code, 400)
+        self.assertEqual(self._post(hora="08:00", hora_fim="48:00").status_code, 400)
+
+    def test_data_padrao_e_quinta(self):
+        self.assertEqual(_data({}).weekday(), 3)
+
+
+@override_settings(RAIO_POOL_TRABALHADORES=2, RAIO_POOL_FILA=2, RAIO_POOL_LOTE=1)
+class PoolTests(SimpleTestCase):
+    def test_lote_nao_ocupa_vagas_interativas(self):
+        liberar = threading.Event()
+        with ThreadPoolExecutor(4) as executor, mock.patch.object(pool_raio, "_obter_pool", return_value=executor):
+            lote = pool_raio.submeter(liberar.wait, lote=True)
+            with self.assertRaises(pool_raio.Sobrecarga):
+                pool_raio.submeter(liberar.wait, lote=True)
+            interativas = [pool_raio.submeter(liberar.wait) for _ in range(3)]
+            with self.assertRaises(pool_raio.Sobrecarga):
+                pool_raio.submeter(liberar.wait)
+            liberar.set()
+            for futuro in [lote, *interativas]:
+                futuro.result()
+        self.assertEqual((pool_raio._em_voo, pool_raio._em_voo_lote), (0, 0))
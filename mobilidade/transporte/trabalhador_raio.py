@@ -0,0 +1,49 @@
+import logging
+import os
+
+"""
+trabalhador_raio.py — Código que roda dentro dos processos do pool
+--------------------------------------------------------------------------
+Os processos do ``pool_raio`` são criados por ``spawn`` (nada herdado do
+servidor ASGI, que tem threads e um event loop). Este módulo é importado
+antes do Django estar configurado, por isso não importa modelos no topo:
+``iniciar`` configura o Django e pré‑carrega a grade do dia, as
+transferências e a malha de caminhada; depois cada tarefa só calcula.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def iniciar(settings_module: str):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    import django
+
+    django.setup()
+
+    from datetime import datetime
+
+    import pytz
+
+    from transporte.algorithms.calcular_raio_csa import CAMINHADA_MAX_METROS, VELOCIDADE_CAMINHADA_KMH
+    from transporte.algorithms.calendario import servicos_ativos
+    from transporte.algorithms.grade_horaria import obter_grade
+    from transporte.algorithms.malha_viaria import obter_malha
+    from transporte.algorithms.transferencias import obter_transferencias
+
+    try:
+        hoje = datetime.now(pytz.timezone("America/Sao_Paulo")).date()
+        grade = obter_grade(servicos_ativos(hoje))
+        obter_malha()
+        obter_transferencias(grade.paradas, CAMINHADA_MAX_METROS, VELOCIDADE_CAMINHADA_KMH)
+    except Exception:
+        # Sem pré‑carga o processo ainda atende; a primeira consulta carrega
+        logger.warning("trabalhador %s: pré‑carga falhou", os.getpid(), exc_info=True)
+
+
+def calcular(tipo: str, lat: float, lon: float, args: tuple, opcoes: dict) -> bytes:
+    """``calcular_raio``/``calcular_perfil`` já serializado (JSON ou RGRD)."""
+    from transporte.algorithms.calcular_raio_csa import calcular_perfil, calcular_raio
+    from transporte.cache_raio import serializar
+
+    funcao = calcular_perfil if tipo == "perfil" else calcular_raio
+    return serializar(funcao(lat, lon, *args, **opcoes))
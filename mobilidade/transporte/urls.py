@@ -2,9 +2,11 @@
 
 from django.urls import path
 from django.views.generic import TemplateView
-from .views import raio_de_alcance_view
+from .views import raio_async_view, raio_de_alcance_view, raio_lote_view
 
 urlpatterns = [
     path('api/raio/', raio_de_alcance_view, name='raio-alcance'),
+    path('api/raio/async/', raio_async_view, name='raio-async'),
+    path('api/raio/lote/', raio_lote_view, name='raio-lote'),
     path('', TemplateView.as_view(template_name='index.html')),
 ]
@@ -1,8 +1,15 @@
+import os
 import osmnx as ox
 import networkx as nx
 
+# Só lê settings (sem django.setup()); grafo_osm não importa os modelos
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mobilidade.settings")
+
+from transporte.algorithms.grafo_osm import caminho_graphml
+
 def baixar_grafo_sp():
+    destino = caminho_graphml()
     print("Baixando grafo de ruas caminháveis de São Paulo...")
     G = ox.graph_from_place("São Paulo, São Paulo, Brasil", network_type='walk')
-    ox.save_graphml(G, filepath='grafo_sp_caminhada.graphml')
-    print("Grafo salvo como 'grafo_sp_caminhada.graphml'")
+    ox.save_graphml(G, filepath=destino)
+    print(f"Grafo salvo em '{destino}' (RAIO_GRAFO_CAMINHADA)")
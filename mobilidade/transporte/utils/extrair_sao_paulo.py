@@ -1,5 +1,11 @@
+import os
 import osmnx as ox
 
+# Só lê settings (sem django.setup()); grafo_osm não importa os modelos
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mobilidade.settings")
+
+from transporte.algorithms.grafo_osm import caminho_graphml
+
 def extrair_cidade_sp(osm_path):
     print("Obtendo limite geográfico da cidade de São Paulo...")
     sp_boundary = ox.geocode_to_gdf("São Paulo, São Paulo, Brasil")
@@ -17,5 +23,5 @@ def extrair_cidade_sp(osm_path):
     print("Recortando grafo para a cidade de SP...")
     G_sp = ox.truncate.truncate_graph_polygon(G_walk, sp_boundary.geometry[0], retain_all=True)
 
-    ox.save_graphml(G_sp, filepath="grafo_sp_caminhada.graphml")
+    ox.save_graphml(G_sp, filepath=caminho_graphml())
     print("Grafo de caminhada da cidade de São Paulo salvo com sucesso.")
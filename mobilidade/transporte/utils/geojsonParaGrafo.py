@@ -1,6 +1,12 @@
+import os
 import osmnx as ox
 import geopandas as gpd
 
+# Só lê settings (sem django.setup()); grafo_osm não importa os modelos
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mobilidade.settings")
+
+from transporte.algorithms.grafo_osm import caminho_graphml
+
 def grafo_de_geojson(caminho_geojson):
     print("Lendo GeoJSON...")
     gdf = gpd.read_file(caminho_geojson)
@@ -8,5 +14,5 @@ def grafo_de_geojson(caminho_geojson):
     print("Convertendo para grafo...")
     G = ox.graph_from_gdfs(edges=gdf)  # Removido nodes=None
 
-    ox.save_graphml(G, "grafo_sp_caminhada.graphml")
-    print("Grafo salvo como grafo_sp_caminhada.graphml")
+    ox.save_graphml(G, caminho_graphml())
+    print(f"Grafo salvo em {caminho_graphml()}")
@@ -5,45 +5,175 @@ from django.shortcuts import render
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .algorithms.calcular_raio_csa import calcular_raio
+from .cache_raio import calcular_perfil_cacheado, calcular_raio_cacheado
+from .lote_raio import calcular_lote_no_pool, origens_de_lista
+from .pool_raio import Sobrecarga, calcular_perfil_async, calcular_raio_async
 
 
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+import itertools
 import json
-from datetime import datetime, timedelta, time
+from datetime import date, datetime, timedelta
 import pytz
 
+
+# Limites de entrada: valores fora daqui custariam memória/CPU sem sentido
+TEMPO_MAX_MIN = 180
+MAX_LIMIARES = 12
+RESOLUCAO_M = (10, 1000)
+PASSO_MAX_MIN = 60
+JANELA_MAX_MIN = 240
+HORA_MAX = 48                      # horas GTFS passam de 24h em viagens da madrugada
+
+
+def _no_intervalo(nome, valor, minimo, maximo):
+    if not minimo <= valor <= maximo:
+        raise ValueError(f'{nome} deve estar entre {minimo} e {maximo}')
+    return valor
+
+
+def _hora_para_min(valor):
+    """"HH:MM" → minutos desde 0h00 (até 47:59, como os horários GTFS)."""
+    h, m = str(valor).split(':')[:2]
+    h = _no_intervalo('hora', int(h), 0, HORA_MAX - 1)
+    return h * 60 + _no_intervalo('minutos', int(m), 0, 59)
+
+
+def _tempos(dados):
+    """(tempo, limiares) validados; sem ``tempo``, vale o maior limiar."""
+    limiares = [int(t) for t in dados.get('limiares') or []]
+    if len(limiares) > MAX_LIMIARES:
+        raise ValueError(f'no máximo {MAX_LIMIARES} limiares')
+    for t in limiares:
+        _no_intervalo('limiares', t, 1, TEMPO_MAX_MIN)
+    tempo = int(dados['tempo']) if 'tempo' in dados or not limiares else max(limiares)
+    return _no_intervalo('tempo', tempo, 1, TEMPO_MAX_MIN), limiares
+
+
+def _data(dados):
+    """Data da viagem ("AAAA-MM-DD"); sem data, a próxima (ou a própria) quinta-feira em São Paulo."""
+    if dados.get('data'):
+        return date.fromisoformat(dados['data'])
+    hoje = datetime.now(pytz.timezone("America/Sao_Paulo")).date()
+    # weekday(): segunda=0 … domingo=6  ⇒  quinta=3
+    return hoje + timedelta(days=(3 - hoje.weekday()) % 7)
+
+
+def _consulta(dados):
+    """Corpo JSON de /api/raio/ → (tipo, lat, lon, args, opcoes, content_type).
+
+    ``tipo`` é "perfil" quando há ``hora_fim`` (janela de partidas numa só
+    varredura) e "raio" caso contrário; ``args``/``opcoes`` seguem a
+    assinatura de ``calcular_perfil``/``calcular_raio`` depois de lat/lon.
+    """
+    lat = float(dados['lat'])
+    lon = float(dados['lon'])
+    tempo, limiares = _tempos(dados)
+    max_transf = dados.get('max_transferencias')
+    max_transf = int(max_transf) if max_transf is not None else None
+    simplificacao = dados.get('simplificacao_m')
+    simplificacao = float(simplificacao) if simplificacao is not None else None
+
+    # Os serviços ativos na data saem de calendar + calendar_dates
+    dia = _data(dados)
+    hora_inicio = _hora_para_min(dados.get('hora', '18:00'))
+
+    if dados.get('hora_fim'):
+        hora_fim = _hora_para_min(dados['hora_fim'])
+        _no_intervalo('hora_fim - hora', hora_fim - hora_inicio, 0, JANELA_MAX_MIN)
+        passo = _no_intervalo('passo_min', int(dados.get('passo_min', 1)), 1, PASSO_MAX_MIN)
+        return (
+            'perfil', lat, lon, (tempo, dia, hora_inicio, hora_fim),
+            dict(passo_min=passo, max_transferencias=max_transf),
+            'application/json',
+        )
+
+    saida = dados.get('saida', 'geojson')
+    resolucao = _no_intervalo('resolucao_m', float(dados.get('resolucao_m', 100)), *RESOLUCAO_M)
+    opcoes = dict(
+        motor=dados.get('motor', 'csa'), max_transferencias=max_transf, limiares=limiares,
+        simplificacao_m=simplificacao,
+        saida=saida, resolucao_m=resolucao,
+    )
+    tipo_conteudo = 'application/octet-stream' if saida == 'grade' else 'application/json'
+    return 'raio', lat, lon, (tempo, dia, hora_inicio), opcoes, tipo_conteudo
+
+
 @csrf_exempt
 def raio_de_alcance_view(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'Método não permitido'}, status=405)
 
     try:
-        dados = json.loads(request.body)
-        lat = float(dados['lat'])
-        lon = float(dados['lon'])
-        tempo = int(dados['tempo'])
+        tipo, lat, lon, args, opcoes, tipo_conteudo = _consulta(json.loads(request.body))
+        # Resultado já serializado, compartilhado por origens na mesma célula
+        calcular = calcular_perfil_cacheado if tipo == 'perfil' else calcular_raio_cacheado
+        conteudo = calcular(lat, lon, *args, **opcoes)
+        return HttpResponse(conteudo, content_type=tipo_conteudo)
 
-        tz = pytz.timezone("America/Sao_Paulo")
+    except (KeyError, ValueError) as e:
+        return JsonResponse({'error': f'Entrada inválida: {e}'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Erro interno: {e}'}, status=500)
 
-        # 1. Descobre a próxima (ou a própria) quinta-feira
-        hoje = datetime.now(tz).date()
-        # weekday(): segunda=0 … domingo=6  ⇒  quinta=3
-        dias_ate_quinta = (3 - hoje.weekday()) % 7
-        data_quinta = hoje + timedelta(days=dias_ate_quinta)
 
-        # 2. Constrói o instante exato da quinta-feira às 18h00
-        agora = tz.localize(datetime.combine(data_quinta, time(18, 0)))
+@csrf_exempt
+async def raio_async_view(request):
+    """Mesmo corpo e resposta de /api/raio/, calculado no pool de processos.
 
-        # 3. Dia da semana e hora de início em minutos
-        dia_semana = agora.strftime("%A").lower()  # sempre 'thursday'
-        hora_inicio = 18 * 60  # 1080
+    O event loop não faz roteamento: com o pool e a fila cheios a resposta
+    é 503 imediato (com ``Retry-After``) em vez de a requisição esperar.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método não permitido'}, status=405)
 
-        geojson = calcular_raio(lat, lon, tempo, dia_semana, hora_inicio)
-        return JsonResponse(geojson, safe=False)
+    try:
+        tipo, lat, lon, args, opcoes, tipo_conteudo = _consulta(json.loads(request.body))
+        calcular = calcular_perfil_async if tipo == 'perfil' else calcular_raio_async
+        conteudo = await calcular(lat, lon, *args, **opcoes)
+        return HttpResponse(conteudo, content_type=tipo_conteudo)
 
+    except Sobrecarga:
+        resposta = JsonResponse({'error': 'Servidor ocupado, tente novamente'}, status=503)
+        resposta['Retry-After'] = '1'
+        return resposta
     except (KeyError, ValueError) as e:
         return JsonResponse({'error': f'Entrada inválida: {e}'}, status=400)
     except Exception as e:
-        return JsonResponse({'error': f'Erro interno: {e}'}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': f'Erro interno: {e}'}, status=500)
+
+
+@csrf_exempt
+def raio_lote_view(request):
+    """Várias origens numa requisição; resposta NDJSON (uma linha por origem).
+
+    Corpo: ``{"origens": [{"id", "lat", "lon"}, …], "tempo", "data", "hora",
+    "motor", "max_transferencias", "limiares"}``. A primeira linha traz
+    ``{"total": n}``; as demais chegam conforme ficam prontas.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método não permitido'}, status=405)
+
+    try:
+        dados = json.loads(request.body)
+        origens = origens_de_lista(dados['origens'])
+        limite = getattr(settings, 'RAIO_LOTE_MAX_ORIGENS', 5000)
+        if len(origens) > limite:
+            raise ValueError(f'no máximo {limite} origens por requisição')
+        tempo, limiares = _tempos(dados)
+        max_transf = dados.get('max_transferencias')
+        linhas = calcular_lote_no_pool(
+            origens, tempo, _data(dados), _hora_para_min(dados.get('hora', '18:00')),
+            motor=dados.get('motor', 'csa'),
+            max_transferencias=int(max_transf) if max_transf is not None else None,
+            limiares=limiares,
+        )
+    except (KeyError, ValueError) as e:
+        return JsonResponse({'error': f'Entrada inválida: {e}'}, status=400)
+
+    cabecalho = (json.dumps({'total': len(origens)}) + '\n').encode()
+    return StreamingHttpResponse(
+        itertools.chain([cabecalho], linhas), content_type='application/x-ndjson',
+    )